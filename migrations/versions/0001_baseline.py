@@ -0,0 +1,88 @@
+"""baseline: schema as created by init_db's create_all
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-19 12:00:00.000000
+
+Databases created before migrations existed already have these tables:
+mark them with `alembic stamp 0001_baseline` instead of running this revision.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_baseline'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'users',
+        sa.Column('uuid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('username', postgresql.VARCHAR(length=50), nullable=False),
+        sa.Column('email', postgresql.VARCHAR(length=255), nullable=False),
+        sa.Column('first_name', postgresql.VARCHAR(length=100), nullable=False),
+        sa.Column('last_name', postgresql.VARCHAR(length=100), nullable=False),
+        sa.Column('hashed_password', postgresql.TEXT(), nullable=False),
+        sa.Column('is_verified', sa.Boolean(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('is_superuser', sa.Boolean(), nullable=False),
+        sa.Column('last_login', sa.DateTime(), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('uuid'),
+        sa.UniqueConstraint('email', 'username', name='uq_username_email')
+    )
+    op.create_index('ix_users_uuid', 'users', ['uuid'], unique=False)
+    op.create_index('ix_users_username', 'users', ['username'], unique=False)
+    op.create_index('ix_users_email', 'users', ['email'], unique=False)
+
+    op.create_table(
+        'dish_analyses',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('normalized_name', postgresql.VARCHAR(length=255), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('model_name', postgresql.VARCHAR(length=100), nullable=False),
+        sa.Column('prompt_version', postgresql.VARCHAR(length=50), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dish_analyses_normalized_name', 'dish_analyses', ['normalized_name'], unique=True)
+
+    op.create_table(
+        'estimation_history',
+        sa.Column('id', postgresql.BIGINT(), autoincrement=True, nullable=False),
+        sa.Column('user_uuid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('analysis_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('dish_name', postgresql.VARCHAR(length=255), nullable=False),
+        sa.Column('source', postgresql.VARCHAR(length=20), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['analysis_id'], ['dish_analyses.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_uuid'], ['users.uuid'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    # keyset listing of a user's history, index-only thanks to the INCLUDE columns
+    op.create_index(
+        'ix_estimation_history_user_keyset', 'estimation_history', ['user_uuid', 'created_at', 'id'],
+        unique=False, postgresql_include=['analysis_id', 'dish_name', 'source']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_estimation_history_user_keyset', table_name='estimation_history')
+    op.drop_table('estimation_history')
+    op.drop_index('ix_dish_analyses_normalized_name', table_name='dish_analyses')
+    op.drop_table('dish_analyses')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_users_username', table_name='users')
+    op.drop_index('ix_users_uuid', table_name='users')
+    op.drop_table('users')
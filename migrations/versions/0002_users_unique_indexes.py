@@ -0,0 +1,45 @@
+"""users: separate unique email / username, case-insensitive email index
+
+Revision ID: 0002_users_unique_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-19 12:30:00.000000
+
+The composite (email, username) constraint let two accounts share an email. It is replaced by
+one unique constraint per column, whose indexes also serve the exact lookups, so the plain
+ix_users_* indexes (and the one duplicating the primary key) are dropped. ix_users_email_lower
+serves the lower(email) lookups and keeps one account per address in any letter case.
+The upgrade fails if existing rows violate the new constraints; resolve duplicates first.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_users_unique_indexes'
+down_revision: Union[str, Sequence[str], None] = '0001_baseline'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_unique_constraint('uq_users_email', 'users', ['email'])
+    op.create_unique_constraint('uq_users_username', 'users', ['username'])
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
+    op.drop_constraint('uq_username_email', 'users', type_='unique')
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_users_username', table_name='users')
+    op.drop_index('ix_users_uuid', table_name='users')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_users_uuid', 'users', ['uuid'], unique=False)
+    op.create_index('ix_users_username', 'users', ['username'], unique=False)
+    op.create_index('ix_users_email', 'users', ['email'], unique=False)
+    op.create_unique_constraint('uq_username_email', 'users', ['email', 'username'])
+    op.drop_index('ix_users_email_lower', table_name='users')
+    op.drop_constraint('uq_users_username', 'users', type_='unique')
+    op.drop_constraint('uq_users_email', 'users', type_='unique')
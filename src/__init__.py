@@ -1,12 +1,47 @@
 from fastapi import FastAPI,APIRouter,status
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from src.auth.routes import auth_router
 from src.estimator.routes import estimator_router
 from contextlib import asynccontextmanager
-from src.db.pg_sql_client import init_db
+from src.db.pg_sql_client import init_db,dispose_engines
 from src.utils.errors import register_error_handlers
+from src.estimator.analysis_service import drain_pending_writes
+from src.estimator.bulk_import import resume_imports,stop_imports
+from src.auth.revocation import revocation_list
+from src.auth.user_cache import user_cache
+from src.auth.auth_service import start_last_login_flusher,stop_last_login_flusher
+from src.utils.compression import CompressionMiddleware
+from src.estimator.usage import UsageMiddleware
+from src.utils.metrics import MetricsMiddleware,metrics_response
+from src.utils.rate_limit import RateLimitMiddleware
+from src.utils.tracing import TracingMiddleware,setup_tracing,shutdown_tracing
+from src.constants.config import Config
+from src.logging.logger import global_logger
 
 version="v1"
+setup_tracing()
+
+@asynccontextmanager
+async def lifespan(app:FastAPI):
+    await init_db()
+    # local JWT blocklist, kept in sync over redis pub/sub
+    revocation_list.start()
+    user_cache.start()
+    start_last_login_flusher()
+    # picks up menu imports interrupted by a restart
+    resume_imports()
+    yield
+    await stop_imports()
+    await revocation_list.stop()
+    await user_cache.stop()
+    # buffered logins are written before the worker exits
+    await stop_last_login_flusher()
+    # flush write-behind analyses before the worker exits
+    await drain_pending_writes()
+    await dispose_engines()
+    shutdown_tracing()
+    # last: flushes everything logged during shutdown
+    global_logger.close()
     
 app=FastAPI(
     title="Reewild-Carbon Food Print Estimator",
@@ -15,16 +50,46 @@ app=FastAPI(
     docs_url=f"/api/{version}/docs",
     contact={
         "email":"vipulc2580@gmail.com"
-    }
+    },
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 main_router=APIRouter()
 
 register_error_handlers(app)  # registering all custom error / exception handlers 
 
+# per IP / user sliding window limits, sets the LLM quota subject of the request
+app.add_middleware(
+    RateLimitMiddleware,
+    window_sec=Config.RATE_LIMIT_WINDOW_SEC,
+    per_ip=Config.RATE_LIMIT_PER_IP,
+    per_user=Config.RATE_LIMIT_PER_USER,
+    endpoint_limits=Config.RATE_LIMIT_ENDPOINTS,
+    path_prefix=Config.RATE_LIMIT_PATH_PREFIX,
+    enabled=Config.RATE_LIMIT_ENABLED
+)
+
+# request latency histograms by route template
+app.add_middleware(MetricsMiddleware)
+
+# per request token / cost accounting of the LLM stages
+app.add_middleware(UsageMiddleware,debug_header=Config.LLM_USAGE_DEBUG_HEADER)
+
+# gzip / brotli content negotiation for every response above the size threshold
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=Config.COMPRESSION_MINIMUM_SIZE,
+    gzip_level=Config.GZIP_COMPRESS_LEVEL,
+    brotli_quality=Config.BROTLI_QUALITY
+)
+
+# outermost, so every other layer runs inside the request span
+app.add_middleware(TracingMiddleware)
+
 @main_router.get('/')
 async def home():
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_200_OK,
         content={
             "message":"Welcome to Reewild-Carbon Food Print Estimation Service"
@@ -33,12 +98,16 @@ async def home():
 
 @main_router.get('/health')
 async def health_check():
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_200_OK,
         content={
             "message":"Health is OK"
         }
     )
+
+@main_router.get('/metrics',include_in_schema=False)
+async def metrics():
+    return metrics_response()
     
 app.include_router(main_router,prefix="",tags=["home"])
 app.include_router(auth_router,prefix=f"/api/{version}/auth",tags=["auth"])
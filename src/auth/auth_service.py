@@ -1,43 +1,30 @@
+import asyncio
 from .models import User 
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlmodel import select, delete
-from sqlalchemy import or_
+from sqlmodel import select, delete, update
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
 from .schemas import UserCreateModel 
-from .utils import hash_password
-from typing import Optional 
+from .utils import hash_password_async
+from .user_cache import user_cache
+from typing import Dict,Optional,Tuple 
+from datetime import datetime
+from src.constants.config import Config
+from src.db.pg_sql_client import background_session
 from src.logging.logger import global_logger
 from uuid import UUID 
 
+# (email, last_login) per user, buffered by login_user and written in bulk every LAST_LOGIN_FLUSH_INTERVAL_SEC
+_pending_last_logins:Dict[UUID,Tuple[str,datetime]]={}
+_last_login_flusher:Optional[asyncio.Task]=None
+
 class AuthService:
     
-    async def user_exists(self,email:str,username:str,session:AsyncSession)->bool:
-        try:
-            statement=select(User).where(
-                or_(
-                    User.email==email,
-                    User.username==username
-                )
-            )
-            result=await session.exec(statement)
-            
-            user=result.first()
-            return True if user else False 
-        except Exception as e:
-            await global_logger.log_event(
-                data={
-                    "message":"error_fetching_user_existance",
-                    "error":str(e),
-                    "email":email,
-                    "username":username
-                },
-                level="error"
-            )
-            raise 
-        
     async def get_user_by_email(self,email:str,session:AsyncSession)->Optional[User]:
         try:
+            # case-insensitive, served by ix_users_email_lower
             statement=select(User).where(
-                User.email==email
+                func.lower(User.email)==email.lower()
             )
             result=await session.exec(statement)
             user=result.first()
@@ -54,19 +41,20 @@ class AuthService:
             )
             raise 
     
-    async def create_user(self,user_data:UserCreateModel,session:AsyncSession):
+    async def create_user(self,user_data:UserCreateModel,session:AsyncSession)->Optional[User]:
+        """ Inserts the user in one statement, None when the email or username is taken"""
         try:
             user_data_dict=user_data.model_dump()
             # we need pop confirm password out it 
             user_data_dict.pop('confirm_password')
-            hashed_password=hash_password(user_data_dict.pop('password'))
+            hashed_password=await hash_password_async(user_data_dict.pop('password'))
             
             user_data_dict['hashed_password']=hashed_password
             
-            user=User(**user_data_dict)
-            session.add(user)
+            statement=insert(User).values(**user_data_dict).on_conflict_do_nothing().returning(User)
+            result=await session.execute(statement)
+            user=result.scalar_one_or_none()
             await session.commit()
-            await session.refresh(user)
             return user 
         except Exception as e:
             await session.rollback()
@@ -81,20 +69,21 @@ class AuthService:
             
     
     async def update_user(self,user_data:dict,session:AsyncSession)->User|None:
+        """ UPDATE ... RETURNING of the truthy fields in user_data, matched on its email"""
         try:
             email=user_data.get("email")
-            user=await self.get_user_by_email(email=email,session=session)
+            changes={key:value for key,value in user_data.items() if value and key!="email" and hasattr(User,key)}
+            if not changes:
+                return await self.get_user_by_email(email=email,session=session)
+            
+            statement=update(User).where(func.lower(User.email)==email.lower()).values(**changes).returning(User)
+            result=await session.execute(statement)
+            user=result.scalar_one_or_none()
+            await session.commit()
             
             if not user:
                 return None 
-            
-            for key,value in user_data.items():
-                if value and hasattr(user,key):
-                    setattr(user,key,value)
-            
-            session.add(user)
-            await session.commit()
-            await session.refresh(user)
+            await user_cache.invalidate(user.email)
             return user 
         except Exception as e:
             await global_logger.log_event(
@@ -110,18 +99,19 @@ class AuthService:
             
     async def delete_user(self, email: str, session: AsyncSession) -> User | None:
         try:
-            statement = select(User).where(User.email == email)
-            result = await session.exec(statement)
-            user = result.one_or_none()
+            statement = delete(User).where(func.lower(User.email) == email.lower()).returning(User)
+            result = await session.execute(statement)
+            user = result.scalar_one_or_none()
+            await session.commit()
 
             if not user:
                 return None
             
-            await session.delete(user)
-            await session.commit()
+            await user_cache.invalidate(user.email)
             return user
 
         except Exception as e:
+            await session.rollback()
             await global_logger.log_event(
                 data={
                     "message": "error_occurred_deleting_user",
@@ -130,4 +120,63 @@ class AuthService:
                 },
                 level="error"
             )
-            raise
\ No newline at end of file
+            raise
+
+
+def record_last_login(user_uuid:UUID,email:str,logged_in_at:datetime)->None:
+    """ Buffers a login, written by the next flush_last_logins"""
+    _pending_last_logins[user_uuid]=(email,logged_in_at)
+
+async def flush_last_logins()->int:
+    """
+        Writes the buffered last_login values in one bulk UPDATE by primary key and drops those users
+        from user_cache, returns the row count
+    """
+    global _pending_last_logins
+    if not _pending_last_logins:
+        return 0
+    pending,_pending_last_logins=_pending_last_logins,{}
+    try:
+        async with background_session() as session:
+            await session.execute(
+                update(User),
+                [{"uuid":user_uuid,"last_login":logged_in_at} for user_uuid,(_,logged_in_at) in pending.items()]
+            )
+            await session.commit()
+    except Exception as e:
+        # retried with the next flush, unless the user logged in again meanwhile
+        for user_uuid,login in pending.items():
+            _pending_last_logins.setdefault(user_uuid,login)
+        await global_logger.log_event(
+            data={
+                "message":"error_flushing_last_logins",
+                "error":str(e),
+                "count":len(pending)
+            },
+            level="error"
+        )
+        return 0
+    # cached snapshots carry last_login
+    for email,_ in pending.values():
+        await user_cache.invalidate(email)
+    return len(pending)
+
+async def _flush_last_logins_periodically()->None:
+    while True:
+        await asyncio.sleep(Config.LAST_LOGIN_FLUSH_INTERVAL_SEC)
+        await flush_last_logins()
+
+def start_last_login_flusher()->None:
+    """ Starts the periodic last_login flush (called at startup)"""
+    global _last_login_flusher
+    if _last_login_flusher is None:
+        _last_login_flusher=asyncio.create_task(_flush_last_logins_periodically())
+
+async def stop_last_login_flusher()->None:
+    """ Stops the periodic flush and writes what is still buffered (called on shutdown)"""
+    global _last_login_flusher
+    if _last_login_flusher is not None:
+        _last_login_flusher.cancel()
+        await asyncio.gather(_last_login_flusher,return_exceptions=True)
+        _last_login_flusher=None
+    await flush_last_logins()
@@ -2,12 +2,13 @@ from fastapi.security import HTTPBearer
 from fastapi import Request,status,Depends
 from fastapi.exceptions import HTTPException
 from fastapi.security.http import HTTPAuthorizationCredentials
-from .utils import verify_token 
+from .utils import verify_token_cached 
 from .auth_service import AuthService
-from .schemas import UserModel 
+from .schemas import CurrentUserModel
+from .user_cache import user_cache
 from sqlmodel.ext.asyncio.session import AsyncSession 
-from src.db.pg_sql_client import get_session
-from src.db.redis_client import token_in_blocklist
+from src.db.pg_sql_client import get_read_session
+from .revocation import revocation_list
 from src.logging.logger import global_logger 
 from src.utils.errors import InvalidToken,AccountNotVerified,AccountIsInactive
 from typing import Any 
@@ -23,14 +24,17 @@ class TokenBearer(HTTPBearer):
     async def __call__(self,request:Request)->HTTPAuthorizationCredentials:
         try:
             creds=await super().__call__(request)
+            if creds is None:
+                # no Authorization header on an optional (auto_error=False) bearer
+                return None
             
             token=creds.credentials
             
-            if not self.token_valid(token=token):
+            token_data=verify_token_cached(token=token)
+            if not token_data:
                 raise InvalidToken()
             
-            token_data=verify_token(token=token)
-            if await token_in_blocklist(token_data.get('jti','')):
+            if await revocation_list.contains(token_data.get('jti','')):
                 raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                     detail={
                                         "error":"This token is invalid or been revoked",
@@ -47,11 +51,6 @@ class TokenBearer(HTTPBearer):
                 level="error"
             )
     
-    def token_valid(self,token:str)->bool:
-        token_data=verify_token(token)
-        return True if token_data else False 
-        
-    
     def verify_token_data(self,token_data:dict)->None:
         raise NotImplementedError('Please Override this method in Child class')
     
@@ -62,21 +61,40 @@ class AccessTokenBearer(TokenBearer):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="Please provide a valid access token")
         
 
+class OptionalAccessTokenBearer(AccessTokenBearer):
+    """ Access token bearer for routes open to anonymous users, resolves to None without a token"""
+    
+    def __init__(self):
+        super().__init__(auto_error=False)
+        
+
 class RefreshTokenBearer(TokenBearer):
     
     def verify_token_data(self,token_data:dict)->None:
         if token_data and not token_data.get('refresh'):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,detail="Please provide a valid refresh token")
 
-async def get_current_user(token_details:dict=Depends(AccessTokenBearer()),session:AsyncSession=Depends(get_session)):
+# shared instances: FastAPI caches a dependency per request by identity, so routes that also
+# depend on get_current_user run the bearer only once
+access_token_bearer=AccessTokenBearer()
+refresh_token_bearer=RefreshTokenBearer()
+
+async def get_current_user(token_details:dict=Depends(access_token_bearer),session:AsyncSession=Depends(get_read_session))->CurrentUserModel|None:
     user_email=token_details.get('user',{}).get('email')
     
-    user=await auth_service.get_user_by_email(email=user_email,session=session)
+    user=await user_cache.get(user_email)
+    if user is None:
+        # the session only takes a connection from the pool on this path
+        db_user=await auth_service.get_user_by_email(email=user_email,session=session)
+        if not db_user:
+            return None
+        user=CurrentUserModel.model_validate(db_user)
+        await user_cache.set(user)
     return user
 
 class UserChecker:
     
-    def __call__(self,current_user:UserModel=Depends(get_current_user))->Any:
+    def __call__(self,current_user:CurrentUserModel=Depends(get_current_user))->Any:
         if not current_user.is_verified:
             raise AccountNotVerified()
         
@@ -2,7 +2,7 @@ from sqlmodel import SQLModel,Field,Column,Relationship
 import sqlalchemy.dialects.postgresql as pg 
 from datetime import datetime,date 
 from uuid import UUID,uuid4 
-from sqlalchemy import UniqueConstraint,func
+from sqlalchemy import Index,UniqueConstraint,func,text
 
 
 """ 
@@ -24,16 +24,21 @@ Class User:
 class User(SQLModel, table=True):
     __tablename__ = "users"
     __table_args__ = (
-        UniqueConstraint("email", "username", name="uq_username_email"),
+        # signup relies on these instead of checking for an existing user first
+        # (their unique indexes also serve the exact lookups, no separate plain indexes)
+        UniqueConstraint("email", name="uq_users_email"),
+        UniqueConstraint("username", name="uq_users_username"),
+        # case-insensitive email: lookups compare lower(email), one account per address in any case
+        Index("ix_users_email_lower", text("lower(email)"), unique=True),
     )
     uuid: UUID = Field(
-        sa_column=Column(pg.UUID(as_uuid=True), primary_key=True, default=uuid4, index=True)
+        sa_column=Column(pg.UUID(as_uuid=True), primary_key=True, default=uuid4)
     )
     username: str = Field(
-        sa_column=Column(pg.VARCHAR(50), nullable=False, index=True)
+        sa_column=Column(pg.VARCHAR(50), nullable=False)
     )
     email: str = Field(
-        sa_column=Column(pg.VARCHAR(255), nullable=False, index=True)
+        sa_column=Column(pg.VARCHAR(255), nullable=False)
     )
     first_name: str = Field(
         sa_column=Column(pg.VARCHAR(100), nullable=False)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from typing import Dict,Optional
+from src.constants.config import Config
+from src.db.redis_client import (
+    JTI_REVOKED_CHANNEL,
+    RedisClient,
+    add_jti_to_blocklist,
+    blocklisted_jtis,
+    token_in_blocklist,
+)
+from src.logging.logger import global_logger
+
+"""
+Per worker copy of the JWT blocklist, so authenticated requests check revocation without a
+Redis round trip.
+
+The listener task subscribes to JTI_REVOKED_CHANNEL (published by add_jti_to_blocklist), then
+loads the blocklist and reloads it every REVOCATION_RESYNC_INTERVAL_SEC to catch messages lost
+while disconnected. Messages and reloads are handled by the same task, so a reload never drops
+a newer message. A worker whose copy is older than two intervals (listener down, no lifespan as
+in celery / scripts) falls back to asking Redis, so a revocation takes effect within one
+interval at worst.
+"""
+
+
+class RevocationList:
+
+    def __init__(self,resync_interval:float):
+        self.resync_interval=resync_interval
+        self._revoked:Dict[str,float]={}
+        self._synced_at:Optional[float]=None
+        self._task:Optional[asyncio.Task]=None
+
+    def add(self,jti:str,expires_at:float)->None:
+        self._revoked[jti]=expires_at
+
+    def is_fresh(self)->bool:
+        return self._synced_at is not None and time.monotonic()-self._synced_at<=2*self.resync_interval
+
+    async def contains(self,jti:str)->bool:
+        """ Whether the JWT id was revoked, from the local copy while it is fresh"""
+        if not self.is_fresh():
+            return await token_in_blocklist(jti)
+        expires_at=self._revoked.get(jti)
+        return expires_at is not None and expires_at>time.time()
+
+    async def revoke(self,jti:str)->None:
+        expires_at=await add_jti_to_blocklist(jti)
+        # effective on this worker right away, the others learn it from the channel
+        self.add(jti,expires_at)
+
+    async def _resync(self)->None:
+        self._revoked=await blocklisted_jtis()
+        self._synced_at=time.monotonic()
+
+    def _apply(self,data:bytes)->None:
+        jti,expires_at=data.decode("utf-8").split(" ",1)
+        self.add(jti,float(expires_at))
+
+    async def _run(self)->None:
+        while True:
+            pubsub=RedisClient.get_instance().pubsub(ignore_subscribe_messages=True)
+            try:
+                # subscribed before loading, so nothing revoked in between is missed
+                await pubsub.subscribe(JTI_REVOKED_CHANNEL)
+                await self._resync()
+                while True:
+                    wait=self._synced_at+self.resync_interval-time.monotonic()
+                    if wait<=0:
+                        await self._resync()
+                        continue
+                    message=await pubsub.get_message(ignore_subscribe_messages=True,timeout=wait)
+                    if message is not None:
+                        self._apply(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await global_logger.log_event(
+                    data={
+                        "message":"revocation_list_sync_error",
+                        "error":str(e)
+                    },
+                    level="error"
+                )
+                await asyncio.sleep(min(self.resync_interval,5))
+            finally:
+                await pubsub.aclose()
+
+    def start(self)->None:
+        """ Starts the listener task (called at startup)"""
+        if self._task is None:
+            self._task=asyncio.create_task(self._run())
+
+    async def stop(self)->None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task,return_exceptions=True)
+            self._task=None
+        self._synced_at=None
+
+
+revocation_list=RevocationList(resync_interval=Config.REVOCATION_RESYNC_INTERVAL_SEC)
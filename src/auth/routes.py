@@ -1,17 +1,17 @@
 from fastapi import Query,Path,Header,Request,status,APIRouter,Depends,Response
 from fastapi.exceptions import HTTPException
-from fastapi.responses import JSONResponse 
+from fastapi.responses import ORJSONResponse 
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.db.pg_sql_client import get_session
-from src.db.redis_client import add_jti_to_blocklist
-from .dependencies import AccessTokenBearer,RefreshTokenBearer,UserChecker
+from .revocation import revocation_list
+from .dependencies import access_token_bearer,refresh_token_bearer,UserChecker
 from .schemas import UserCreateModel,UserLoginModel,EmailMixin,PasswordUpdateModel
-from .auth_service import AuthService
+from .auth_service import AuthService,record_last_login
 from src.logging.logger import global_logger
 from datetime import datetime,timedelta
 from src.constants.config import Config 
 from src.utils.celery_tasks import send_email 
-from .utils import create_url_safe_token,render_template,decode_url_safe_token,verify_password,create_access_token,hash_password
+from .utils import create_url_safe_token,render_template,decode_url_safe_token,verify_password_async,create_access_token,hash_password_async
 from src.utils.errors import UserNotFound,InternalServerError,UserAlreadyExists,InvalidToken,CustomException,InvalidCredentials
 
 
@@ -25,11 +25,10 @@ async def signup(user_data:UserCreateModel,
                 session:AsyncSession=Depends(get_session)):
     try:
         email=user_data.email 
-        username=user_data.username 
-        user_exists=await auth_service.user_exists(email=email,username=username,session=session)
-        if user_exists:
-            raise UserAlreadyExists()
+        # the unique email / username constraints decide, no existence check beforehand
         user=await auth_service.create_user(user_data=user_data,session=session)
+        if not user:
+            raise UserAlreadyExists()
         token=create_url_safe_token(
             {"email":email}
         )
@@ -44,12 +43,12 @@ async def signup(user_data:UserCreateModel,
         await global_logger.log_event(
             data={
                 "message":"user_created_successfully",
-                "user_data":str(user.model_dump()), 
+                "user_data":user, 
                 "time_stamp":datetime.now()
             },
             level="info"
         )
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=status.HTTP_200_OK,
             content={
                 "message":"User account successfully created"
@@ -61,7 +60,7 @@ async def signup(user_data:UserCreateModel,
         await global_logger.log_event(
                 data={
                     "message":"error_occured_user_creation",
-                    "user_data":str(user_data.model_dump()), 
+                    "user_data":user_data, 
                     "time_stamp":datetime.now(),
                     "error":str(e)
                 },
@@ -93,7 +92,7 @@ async def verify_user(token:str=Path(),session=Depends(get_session)):
                     "timestamp":datetime.now()
                 }
             )   
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_200_OK,
                 content={
                     "message":"User updated successfully",
@@ -135,7 +134,7 @@ async def login_user(user_data:UserLoginModel,session:AsyncSession=Depends(get_s
         user=await auth_service.get_user_by_email(email=email,session=session)
         if not user:
             raise InvalidCredentials()
-        password_matched=verify_password(plain_password=password,hashed_password=user.hashed_password)
+        password_matched=await verify_password_async(plain_password=password,hashed_password=user.hashed_password)
         if not password_matched:
             raise InvalidCredentials()
         user_data_payload={
@@ -143,17 +142,12 @@ async def login_user(user_data:UserLoginModel,session:AsyncSession=Depends(get_s
             "email":user.email,
             "is_active":user.is_active
         }
-        user_updated=await auth_service.update_user(
-            user_data={
-                'email':user.email,
-                'last_login':datetime.utcnow()
-            },
-            session=session
-        )
+        # written in bulk by the periodic flush, login itself is a single query
+        record_last_login(user_uuid=user.uuid,email=user.email,logged_in_at=datetime.utcnow())
         access_token=create_access_token(user_data=user_data_payload)
         refresh_token=create_access_token(user_data=user_data_payload,expiry=timedelta(days=REFRESH_TOKEN_EXPIRY),refresh=True
                                         )
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "message":"Logged in successfully",
                 "access_token":access_token,
@@ -168,7 +162,7 @@ async def login_user(user_data:UserLoginModel,session:AsyncSession=Depends(get_s
             data={
                 "message":"error_occured_logging_user",
                 "error":str(e),
-                "user_data":str(user_data.model_dump())                
+                "user_data":user_data                
             },
             level="error"
         )
@@ -177,12 +171,12 @@ async def login_user(user_data:UserLoginModel,session:AsyncSession=Depends(get_s
 
 
 @auth_router.get('/refresh-token')
-async def get_new_access_token(token_details:dict=Depends(RefreshTokenBearer())):
+async def get_new_access_token(token_details:dict=Depends(refresh_token_bearer)):
     try:
         expiry_timestamp=token_details.get('exp')
         if datetime.fromtimestamp(expiry_timestamp) > datetime.now():
             new_access_token=create_access_token(user_data=token_details.get('user'))
-            return JSONResponse(
+            return ORJSONResponse(
                 content={
                     "access_token":new_access_token
                 }
@@ -205,12 +199,12 @@ async def get_new_access_token(token_details:dict=Depends(RefreshTokenBearer()))
 
 
 @auth_router.get('/logout')
-async def revoke_token(token_details:dict=Depends(AccessTokenBearer())):
+async def revoke_token(token_details:dict=Depends(access_token_bearer)):
     try:
         jti=token_details.get('jti','')
-        await add_jti_to_blocklist(jti=jti)
+        await revocation_list.revoke(jti=jti)
         
-        return JSONResponse(status_code=status.HTTP_200_OK,content={
+        return ORJSONResponse(status_code=status.HTTP_200_OK,content={
             "message":"Logged Out Successfully"
         })
     except Exception as e:
@@ -219,7 +213,7 @@ async def revoke_token(token_details:dict=Depends(AccessTokenBearer())):
                 "message":"error_occured_logout_user",
                 "error":str(e),
                 "time_stamp":datetime.utcnow(),
-                "token_detail":str(token_details)
+                "token_detail":token_details
             },
             level="error"
         )
@@ -249,11 +243,11 @@ async def password_reset_request(email_data:EmailMixin,session=Depends(get_sessi
         await global_logger.log_event(
             data={
                 "message":"password_reset_request_successfully",
-                "user":current_user.model_dump(),
+                "user":current_user,
                 "time_stamp":datetime.utcnow()
             }
         )
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "message": "Please check your email for instructions to reset your password",
             },
@@ -287,9 +281,9 @@ async def password_reset_confirm(password_update_data:PasswordUpdateModel,token:
         if not current_user:
             raise UserNotFound()
         
-        new_password_match=verify_password(plain_password=password_update_data.password,hashed_password=current_user.hashed_password)
+        new_password_match=await verify_password_async(plain_password=password_update_data.password,hashed_password=current_user.hashed_password)
         if new_password_match:
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 content={
                     "message":"New Password is same as old",
@@ -297,13 +291,13 @@ async def password_reset_confirm(password_update_data:PasswordUpdateModel,token:
                     "resolution":"Please provide new password different than previous password"
                 }
             )
-        new_password_hash=hash_password(password=password_update_data.password)
+        new_password_hash=await hash_password_async(password=password_update_data.password)
         await auth_service.update_user({
             "hashed_password":new_password_hash,
             "email":current_user.email
         },
         session=session)
-        return JSONResponse(
+        return ORJSONResponse(
             content={"message": "Password reset Successfully"},
             status_code=status.HTTP_200_OK,
         )
@@ -316,21 +310,17 @@ async def password_reset_confirm(password_update_data:PasswordUpdateModel,token:
                     "error":str(e),
                     "time_stamp":datetime.utcnow(),
                     "token_detail":token,
-                    "password_details":str(password_update_data.model_dump())
+                    "password_details":password_update_data
                 },
                 level="error"
             )
         raise InternalServerError()
         
 @auth_router.post('/delete-account',dependencies=[auth_checker])
-async def delete_account(token_details:dict=Depends(AccessTokenBearer()),session:AsyncSession=Depends(get_session)):
+async def delete_account(token_details:dict=Depends(access_token_bearer),session:AsyncSession=Depends(get_session)):
     try:
         user_data=token_details.get('user',{})
         email=user_data.get('email','')
-        current_user=await auth_service.get_user_by_email(email=email,session=session)
-        if not current_user:
-            raise UserNotFound()
-        
         user=await auth_service.delete_user(email=email,session=session)
         if user:
             await global_logger.log_event(
@@ -338,8 +328,8 @@ async def delete_account(token_details:dict=Depends(AccessTokenBearer()),session
                     "message":"user_account_deleted_successfully",
                     "email":email,
                     "timestamp":datetime.utcnow(),
-                    "token_details":str(token_details),
-                    "user_details":str(user.model_dump())
+                    "token_details":token_details,
+                    "user_details":user
                 },
                 level="info"
             )
@@ -354,7 +344,7 @@ async def delete_account(token_details:dict=Depends(AccessTokenBearer()),session
                 "message":"error_occured_deleting_user",
                 "error":str(e),
                 "time_stamp":datetime.utcnow(),
-                "token_detail":str(token_details)
+                "token_detail":token_details
             }
             ,level="error"
         )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel,Field,field_validator 
+from pydantic import BaseModel,ConfigDict,Field,field_validator 
 import re
 from datetime import datetime 
 import uuid 
@@ -55,5 +55,20 @@ class UserLoginModel(EmailMixin,PasswordMixin):
     pass 
 
 class PasswordUpdateModel(PasswordMixin,ConfirmPasswordMixin):
-    pass 
+    pass
 
+class CurrentUserModel(BaseModel):
+    """ Authenticated user as cached for get_current_user (no password hash)"""
+    model_config=ConfigDict(from_attributes=True)
+    
+    uuid:uuid.UUID
+    username:str
+    email:str
+    first_name:str
+    last_name:str
+    is_verified:bool
+    is_active:bool
+    is_superuser:bool
+    last_login:datetime|None=None
+    created_at:datetime
+    updated_at:datetime
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional,Tuple
+from src.constants.config import Config
+from src.db.redis_client import (
+    USER_INVALIDATED_CHANNEL,
+    RedisClient,
+    add_cached_user,
+    cached_user,
+    invalidate_cached_user,
+)
+from src.logging.logger import global_logger
+from src.utils.metrics import record_cache_lookup
+from .schemas import CurrentUserModel
+
+"""
+Cache of the users resolved by get_current_user, so protected requests skip the users query.
+
+Entries live USER_CACHE_TTL_SEC in each worker and, with USER_CACHE_REDIS, in Redis for the
+other workers. AuthService.update_user / delete_user and flush_last_logins call invalidate():
+the Redis entry is deleted and USER_INVALIDATED_CHANNEL makes every listening worker drop its
+copy. A worker that missed the message (listener down, no lifespan) serves the old record for
+at most the TTL.
+"""
+
+
+class UserCache:
+
+    def __init__(self,ttl:int,max_size:int,use_redis:bool):
+        self.ttl=ttl
+        self.max_size=max_size
+        self.use_redis=use_redis
+        self._entries:"OrderedDict[str,Tuple[float,CurrentUserModel]]"=OrderedDict()
+        self._task:Optional[asyncio.Task]=None
+
+    def _get_local(self,email:str)->Optional[CurrentUserModel]:
+        cached=self._entries.get(email)
+        if cached:
+            expires_at,user=cached
+            if expires_at>time.monotonic():
+                self._entries.move_to_end(email)
+                return user
+            del self._entries[email]
+        return None
+
+    def _set_local(self,user:CurrentUserModel)->None:
+        self._entries[user.email]=(time.monotonic()+self.ttl,user)
+        self._entries.move_to_end(user.email)
+        if len(self._entries)>self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self,email:str)->Optional[CurrentUserModel]:
+        user=self._get_local(email)
+        if user is None and self.use_redis:
+            body=await cached_user(email)
+            if body is not None:
+                user=CurrentUserModel.model_validate_json(body)
+                self._set_local(user)
+        record_cache_lookup("user",hits=int(user is not None),misses=int(user is None))
+        return user
+
+    async def set(self,user:CurrentUserModel)->None:
+        self._set_local(user)
+        if self.use_redis:
+            await add_cached_user(user.email,user.model_dump_json().encode("utf-8"),self.ttl)
+
+    async def invalidate(self,email:str)->None:
+        """ Drops email here, in Redis and in the other workers (called after the change is committed)"""
+        self._entries.pop(email,None)
+        try:
+            await invalidate_cached_user(email)
+        except Exception as e:
+            # the change is already committed, other workers catch up within the TTL
+            await global_logger.log_event(
+                data={
+                    "message":"user_cache_invalidation_error",
+                    "error":str(e),
+                    "email":email
+                },
+                level="error"
+            )
+
+    async def _run(self)->None:
+        while True:
+            pubsub=RedisClient.get_instance().pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(USER_INVALIDATED_CHANNEL)
+                # changes announced while disconnected are unknown
+                self._entries.clear()
+                async for message in pubsub.listen():
+                    if message["type"]=="message":
+                        self._entries.pop(message["data"].decode("utf-8"),None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await global_logger.log_event(
+                    data={
+                        "message":"user_cache_listener_error",
+                        "error":str(e)
+                    },
+                    level="error"
+                )
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.aclose()
+
+    def start(self)->None:
+        """ Starts the invalidation listener (called at startup)"""
+        if self._task is None:
+            self._task=asyncio.create_task(self._run())
+
+    async def stop(self)->None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task,return_exceptions=True)
+            self._task=None
+
+
+user_cache=UserCache(ttl=Config.USER_CACHE_TTL_SEC,max_size=Config.USER_CACHE_SIZE,use_redis=Config.USER_CACHE_REDIS)
@@ -5,11 +5,21 @@ from itsdangerous import URLSafeTimedSerializer,SignatureExpired, BadSignature
 from src.logging.logger import global_logger
 from jinja2 import Environment,FileSystemLoader
 from pathlib import Path 
+from collections import OrderedDict
+from typing import Callable,Optional,Tuple
+import hashlib
+import time
+import anyio
 import jwt
 import uuid 
+from src.utils.metrics import PASSWORD_HASH_DURATION,PASSWORD_HASH_PENDING,PASSWORD_HASH_QUEUE_WAIT
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ACCESS_TOKEN_EXPIRY=3600
+# verified claims per token digest, evicted at the token's exp (or least recently used beyond the size)
+_verified_tokens:"OrderedDict[bytes,Tuple[float,dict]]"=OrderedDict()
+# bcrypt releases the GIL, so up to PASSWORD_HASH_WORKERS hashes run in parallel off the event loop
+_password_limiter:Optional[anyio.CapacityLimiter]=None
 # Path to templates folder 
 TEMPLATES_DIR=Path(__file__).resolve().parent.parent/"templates"
 
@@ -26,6 +36,35 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """ verify the plain password with given hash of stored password"""
     return pwd_context.verify(plain_password, hashed_password)
 
+def _timed_password_job(operation:str,queued_at:float,func:Callable,*args)->object:
+    started=time.perf_counter()
+    PASSWORD_HASH_QUEUE_WAIT.labels(operation).observe(started-queued_at)
+    try:
+        return func(*args)
+    finally:
+        PASSWORD_HASH_DURATION.labels(operation).observe(time.perf_counter()-started)
+
+async def _run_password_job(operation:str,func:Callable,*args)->object:
+    global _password_limiter
+    if _password_limiter is None:
+        # created lazily, a limiter belongs to the running event loop
+        _password_limiter=anyio.CapacityLimiter(Config.PASSWORD_HASH_WORKERS)
+    PASSWORD_HASH_PENDING.inc()
+    try:
+        return await anyio.to_thread.run_sync(
+            _timed_password_job,operation,time.perf_counter(),func,*args,limiter=_password_limiter
+        )
+    finally:
+        PASSWORD_HASH_PENDING.dec()
+
+async def hash_password_async(password:str)->str:
+    """ hash_password in the password hashing pool"""
+    return await _run_password_job("hash",hash_password,password)
+
+async def verify_password_async(plain_password:str,hashed_password:str)->bool:
+    """ verify_password in the password hashing pool"""
+    return await _run_password_job("verify",verify_password,plain_password,hashed_password)
+
 def create_access_token(user_data:dict,expiry:timedelta=None,refresh:bool=False):
     # this function is going to create both access and refresh token (ideally refresh token is more longed)
     # (lived and can be used to generate new access token if refresh token is valid) else we need logout and re
@@ -54,6 +93,25 @@ def verify_token(token:str)->dict:
     except jwt.PyJWTError as e:
         return None 
     
+def verify_token_cached(token:str)->Optional[dict]:
+    """ verify_token with a per-worker cache, one signature check per token lifetime"""
+    key=hashlib.blake2b(token.encode("utf-8"),digest_size=16).digest()
+    cached=_verified_tokens.get(key)
+    if cached:
+        expires_at,token_data=cached
+        if expires_at>time.time():
+            _verified_tokens.move_to_end(key)
+            return token_data
+        del _verified_tokens[key]
+    
+    token_data=verify_token(token)
+    # tokens without exp are never cached, so they keep being verified
+    if token_data and isinstance(token_data.get('exp'),(int,float)):
+        _verified_tokens[key]=(token_data['exp'],token_data)
+        if len(_verified_tokens)>Config.TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return token_data
+
 def create_url_safe_token(data:dict):
     """ Creates encoded token for given data"""
     token=serializer.dumps(data)
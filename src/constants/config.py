@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings,SettingsConfigDict
 from pathlib import Path 
+from typing import Dict
 
 class Configuration(BaseSettings):
     DATABASE_URL:str
@@ -20,6 +21,60 @@ class Configuration(BaseSettings):
     DOMAIN:str 
     GOOGLE_API_KEY:str
     OPENAI_API_KEY:str
+    COMPRESSION_MINIMUM_SIZE:int=1000
+    GZIP_COMPRESS_LEVEL:int=6
+    BROTLI_QUALITY:int=4
+    IMPORT_DIR:str="imports"
+    IMPORT_CHUNK_SIZE:int=50
+    MAX_IMPORT_SIZE_MB:int=50
+    EXPORT_DIR:str="exports"
+    EXPORT_BATCH_SIZE:int=1000
+    LLM_USAGE_DEBUG_HEADER:bool=False
+    TRACING_EXPORTER:str="none"
+    TRACING_SAMPLE_RATIO:float=0.1
+    TRACING_FILE:str="traces.jsonl"
+    TRACING_OTLP_ENDPOINT:str="http://localhost:4318/v1/traces"
+    TOKEN_CACHE_SIZE:int=10000
+    REVOCATION_RESYNC_INTERVAL_SEC:int=30
+    USER_CACHE_TTL_SEC:int=30
+    USER_CACHE_SIZE:int=10000
+    USER_CACHE_REDIS:bool=False
+    PASSWORD_HASH_WORKERS:int=4
+    LAST_LOGIN_FLUSH_INTERVAL_SEC:int=10
+    DATABASE_READ_URL:str=""
+    DB_POOL_SIZE:int=10
+    DB_MAX_OVERFLOW:int=20
+    DB_POOL_TIMEOUT_SEC:int=30
+    DB_POOL_RECYCLE_SEC:int=1800
+    DB_POOL_PRE_PING:bool=True
+    DB_STATEMENT_CACHE_SIZE:int=500
+    RATE_LIMIT_ENABLED:bool=True
+    RATE_LIMIT_PATH_PREFIX:str="/api/"
+    RATE_LIMIT_WINDOW_SEC:int=60
+    RATE_LIMIT_PER_IP:int=120
+    RATE_LIMIT_PER_USER:int=240
+    RATE_LIMIT_ENDPOINTS:Dict[str,int]={}
+    LLM_DAILY_CALL_QUOTA:int=200
+    LLM_DAILY_TOKEN_QUOTA:int=400000
+    ADMISSION_INITIAL_LIMIT:int=16
+    ADMISSION_MIN_LIMIT:int=2
+    ADMISSION_MAX_LIMIT:int=64
+    ADMISSION_MAX_QUEUE:int=32
+    ADMISSION_QUEUE_TIMEOUT_SEC:float=10.0
+    ADMISSION_LATENCY_TOLERANCE:float=2.0
+    ADMISSION_RETRY_AFTER_SEC:int=5
+    LLM_SCHEDULER_CONCURRENCY:int=16
+    LLM_SCHEDULER_WEIGHTS:Dict[str,int]={"interactive":8,"batch":2,"background":1}
+    LLM_SCHEDULER_SHARES:Dict[str,float]={"interactive":1.0,"batch":0.5,"background":0.25}
+    LOG_LEVEL:str="info"
+    LOG_SAMPLE_RATES:Dict[str,float]={}
+    LOG_QUEUE_SIZE:int=10000
+    LOG_QUEUE_POLICY:str="drop"
+    LOG_BATCH_SIZE:int=500
+    LOG_FLUSH_INTERVAL_SEC:float=1.0
+    LOG_MAX_BYTES:int=50*1024*1024
+    LOG_ROTATE_INTERVAL_SEC:int=0
+    LOG_BACKUP_COUNT:int=5
     model_config=SettingsConfigDict(
         env_file=Path(__file__).parent.parent/".env",
         extra="ignore"
@@ -1,30 +1,60 @@
-from sqlmodel import create_engine,text,SQLModel
-from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import text,SQLModel
+from sqlalchemy.ext.asyncio import AsyncEngine,async_sessionmaker,create_async_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.orm import sessionmaker 
 from src.constants.config import Config
 from sqlalchemy_utils import database_exists, create_database
+from src.utils.metrics import instrument_engine,instrument_pool
+from src.utils.tracing import instrument_engine_tracing
 
-engine=AsyncEngine(
-    create_engine(
-        url=Config.DATABASE_URL,
-        echo=False 
+
+def build_engine(url:str,pool_name:str)->AsyncEngine:
+    """ Async engine with the pool settings of Config, instrumented for metrics and tracing"""
+    engine=create_async_engine(
+        url,
+        echo=False,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_timeout=Config.DB_POOL_TIMEOUT_SEC,
+        pool_recycle=Config.DB_POOL_RECYCLE_SEC,
+        pool_pre_ping=Config.DB_POOL_PRE_PING,
+        # asyncpg prepared statements kept per connection
+        connect_args={"prepared_statement_cache_size":Config.DB_STATEMENT_CACHE_SIZE}
     )
-)
+    instrument_engine(engine.sync_engine)
+    instrument_engine_tracing(engine.sync_engine)
+    instrument_pool(engine.sync_engine,pool_name,Config.DB_POOL_SIZE+Config.DB_MAX_OVERFLOW)
+    return engine
+
+engine=build_engine(Config.DATABASE_URL,"primary")
+# read-only queries go to the replica when one is configured
+read_engine=build_engine(Config.DATABASE_READ_URL,"replica") if Config.DATABASE_READ_URL else engine
+
+async_session=async_sessionmaker(bind=engine,class_=AsyncSession,expire_on_commit=False)
+read_session=async_sessionmaker(bind=read_engine,class_=AsyncSession,expire_on_commit=False)
+
 
-    
 async def init_db():
     async with engine.begin() as conn:
-        from src.auth.models import User 
-        
+        from src.auth.models import User
+        from src.estimator.models import DishAnalysis,EstimationHistory
+
         await conn.run_sync(SQLModel.metadata.create_all)
-        
+
+# no span around the sessions: they live as long as the request, every statement is traced instead
 async def get_session()->AsyncSession:
-    Session=sessionmaker(
-        bind=engine,
-        class_=AsyncSession,
-        expire_on_commit=False 
-    )
-    
-    async with Session() as session:
-        yield session
\ No newline at end of file
+    async with async_session() as session:
+        yield session
+
+async def get_read_session()->AsyncSession:
+    """ Session on the read replica (the primary without one), for queries that tolerate replication lag"""
+    async with read_session() as session:
+        yield session
+
+def background_session()->AsyncSession:
+    """ Session for work running outside a request (write-behind, background jobs)"""
+    return async_session()
+
+async def dispose_engines()->None:
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
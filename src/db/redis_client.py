@@ -1,12 +1,27 @@
+import time
 import redis.asyncio as redis 
 from src.constants.config import Config 
 from fastapi import HTTPException
-from typing import Optional 
+from typing import Optional,Tuple,Dict,List
 from src.logging.logger import global_logger 
 from src.estimator.schemas import DishCarbonAnalysisResponse
-import json 
+from src.estimator.utils import parse_dish_response
+from src.utils.metrics import InstrumentedRedis,record_cache_lookup
+from src.utils.tracing import tracer,traced
 # JWT Token id expiry time 
 JTI_Expiry=3600
+# revoked JWT ids scored by their expiry (unix time), changes announced on the channel
+JTI_BLOCKLIST_KEY="jti_blocklist"
+JTI_REVOKED_CHANNEL="jti_revoked"
+# Dish analysis cache expiry time and key namespace
+DISH_CACHE_EXPIRY=3600
+DISH_CACHE_PREFIX="dish:"
+# per kg ingredient emission factors change far less often than whole dish analyses
+INGREDIENT_CACHE_EXPIRY=30*24*3600
+INGREDIENT_CACHE_PREFIX="ingredient:"
+# authenticated users by email, dropped by every worker on change
+USER_CACHE_PREFIX="user:"
+USER_INVALIDATED_CHANNEL="user_invalidated"
 
 class RedisClient:
     """ SingleTon Class to get Redis Client"""
@@ -16,7 +31,7 @@ class RedisClient:
     def get_instance(cls)->redis.Redis:
         if cls._instance is None:
             try:
-                cls._instance=redis.from_url(Config.REDIS_URL)
+                cls._instance=InstrumentedRedis.from_url(Config.REDIS_URL)
             except Exception as e:
                 global_logger.log_event(
                     data={
@@ -29,35 +44,197 @@ class RedisClient:
         return cls._instance 
     
     
-async def add_jti_to_blocklist(jti:str)->None:
-    """ Add JWT id to blocklist in redis"""
+def dish_cache_key(dish_name:str)->str:
+    """ Redis key holding the rendered analysis of a (normalized) dish name"""
+    return f"{DISH_CACHE_PREFIX}{dish_name}"
+
+async def add_jti_to_blocklist(jti:str)->float:
+    """ Add JWT id to blocklist in redis and announce it to the workers, returns its expiry"""
+    client=RedisClient.get_instance()
+    now=time.time()
+    expires_at=now+JTI_Expiry
+    async with client.pipeline(transaction=True) as pipe:
+        pipe.zremrangebyscore(JTI_BLOCKLIST_KEY,"-inf",now)
+        pipe.zadd(JTI_BLOCKLIST_KEY,{jti:expires_at})
+        pipe.publish(JTI_REVOKED_CHANNEL,f"{jti} {expires_at}")
+        await pipe.execute()
+    return expires_at
+
+async def blocklisted_jtis()->Dict[str,float]:
+    """ Unexpired JWT ids of the blocklist with their expiry"""
     client=RedisClient.get_instance()
-    await client.set(name=jti,value="",ex=JTI_Expiry)
+    entries=await client.zrangebyscore(JTI_BLOCKLIST_KEY,time.time(),"+inf",withscores=True)
+    return {jti.decode("utf-8"):expires_at for jti,expires_at in entries}
 
-async def token_in_blocklist(jti:str)->None:
+async def token_in_blocklist(jti:str)->bool:
     """ Checks JWT id is present in blocklist in redis"""
     client=RedisClient.get_instance()
-    value=await client.get(jti)
-    return value is not None  
+    expires_at=await client.zscore(JTI_BLOCKLIST_KEY,jti)
+    return expires_at is not None and expires_at>time.time()
 
-async def add_dish_carbon_foot_print_analysis(dish_name: str, value: dict) -> None:
-    """Caching the responses for Dish Name to avoid LLM Call"""
+async def add_dish_carbon_foot_print_analysis(dish_name: str, body: bytes) -> None:
+    """Caching the rendered response body for Dish Name to avoid LLM Call and re-encoding on hits"""
     client = RedisClient.get_instance()
-    # Serialize dict -> JSON string
     await client.set(
-        name=dish_name,
-        value=json.dumps(value),
-        ex=JTI_Expiry
+        name=dish_cache_key(dish_name),
+        value=body,
+        ex=DISH_CACHE_EXPIRY
     )
 
+@traced("cache.dish_response_in_cache")
+async def dish_response_in_cache(dish_name: str) -> Optional[bytes]:
+    """ Returns the cached response body bytes for dish_name as stored, if present"""
+    client = RedisClient.get_instance()
+    body = await client.get(dish_cache_key(dish_name))
+    record_cache_lookup("dish", hits=int(body is not None), misses=int(body is None))
+    return body
+
+async def dish_response_with_ttl(dish_name: str) -> Tuple[Optional[bytes], int]:
+    """ Cached response body for dish_name and its remaining TTL in seconds, in a single round trip"""
+    client = RedisClient.get_instance()
+    key = dish_cache_key(dish_name)
+    async with client.pipeline(transaction=False) as pipe:
+        body, ttl = await pipe.get(key).ttl(key).execute()
+    record_cache_lookup("dish", hits=int(body is not None), misses=int(body is None))
+    return body, ttl
+
+@traced("cache.dish_in_cache")
 async def dish_in_cache(dish_name: str) -> Optional[DishCarbonAnalysisResponse]:
     """ Checking whether dish_name exists in redis cache"""
-    client = RedisClient.get_instance()
-    result = await client.get(dish_name)
+    result = await dish_response_in_cache(dish_name)
     if result:
-        # Decode JSON string back to dict
-        data = json.loads(result)
-        return DishCarbonAnalysisResponse(**data)
+        with tracer.start_as_current_span("cache.parse_dish_response"):
+            return parse_dish_response(result)
     return None
-    
-    
\ No newline at end of file
+
+@traced("cache.dishes_in_cache")
+async def dishes_in_cache(dish_names: List[str]) -> Dict[str, DishCarbonAnalysisResponse]:
+    """ Batch lookup of cached analyses for (normalized) dish names in a single MGET, misses are left out"""
+    client = RedisClient.get_instance()
+    values = await client.mget([dish_cache_key(name) for name in dish_names])
+    found = {name: parse_dish_response(value) for name, value in zip(dish_names, values) if value is not None}
+    record_cache_lookup("dish", hits=len(found), misses=len(dish_names) - len(found))
+    return found
+
+async def add_ingredient_factors(factors: Dict[str, bytes]) -> None:
+    """ Caching per kg emission factors by normalized ingredient name, in a single round trip"""
+    client = RedisClient.get_instance()
+    async with client.pipeline(transaction=False) as pipe:
+        for ingredient_name, value in factors.items():
+            pipe.set(name=f"{INGREDIENT_CACHE_PREFIX}{ingredient_name}", value=value, ex=INGREDIENT_CACHE_EXPIRY)
+        await pipe.execute()
+
+async def ingredient_factors_in_cache(ingredient_names: List[str]) -> Dict[str, bytes]:
+    """ Cached per kg emission factors of the given ingredients (MGET), misses are left out"""
+    client = RedisClient.get_instance()
+    values = await client.mget([f"{INGREDIENT_CACHE_PREFIX}{name}" for name in ingredient_names])
+    return {name: value for name, value in zip(ingredient_names, values) if value is not None}
+
+async def add_cached_user(email: str, body: bytes, ttl: int) -> None:
+    client = RedisClient.get_instance()
+    await client.set(name=f"{USER_CACHE_PREFIX}{email}", value=body, ex=ttl)
+
+async def cached_user(email: str) -> Optional[bytes]:
+    client = RedisClient.get_instance()
+    return await client.get(f"{USER_CACHE_PREFIX}{email}")
+
+async def invalidate_cached_user(email: str) -> None:
+    """ Drops the shared cache entry of email and tells the workers to drop theirs"""
+    client = RedisClient.get_instance()
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.delete(f"{USER_CACHE_PREFIX}{email}")
+        pipe.publish(USER_INVALIDATED_CHANNEL, email)
+        await pipe.execute()
+
+# compare-and-set on the lock owner so a worker never extends / drops a lock it lost
+REFRESH_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+async def acquire_lock(name: str, owner: str, ttl: int) -> bool:
+    """ Distributed lock held by owner for ttl seconds, False if someone else holds it"""
+    client = RedisClient.get_instance()
+    return bool(await client.set(name=name, value=owner, nx=True, ex=ttl))
+
+async def refresh_lock(name: str, owner: str, ttl: int) -> bool:
+    """ Extends a lock owned by owner, False if it expired and was lost"""
+    client = RedisClient.get_instance()
+    return bool(await client.eval(REFRESH_LOCK_SCRIPT, 1, name, owner, ttl))
+
+async def release_lock(name: str, owner: str) -> None:
+    client = RedisClient.get_instance()
+    await client.eval(RELEASE_LOCK_SCRIPT, 1, name, owner)
+
+# sliding window log per key (a sorted set of request timestamps in ms): the request is admitted
+# only if every key is under its limit, and then counted in all of them.
+# returns {admitted, limit, remaining, reset_ms} of the tightest key
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local admitted = 1
+local tightest = 0
+local tightest_left = 0
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    local left = tonumber(ARGV[3 + i]) - redis.call('ZCARD', key)
+    if left <= 0 then
+        admitted = 0
+    end
+    if tightest == 0 or left < tightest_left then
+        tightest = i
+        tightest_left = left
+    end
+end
+if admitted == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call('ZADD', key, now, ARGV[3])
+        redis.call('PEXPIRE', key, window)
+    end
+    tightest_left = tightest_left - 1
+end
+local reset = window
+local oldest = redis.call('ZRANGE', KEYS[tightest], 0, 0, 'WITHSCORES')
+if oldest[2] then
+    reset = tonumber(oldest[2]) + window - now
+end
+return {admitted, tonumber(ARGV[3 + tightest]), math.max(tightest_left, 0), reset}
+"""
+# daily LLM usage per subject (hash of calls / tokens): one more call is reserved only while
+# both are under their limits (0 = unlimited)
+RESERVE_LLM_CALL_SCRIPT = """
+local calls = tonumber(redis.call('HGET', KEYS[1], 'calls') or '0')
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or '0')
+local call_limit = tonumber(ARGV[1])
+local token_limit = tonumber(ARGV[2])
+if (call_limit > 0 and calls >= call_limit) or (token_limit > 0 and tokens >= token_limit) then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'calls', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+async def sliding_window_hit(keys: List[str], limits: List[int], window_ms: int, now_ms: int, member: str) -> Tuple[bool, int, int, int]:
+    """ Counts a request against every (key, limit), atomically: (admitted, limit, remaining, reset_ms) of the tightest key"""
+    client = RedisClient.get_instance()
+    admitted, limit, remaining, reset_ms = await client.eval(
+        SLIDING_WINDOW_SCRIPT, len(keys), *keys, now_ms, window_ms, member, *limits
+    )
+    return bool(admitted), int(limit), int(remaining), int(reset_ms)
+
+async def reserve_llm_call(key: str, call_limit: int, token_limit: int, ttl: int) -> bool:
+    client = RedisClient.get_instance()
+    return bool(await client.eval(RESERVE_LLM_CALL_SCRIPT, 1, key, call_limit, token_limit, ttl))
+
+async def add_llm_tokens(key: str, tokens: int) -> None:
+    client = RedisClient.get_instance()
+    await client.hincrby(key, "tokens", tokens)
@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Deque,Optional
+from src.constants.config import Config
+from src.utils.errors import CustomException,ServiceOverloaded
+from src.utils.metrics import ADMISSION_IN_FLIGHT,ADMISSION_LIMIT,ADMISSION_QUEUED,ADMISSION_REJECTIONS
+from .scheduler import llm_priority
+
+"""
+Per worker admission control of interactive LLM work (cache-miss estimations, image detection,
+unknown ingredient factors); cache hits never get here.
+
+At most `limit` pipelines run at once, up to max_queue more wait (for at most queue_timeout
+seconds) and anything beyond is refused with ServiceOverloaded (503 + Retry-After) instead of
+piling up. Batch and background work bypasses it, it is never shed and its share of the LLM
+calls is bounded by the scheduler (scheduler.py).
+
+The limit adapts AIMD style to the observed pipeline latency: while latency stays within
+latency_tolerance x the baseline (moving average of successful pipelines) and the limit is in use,
+it grows by one per limit's worth of completions; a slower pipeline or one with a failed provider
+call cuts it by 10%. Only pipelines that reached the provider are observed: quota / overload
+rejections and cache-only paths say nothing about its health. When the provider slows down fewer
+pipelines are admitted, so queued requests fail fast instead of timing out.
+"""
+
+# weight of a new latency in the baseline average (~ the last 20 pipelines)
+BASELINE_SMOOTHING=0.05
+DECREASE_FACTOR=0.9
+
+
+@dataclass
+class AdmissionTicket:
+    """ Provider calls made by one admitted pipeline, reported by LLMService._invoke"""
+    calls:int=0
+    failures:int=0
+
+_current_ticket:ContextVar[Optional[AdmissionTicket]]=ContextVar("admission_ticket",default=None)
+
+
+def record_provider_call(failed:bool)->None:
+    ticket=_current_ticket.get()
+    if ticket is not None:
+        ticket.calls+=1
+        ticket.failures+=int(failed)
+
+
+class AdmissionController:
+
+    def __init__(self,initial_limit:int,min_limit:int,max_limit:int,max_queue:int,
+                 queue_timeout:float,latency_tolerance:float):
+        self.limit=float(initial_limit)
+        self.min_limit=min_limit
+        self.max_limit=max_limit
+        self.max_queue=max_queue
+        self.queue_timeout=queue_timeout
+        self.latency_tolerance=latency_tolerance
+        self.in_flight=0
+        self._baseline:Optional[float]=None
+        self._waiters:Deque[asyncio.Future]=deque()
+        ADMISSION_LIMIT.set(self.limit)
+
+    def _has_capacity(self)->bool:
+        return self.in_flight<int(self.limit)
+
+    def _wake(self)->None:
+        # slots are handed to waiters in arrival order
+        while self._waiters and self._has_capacity():
+            waiter=self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight+=1
+            waiter.set_result(None)
+        self._update_gauges()
+
+    def _update_gauges(self)->None:
+        ADMISSION_IN_FLIGHT.set(self.in_flight)
+        ADMISSION_QUEUED.set(len(self._waiters))
+        ADMISSION_LIMIT.set(self.limit)
+
+    def _reject(self,reason:str)->None:
+        ADMISSION_REJECTIONS.labels(reason).inc()
+        raise ServiceOverloaded(f"LLM admission refused: {reason}")
+
+    async def _acquire(self)->None:
+        if self._has_capacity() and not self._waiters:
+            self.in_flight+=1
+            self._update_gauges()
+            return
+        if len(self._waiters)>=self.max_queue:
+            self._reject("queue_full")
+
+        waiter=asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(waiter,self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted as we gave up, pass it on
+                self._release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_gauges()
+            if isinstance(e,asyncio.TimeoutError):
+                self._reject("queue_timeout")
+            raise
+
+    def _release(self)->None:
+        self.in_flight-=1
+        self._wake()
+
+    def _observe(self,latency:float,failed:bool)->None:
+        slow=self._baseline is not None and latency>self._baseline*self.latency_tolerance
+        if failed or slow:
+            self.limit=max(float(self.min_limit),self.limit*DECREASE_FACTOR)
+        elif self.in_flight>=int(self.limit):
+            self.limit=min(float(self.max_limit),self.limit+1/self.limit)
+
+        if not failed:
+            if self._baseline is None:
+                self._baseline=latency
+            else:
+                self._baseline+=BASELINE_SMOOTHING*(latency-self._baseline)
+
+    @asynccontextmanager
+    async def admit(self):
+        """ Holds one slot of interactive LLM work for the duration of the block"""
+        if llm_priority()!="interactive":
+            yield
+            return
+        await self._acquire()
+        ticket=AdmissionTicket()
+        token=_current_ticket.set(ticket)
+        start=time.perf_counter()
+        observe=True
+        try:
+            yield
+        except CustomException:
+            # quota / overload errors say nothing about the provider's health
+            observe=False
+            raise
+        except Exception:
+            ticket.failures+=1
+            raise
+        finally:
+            _current_ticket.reset(token)
+            if observe and ticket.calls:
+                self._observe(time.perf_counter()-start,failed=ticket.failures>0)
+            self._release()
+
+
+admission=AdmissionController(
+    initial_limit=Config.ADMISSION_INITIAL_LIMIT,
+    min_limit=Config.ADMISSION_MIN_LIMIT,
+    max_limit=Config.ADMISSION_MAX_LIMIT,
+    max_queue=Config.ADMISSION_MAX_QUEUE,
+    queue_timeout=Config.ADMISSION_QUEUE_TIMEOUT_SEC,
+    latency_tolerance=Config.ADMISSION_LATENCY_TOLERANCE
+)
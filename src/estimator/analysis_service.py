@@ -0,0 +1,169 @@
+from .models import DishAnalysis
+from .schemas import DishCarbonAnalysisResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from typing import Optional,List,Dict
+from src.db.pg_sql_client import background_session
+from src.logging.logger import global_logger
+import asyncio
+
+# strong references to in-flight write-behind tasks (asyncio only keeps weak ones)
+_write_tasks: set[asyncio.Task] = set()
+# latest in-flight write-behind task per normalized name
+_pending_writes: dict[str, asyncio.Task] = {}
+
+# model_name of an analysis whose producing model this worker does not know, the worker that
+# computed it overwrites it with its own write-behind
+UNKNOWN_MODEL="unknown"
+
+
+def pipeline_model_name(*model_names:Optional[str])->str:
+    """ model_name stored for an analysis: the models that answered its stages, in stage order"""
+    return ",".join(dict.fromkeys(name for name in model_names if name))[:100] or UNKNOWN_MODEL
+
+
+class DishAnalysisService:
+
+    async def get_analysis(self,normalized_name:str,prompt_version:str,session:AsyncSession)->Optional[DishAnalysis]:
+        try:
+            statement=select(DishAnalysis).where(
+                DishAnalysis.normalized_name==normalized_name,
+                DishAnalysis.prompt_version==prompt_version
+            )
+            result=await session.exec(statement)
+            return result.first()
+        except Exception as e:
+            await global_logger.log_event(
+                data={
+                    "message":"error_fetching_dish_analysis",
+                    "error":str(e),
+                    "normalized_name":normalized_name
+                },
+                level="error"
+            )
+            raise
+
+    async def get_analyses(self,normalized_names:List[str],prompt_version:str,session:AsyncSession)->List[DishAnalysis]:
+        try:
+            statement=select(DishAnalysis).where(
+                DishAnalysis.normalized_name.in_(normalized_names),
+                DishAnalysis.prompt_version==prompt_version
+            )
+            result=await session.exec(statement)
+            return result.all()
+        except Exception as e:
+            await global_logger.log_event(
+                data={
+                    "message":"error_fetching_dish_analyses",
+                    "error":str(e),
+                    "normalized_names":normalized_names
+                },
+                level="error"
+            )
+            raise
+
+    async def upsert_analysis(self,normalized_name:str,analysis:DishCarbonAnalysisResponse,
+                              model_name:str,prompt_version:str,session:AsyncSession,
+                              overwrite:bool=True)->None:
+        """ overwrite=False keeps an already stored analysis (and its model_name) as it is"""
+        try:
+            payload=analysis.model_dump(mode="json")
+            statement=insert(DishAnalysis).values(
+                normalized_name=normalized_name,
+                payload=payload,
+                model_name=model_name,
+                prompt_version=prompt_version
+            )
+            if overwrite:
+                statement=statement.on_conflict_do_update(
+                    index_elements=[DishAnalysis.normalized_name],
+                    set_={
+                        "payload":payload,
+                        "model_name":model_name,
+                        "prompt_version":prompt_version,
+                        "updated_at":func.now()
+                    }
+                )
+            else:
+                statement=statement.on_conflict_do_nothing(index_elements=[DishAnalysis.normalized_name])
+            await session.execute(statement)
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            await global_logger.log_event(
+                data={
+                    "message":"error_upserting_dish_analysis",
+                    "error":str(e),
+                    "normalized_name":normalized_name
+                },
+                level="error"
+            )
+            raise
+
+
+dish_analysis_service=DishAnalysisService()
+
+async def stored_analysis(normalized_name:str,prompt_version:str)->Optional[DishCarbonAnalysisResponse]:
+    """ Read-through lookup of the durable analysis store, None on a miss or when Postgres is unavailable"""
+    try:
+        async with background_session() as session:
+            record=await dish_analysis_service.get_analysis(
+                normalized_name=normalized_name,
+                prompt_version=prompt_version,
+                session=session
+            )
+        return DishCarbonAnalysisResponse(**record.payload) if record else None
+    except Exception:
+        return None
+
+async def stored_analyses(normalized_names:List[str],prompt_version:str)->Dict[str,DishCarbonAnalysisResponse]:
+    """ Batch read-through of the durable analysis store in one query, misses are left out"""
+    try:
+        async with background_session() as session:
+            records=await dish_analysis_service.get_analyses(
+                normalized_names=normalized_names,
+                prompt_version=prompt_version,
+                session=session
+            )
+        return {record.normalized_name:DishCarbonAnalysisResponse(**record.payload) for record in records}
+    except Exception:
+        return {}
+
+async def _write_analysis(normalized_name:str,analysis:DishCarbonAnalysisResponse,model_name:str,prompt_version:str)->None:
+    try:
+        async with background_session() as session:
+            await dish_analysis_service.upsert_analysis(
+                normalized_name=normalized_name,
+                analysis=analysis,
+                model_name=model_name,
+                prompt_version=prompt_version,
+                session=session
+            )
+    except Exception:
+        # already logged by the service, write-behind must never fail the request
+        pass
+
+def schedule_analysis_write(normalized_name:str,analysis:DishCarbonAnalysisResponse,model_name:str,prompt_version:str)->None:
+    """ Write-behind of a freshly computed analysis to Postgres without delaying the response"""
+    task=asyncio.create_task(_write_analysis(normalized_name,analysis,model_name,prompt_version))
+    _write_tasks.add(task)
+    _pending_writes[normalized_name]=task
+    
+    def _done(finished:asyncio.Task)->None:
+        _write_tasks.discard(finished)
+        if _pending_writes.get(normalized_name) is finished:
+            del _pending_writes[normalized_name]
+    task.add_done_callback(_done)
+
+async def wait_for_analysis_write(normalized_name:str)->None:
+    """ Waits for this worker's pending write-behind of normalized_name, if any"""
+    task=_pending_writes.get(normalized_name)
+    if task:
+        await asyncio.gather(task,return_exceptions=True)
+
+async def drain_pending_writes()->None:
+    """ Waits for outstanding write-behind tasks (called on shutdown)"""
+    if _write_tasks:
+        await asyncio.gather(*_write_tasks,return_exceptions=True)
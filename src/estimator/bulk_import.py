@@ -0,0 +1,395 @@
+import asyncio
+import csv
+import io
+import os
+import shutil
+import socket
+import anyio
+from datetime import datetime,time,timedelta,timezone
+from itertools import islice
+from pathlib import Path
+from typing import AsyncIterator,Dict,Iterator,Optional
+from uuid import UUID,uuid4
+from fastapi import UploadFile
+import pyarrow.parquet as pq
+from .schemas import ImportJob,DishCarbonAnalysisResponse
+from .llm_service import LLMService
+from .utils import normalize_name
+from .usage import start_request_usage,finish_request_usage
+from .quota import set_quota_subject
+from .scheduler import set_llm_priority
+from src.constants.config import Config
+from src.db.redis_client import acquire_lock,refresh_lock,release_lock
+from src.logging.logger import global_logger
+from src.utils.errors import QuotaExceeded
+
+"""
+Bulk menu imports: the uploaded CSV / Parquet file is streamed from disk, dish names are
+deduplicated and estimated chunk by chunk through LLMService.resolve_analyses (shared batch
+cache lookup, bounded LLM concurrency). After every chunk the results are fsync'ed and the
+checkpoint (ImportJob) is atomically replaced, so a crashed import resumes at the last chunk.
+An import that exhausts its owner's daily LLM quota is paused and resumes at the last chunk on
+the next UTC day. Other errors fail the job, retry_import resumes it at the last chunk.
+
+One worker runs a job at a time, under a Redis lock kept alive by a heartbeat. A worker that
+finds the lock taken (e.g. still held by a crashed worker) tries again once it could have expired.
+
+Layout of IMPORT_DIR/<job_id>/: source.csv|source.parquet, checkpoint.json, results.csv
+"""
+
+IMPORT_DIR=Path(Config.IMPORT_DIR)
+UPLOAD_CHUNK_BYTES=1024*1024
+LOCK_TTL=60
+LOCK_REFRESH_INTERVAL=LOCK_TTL/3
+# source rows read per hop to the worker thread
+READ_BATCH_ROWS=1000
+SOURCE_FORMATS={".csv":"csv",".parquet":"parquet",".pq":"parquet"}
+RESULT_COLUMNS=[
+    "dish",
+    "normalized_name",
+    "status",
+    "carbon_per_serving_kg",
+    "impact_rating",
+    "serving_size_g",
+    "ingredient_count",
+    "car_miles_equivalent"
+]
+
+# identifies this worker as lock owner, unique across restarts (containers reuse pids)
+WORKER_ID=f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+_running_imports: Dict[UUID,asyncio.Task]={}
+# delayed (re)starts, e.g. of imports paused until the quota resets
+_scheduled_imports: Dict[UUID,asyncio.Task]={}
+
+
+def job_dir(job_id:UUID)->Path:
+    return IMPORT_DIR/str(job_id)
+
+def source_path(job:ImportJob)->Path:
+    return job_dir(job.job_id)/f"source.{job.source_format}"
+
+def results_path(job_id:UUID)->Path:
+    return job_dir(job_id)/"results.csv"
+
+def load_job(job_id:UUID)->Optional[ImportJob]:
+    checkpoint=job_dir(job_id)/"checkpoint.json"
+    if not checkpoint.exists():
+        return None
+    return ImportJob.model_validate_json(checkpoint.read_bytes())
+
+def _save_job(job:ImportJob)->None:
+    job.updated_at=datetime.now(timezone.utc)
+    checkpoint=job_dir(job.job_id)/"checkpoint.json"
+    tmp=checkpoint.with_suffix(".tmp")
+    with open(tmp,"wb") as f:
+        f.write(job.model_dump_json().encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp,checkpoint)
+
+def iter_dish_names(path:Path,source_format:str,column:str)->Iterator[Optional[str]]:
+    """ Streams the dish column row by row without loading the file"""
+    if source_format=="parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=Config.IMPORT_CHUNK_SIZE*20,columns=[column]):
+            yield from batch.column(0).to_pylist()
+    else:
+        with open(path,newline="",encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                yield row.get(column)
+
+async def aiter_dish_names(path:Path,source_format:str,column:str)->AsyncIterator[Optional[str]]:
+    """ iter_dish_names read in a worker thread, READ_BATCH_ROWS rows at a time"""
+    names=iter_dish_names(path,source_format,column)
+    while batch:=await anyio.to_thread.run_sync(lambda: list(islice(names,READ_BATCH_ROWS))):
+        for value in batch:
+            yield value
+
+def _source_rows(path:Path,source_format:str,column:str,newlines:int)->int:
+    """ Checks the dish column exists, returns the (estimated for CSV) row count. Raises ValueError"""
+    if source_format=="parquet":
+        metadata=pq.ParquetFile(path)
+        if column not in metadata.schema_arrow.names:
+            raise ValueError(f"Column '{column}' not found in file")
+        return metadata.metadata.num_rows
+    with open(path,newline="",encoding="utf-8-sig") as f:
+        header=next(csv.reader(f),[])
+    if column not in header:
+        raise ValueError(f"Column '{column}' not found in file")
+    # header excluded, quoted multi-line values make this an estimate
+    return max(newlines-1,0)
+
+def _reset_results(job:ImportJob)->int:
+    """ Drops results written after the last checkpoint, returns the results size"""
+    with open(results_path(job.job_id),"ab") as f:
+        f.truncate(job.output_bytes)
+        if job.output_bytes==0:
+            f.write((",".join(RESULT_COLUMNS)+"\r\n").encode("utf-8"))
+            return f.tell()
+    return job.output_bytes
+
+
+async def create_import(upload:UploadFile,column:str,owner_uuid:UUID)->ImportJob:
+    """ Stores the upload on disk, validates it and queues the import. Raises ValueError for bad input"""
+    source_format=SOURCE_FORMATS.get(Path(upload.filename or "").suffix.lower())
+    if not source_format:
+        raise ValueError(f"Unsupported file type, allowed: {', '.join(SOURCE_FORMATS)}")
+
+    now=datetime.now(timezone.utc)
+    job=ImportJob(
+        job_id=uuid4(),
+        owner_uuid=owner_uuid,
+        source_format=source_format,
+        column=column,
+        created_at=now,
+        updated_at=now
+    )
+    job_dir(job.job_id).mkdir(parents=True)
+    try:
+        path=source_path(job)
+
+        size=0
+        newlines=0
+        max_size=Config.MAX_IMPORT_SIZE_MB*1024*1024
+        async with await anyio.open_file(path,"wb") as f:
+            while chunk:=await upload.read(UPLOAD_CHUNK_BYTES):
+                size+=len(chunk)
+                if size>max_size:
+                    raise ValueError(f"File too large. Max allowed: {Config.MAX_IMPORT_SIZE_MB}MB")
+                newlines+=chunk.count(b"\n")
+                await f.write(chunk)
+
+        job.total_rows=await anyio.to_thread.run_sync(_source_rows,path,source_format,column,newlines)
+    except Exception:
+        # rejected uploads leave nothing behind
+        await anyio.to_thread.run_sync(lambda: shutil.rmtree(job_dir(job.job_id),ignore_errors=True))
+        raise
+
+    await anyio.to_thread.run_sync(_save_job,job)
+    start_import(job.job_id)
+    return job
+
+
+def start_import(job_id:UUID)->None:
+    if job_id in _running_imports:
+        return
+    task=asyncio.create_task(run_import(job_id))
+    _running_imports[job_id]=task
+    task.add_done_callback(lambda _: _running_imports.pop(job_id,None))
+
+def schedule_import(job_id:UUID,delay:float)->None:
+    """ Starts the import after delay seconds (in this worker, unless it shuts down first)"""
+    if job_id in _scheduled_imports:
+        return
+
+    async def start_later()->None:
+        await asyncio.sleep(delay)
+        start_import(job_id)
+
+    task=asyncio.create_task(start_later())
+    _scheduled_imports[job_id]=task
+    task.add_done_callback(lambda _: _scheduled_imports.pop(job_id,None))
+
+async def retry_import(job:ImportJob)->ImportJob:
+    """ Resumes a failed import from its last checkpoint"""
+    job.status="queued"
+    job.error=None
+    await anyio.to_thread.run_sync(_save_job,job)
+    start_import(job.job_id)
+    return job
+
+def next_quota_reset()->datetime:
+    """ Daily LLM quotas are counted per UTC day, see quota.py"""
+    tomorrow=datetime.now(timezone.utc).date()+timedelta(days=1)
+    return datetime.combine(tomorrow,time.min,tzinfo=timezone.utc)
+
+
+async def _hold_lock(lock_name:str,import_task:asyncio.Task)->None:
+    """ Heartbeat of the import lock, cancels the import if the lock was lost"""
+    while True:
+        await asyncio.sleep(LOCK_REFRESH_INTERVAL)
+        try:
+            held=await refresh_lock(lock_name,WORKER_ID,LOCK_TTL)
+        except Exception as e:
+            # redis hiccup, the lock survives until LOCK_TTL
+            await global_logger.log_event(
+                data={
+                    "message":"error_refreshing_import_lock",
+                    "error":str(e),
+                    "lock":lock_name
+                },
+                level="error"
+            )
+            continue
+        if not held:
+            # another worker owns the job now, the checkpoint stays "running" for it
+            await global_logger.log_event(
+                data={
+                    "message":"menu_import_lock_lost",
+                    "lock":lock_name
+                },
+                level="error"
+            )
+            import_task.cancel()
+            return
+
+
+async def _process_chunk(job:ImportJob,chunk:Dict[str,str],rows_read:int)->None:
+    analyses=await LLMService.resolve_analyses(list(chunk)) if chunk else {}
+
+    buffer=io.StringIO()
+    writer=csv.writer(buffer)
+    for normalized_name,dish in chunk.items():
+        analysis:Optional[DishCarbonAnalysisResponse]=analyses.get(normalized_name)
+        if analysis:
+            metrics=analysis.metrics
+            writer.writerow([
+                dish,
+                normalized_name,
+                "ok",
+                metrics.carbon_per_serving_kg,
+                metrics.impact_rating,
+                metrics.serving_size_g,
+                metrics.ingredient_count,
+                metrics.car_miles_equivalent
+            ])
+        else:
+            writer.writerow([dish,normalized_name,"invalid_dish"]+[""]*(len(RESULT_COLUMNS)-3))
+
+    def append_results()->int:
+        with open(results_path(job.job_id),"ab") as f:
+            f.write(buffer.getvalue().encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    job.output_bytes=await anyio.to_thread.run_sync(append_results)
+    job.dishes_processed+=len(chunk)
+    job.dishes_succeeded+=len(analyses)
+    job.dishes_failed+=len(chunk)-len(analyses)
+    job.rows_read=rows_read
+    await anyio.to_thread.run_sync(_save_job,job)
+
+
+async def run_import(job_id:UUID)->None:
+    """ Runs (or resumes from its checkpoint) an import, unless another worker owns it"""
+    lock_name=f"import_lock:{job_id}"
+    if not await acquire_lock(lock_name,WORKER_ID,LOCK_TTL):
+        # owned by a live worker, or a crashed one whose lock has not expired yet
+        job=await anyio.to_thread.run_sync(load_job,job_id)
+        if job and job.status in ("queued","running"):
+            schedule_import(job_id,LOCK_TTL)
+        return
+    job=await anyio.to_thread.run_sync(load_job,job_id)
+    # LLM usage of the job is accounted separately from the request that queued it
+    request_usage=start_request_usage("menu_import")
+    heartbeat=asyncio.create_task(_hold_lock(lock_name,asyncio.current_task()))
+    try:
+        if not job or job.status in ("completed","failed"):
+            return
+        if job.paused_until and job.paused_until>datetime.now(timezone.utc):
+            schedule_import(job_id,(job.paused_until-datetime.now(timezone.utc)).total_seconds())
+            return
+        # LLM calls of the job count against its owner's daily quota
+        set_quota_subject(f"user:{job.owner_uuid}")
+        # LLM calls of the job yield to interactive requests
+        set_llm_priority("batch")
+        job.status="running"
+        job.paused_until=None
+        job.error=None
+        await anyio.to_thread.run_sync(_save_job,job)
+
+        job.output_bytes=await anyio.to_thread.run_sync(_reset_results,job)
+
+        seen=set()
+        chunk:Dict[str,str]={}
+        rows_read=0
+        async for value in aiter_dish_names(source_path(job),job.source_format,job.column):
+            rows_read+=1
+            name=normalize_name(str(value)) if value is not None else ""
+            if rows_read<=job.rows_read:
+                # already processed before the checkpoint, only rebuild the dedupe set
+                seen.add(name)
+                continue
+            if not name:
+                job.rows_skipped+=1
+                continue
+            if name in seen:
+                job.duplicates_skipped+=1
+                continue
+            seen.add(name)
+            chunk[name]=str(value).strip()
+            if len(chunk)>=Config.IMPORT_CHUNK_SIZE:
+                await _process_chunk(job,chunk,rows_read)
+                chunk={}
+
+        await _process_chunk(job,chunk,rows_read)
+        job.status="completed"
+        await anyio.to_thread.run_sync(_save_job,job)
+        await global_logger.log_event(
+            data={
+                "message":"menu_import_completed",
+                "job_id":str(job_id),
+                "dishes_processed":job.dishes_processed,
+                "dishes_failed":job.dishes_failed,
+                **request_usage.summary(include_stages=False)
+            }
+        )
+    except asyncio.CancelledError:
+        # shutdown: the checkpoint on disk stays "running" and is resumed on next start
+        raise
+    except QuotaExceeded as e:
+        # progress since the last checkpoint is discarded, the import resumes there once the quota resets
+        paused=await anyio.to_thread.run_sync(load_job,job_id)
+        if paused:
+            paused.status="paused_quota"
+            paused.paused_until=next_quota_reset()
+            paused.error=str(e)
+            await anyio.to_thread.run_sync(_save_job,paused)
+            schedule_import(job_id,(paused.paused_until-datetime.now(timezone.utc)).total_seconds())
+        await global_logger.log_event(
+            data={
+                "message":"menu_import_paused_quota",
+                "job_id":str(job_id),
+                "dishes_processed":paused.dishes_processed if paused else None
+            }
+        )
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"error_running_menu_import",
+                "error":str(e),
+                "job_id":str(job_id)
+            },
+            level="error"
+        )
+        # progress since the last checkpoint is discarded, retry_import resumes from there
+        failed=await anyio.to_thread.run_sync(load_job,job_id)
+        if failed:
+            failed.status="failed"
+            failed.error=str(e)
+            await anyio.to_thread.run_sync(_save_job,failed)
+    finally:
+        heartbeat.cancel()
+        finish_request_usage(request_usage)
+        await release_lock(lock_name,WORKER_ID)
+
+
+def resume_imports()->None:
+    """ Restarts imports interrupted by a crash / shutdown (called at startup)"""
+    if not IMPORT_DIR.exists():
+        return
+    for checkpoint in IMPORT_DIR.glob("*/checkpoint.json"):
+        try:
+            job=ImportJob.model_validate_json(checkpoint.read_bytes())
+        except Exception:
+            continue
+        if job.status in ("queued","running","paused_quota"):
+            start_import(job.job_id)
+
+async def stop_imports()->None:
+    """ Cancels running and scheduled imports on shutdown, they resume from their checkpoints"""
+    tasks=list(_running_imports.values())+list(_scheduled_imports.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks,return_exceptions=True)
@@ -0,0 +1,234 @@
+from typing import Dict,List,Iterable
+from datetime import date
+import numpy as np
+from .schemas import (
+    AnalysisAdjustment,
+    MealPlanEntry,
+    MealPlanIngredientTotal,
+    MealPlanPeriodTotal,
+    MealPlanResponse,
+    StageFootprint,
+    DishMetrics,
+    DishIngredients,
+    Ingredient,
+    IngredientCarbonFootprint,
+    IngredientCarbonResponse,
+    DishCarbonAnalysisResponse
+)
+from .utils import normalize_name
+
+# life-cycle stages reported per ingredient, `<stage>_footprint_kg_co2e` on IngredientCarbonFootprint
+STAGES = ("farming", "packaging", "processing", "retail", "transportation")
+FOOTPRINT_FIELDS = ("carbon_footprint_kg_co2e",) + tuple(f"{stage}_footprint_kg_co2e" for stage in STAGES)
+
+# same rules the DISH_METRICS prompt asks the LLM to apply
+CAR_MILES_PER_KG_CO2E = 2.4
+IMPACT_RATING_UPPER_BOUNDS = ((0.5, "A"), (1.5, "B"), (2.5, "C"), (4.0, "D"))
+PRECISION = 4
+
+
+def impact_rating(carbon_kg: float) -> str:
+    """ A (very low) to E (very high) impact rating of a per serving CO2e"""
+    for upper_bound, rating in IMPACT_RATING_UPPER_BOUNDS:
+        if carbon_kg < upper_bound:
+            return rating
+    return "E"
+
+
+def scale_footprint(footprint: IngredientCarbonFootprint, factor: float) -> IngredientCarbonFootprint:
+    """ Footprint with every emission field multiplied by factor (e.g. per kg factor x weight)"""
+    return footprint.model_copy(update={
+        field: round(getattr(footprint, field) * factor, PRECISION) for field in FOOTPRINT_FIELDS
+    })
+
+
+def footprints_by_ingredient(lca: IngredientCarbonResponse) -> Dict[str, IngredientCarbonFootprint]:
+    """ LCA results keyed by normalized ingredient name"""
+    return {normalize_name(item.ingredient_name): item for item in lca.results}
+
+
+def per_kg_factors(ingredients: Iterable[Ingredient], lca: IngredientCarbonResponse) -> Dict[str, IngredientCarbonFootprint]:
+    """ Per kg emission factors derived from an analysis' per-weight LCA results"""
+    footprints = footprints_by_ingredient(lca)
+    factors = {}
+    for ingredient in ingredients:
+        name = normalize_name(ingredient.ingredient_name)
+        footprint = footprints.get(name)
+        if footprint and ingredient.ingredient_weight_kg > 0:
+            factors[name] = scale_footprint(footprint, 1 / ingredient.ingredient_weight_kg)
+    return factors
+
+
+def build_analysis(dish: str, ingredients: List[Ingredient], factors: Dict[str, IngredientCarbonFootprint],
+                   servings: float = 1) -> DishCarbonAnalysisResponse:
+    """
+    Computes a full analysis arithmetically from ingredient weights and per kg factors.
+    Weights describe the whole recipe, which yields `servings` servings.
+    Ingredients without a factor contribute no emissions: they are reported in
+    unmatched_ingredients and lower the estimation accuracy.
+    """
+    results = []
+    unmatched = []
+    for ingredient in ingredients:
+        factor = factors.get(normalize_name(ingredient.ingredient_name))
+        if factor:
+            results.append(scale_footprint(factor, ingredient.ingredient_weight_kg).model_copy(
+                update={"ingredient_name": ingredient.ingredient_name}
+            ))
+        else:
+            unmatched.append(ingredient.ingredient_name)
+
+    total_carbon = sum(item.carbon_footprint_kg_co2e for item in results)
+    total_weight_kg = sum(ingredient.ingredient_weight_kg for ingredient in ingredients)
+    carbon_per_serving = total_carbon / servings
+    # unmatched ingredients count with zero confidence
+    accuracy = sum(item.match_confidence for item in results) / len(ingredients) * 100 if ingredients else 0.0
+
+    metrics = DishMetrics(
+        dish=dish,
+        estimated_carbon_kg=round(carbon_per_serving, PRECISION),
+        serving_size_g=round(total_weight_kg * 1000 / servings, 2),
+        estimation_accuracy=round(accuracy, 2),
+        impact_rating=impact_rating(carbon_per_serving),
+        carbon_per_serving_kg=round(carbon_per_serving, PRECISION),
+        ingredient_count=len(ingredients),
+        car_miles_equivalent=round(carbon_per_serving * CAR_MILES_PER_KG_CO2E, 2)
+    )
+    return DishCarbonAnalysisResponse(
+        metrics=metrics,
+        ingredients=DishIngredients(dish=dish, ingredients=ingredients),
+        lca=IngredientCarbonResponse(results=results),
+        unmatched_ingredients=unmatched
+    )
+
+
+def edit_ingredients(ingredients: List[Ingredient], adjustment: AnalysisAdjustment) -> List[Ingredient]:
+    """
+    Per serving ingredient list after removals, weight overrides and additions.
+    Ingredients are merged on their normalized name: an added ingredient the dish already
+    contains adds its weight to the existing one.
+    Raises ValueError when an edit references an ingredient the dish does not contain.
+    """
+    present = {normalize_name(ingredient.ingredient_name) for ingredient in ingredients}
+    removed = {normalize_name(name) for name in adjustment.removed_ingredients}
+    overrides = {normalize_name(name): weight for name, weight in adjustment.weight_overrides.items()}
+    unknown = sorted((removed | overrides.keys()) - present)
+    if unknown:
+        raise ValueError(f"Ingredients not part of the dish: {', '.join(unknown)}")
+
+    edited: Dict[str, Ingredient] = {}
+
+    def merge(ingredient: Ingredient, weight_kg: float) -> None:
+        name = normalize_name(ingredient.ingredient_name)
+        if name in edited:
+            weight_kg += edited[name].ingredient_weight_kg
+            ingredient = edited[name]
+        edited[name] = Ingredient(ingredient_name=ingredient.ingredient_name, ingredient_weight_kg=round(weight_kg, PRECISION))
+
+    for ingredient in ingredients:
+        name = normalize_name(ingredient.ingredient_name)
+        if name not in removed:
+            merge(ingredient, overrides.get(name, ingredient.ingredient_weight_kg))
+    for ingredient in adjustment.added_ingredients:
+        merge(ingredient, ingredient.ingredient_weight_kg)
+    return list(edited.values())
+
+
+def scale_ingredients(ingredients: List[Ingredient], servings: float) -> List[Ingredient]:
+    """ Ingredient weights multiplied by the number of servings"""
+    return [
+        Ingredient(
+            ingredient_name=ingredient.ingredient_name,
+            ingredient_weight_kg=round(ingredient.ingredient_weight_kg * servings, PRECISION)
+        )
+        for ingredient in ingredients
+    ]
+
+
+def _iso_week(day: date) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _stage_footprint(row: np.ndarray) -> dict:
+    # row follows FOOTPRINT_FIELDS: total first, then one column per stage
+    values = {"carbon_kg": round(float(row[0]), PRECISION)}
+    values.update({f"{stage}_kg": round(float(value), PRECISION) for stage, value in zip(STAGES, row[1:])})
+    return values
+
+
+def aggregate_meal_plan(entries: List[MealPlanEntry], analyses: Dict[str, DishCarbonAnalysisResponse]) -> MealPlanResponse:
+    """
+    Per day, per ISO week, per stage and per ingredient totals of a meal plan.
+    Dish analyses are laid out once as dense (dish x stage) and (dish x ingredient) matrices,
+    the plan as a (day x dish) servings matrix, so every rollup is a single matrix product.
+    `analyses` holds the per serving analysis of each normalized dish name.
+    """
+    dish_index = {name: position for position, name in enumerate(analyses)}
+    ingredient_index: Dict[str, int] = {}
+    for analysis in analyses.values():
+        for ingredient in analysis.ingredients.ingredients:
+            ingredient_index.setdefault(normalize_name(ingredient.ingredient_name), len(ingredient_index))
+
+    stage_matrix = np.zeros((len(dish_index), len(FOOTPRINT_FIELDS)))
+    carbon_matrix = np.zeros((len(dish_index), len(ingredient_index)))
+    weight_matrix = np.zeros((len(dish_index), len(ingredient_index)))
+    for name, analysis in analyses.items():
+        row = dish_index[name]
+        footprints = footprints_by_ingredient(analysis.lca)
+        for ingredient in analysis.ingredients.ingredients:
+            column = ingredient_index[normalize_name(ingredient.ingredient_name)]
+            weight_matrix[row, column] += ingredient.ingredient_weight_kg
+            footprint = footprints.get(normalize_name(ingredient.ingredient_name))
+            if footprint:
+                carbon_matrix[row, column] += footprint.carbon_footprint_kg_co2e
+                stage_matrix[row] += [getattr(footprint, field) for field in FOOTPRINT_FIELDS]
+
+    resolved = [entry for entry in entries if normalize_name(entry.dish) in dish_index]
+    unresolved = sorted({entry.dish for entry in entries if normalize_name(entry.dish) not in dish_index})
+    days = sorted({entry.day for entry in resolved})
+    day_index = {day: position for position, day in enumerate(days)}
+
+    servings = np.zeros((len(days), len(dish_index)))
+    if resolved:
+        np.add.at(
+            servings,
+            (
+                np.fromiter((day_index[entry.day] for entry in resolved), dtype=np.intp, count=len(resolved)),
+                np.fromiter((dish_index[normalize_name(entry.dish)] for entry in resolved), dtype=np.intp, count=len(resolved))
+            ),
+            np.fromiter((entry.servings for entry in resolved), dtype=float, count=len(resolved))
+        )
+
+    day_totals = servings @ stage_matrix
+    week_of_day = [_iso_week(day) for day in days]
+    weeks = sorted(set(week_of_day))
+    week_index = {week: position for position, week in enumerate(weeks)}
+    week_totals = np.zeros((len(weeks), len(FOOTPRINT_FIELDS)))
+    np.add.at(week_totals, np.array([week_index[week] for week in week_of_day], dtype=np.intp), day_totals)
+
+    dish_servings = servings.sum(axis=0)
+    ingredient_carbon = dish_servings @ carbon_matrix
+    ingredient_weight = dish_servings @ weight_matrix
+    ingredient_names = list(ingredient_index)
+
+    return MealPlanResponse(
+        total=StageFootprint(**_stage_footprint(day_totals.sum(axis=0))),
+        days=[
+            MealPlanPeriodTotal(period=day.isoformat(), **_stage_footprint(day_totals[position]))
+            for position, day in enumerate(days)
+        ],
+        weeks=[
+            MealPlanPeriodTotal(period=week, **_stage_footprint(week_totals[position]))
+            for position, week in enumerate(weeks)
+        ],
+        ingredients=[
+            MealPlanIngredientTotal(
+                ingredient_name=ingredient_names[column],
+                weight_kg=round(float(ingredient_weight[column]), PRECISION),
+                carbon_kg=round(float(ingredient_carbon[column]), PRECISION)
+            )
+            for column in np.argsort(-ingredient_carbon, kind="stable")
+        ],
+        unresolved_dishes=unresolved
+    )
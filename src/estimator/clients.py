@@ -13,6 +13,11 @@ class LLMBuilderFactory:
 
     _cache: Dict[Tuple[str, str, int], BaseChatModel] = {}
 
+    DEFAULT_MODELS: Dict[str, str] = {
+        "openai": "gpt-4o-mini",
+        "gemini": "gemini-2.5-flash"
+    }
+
     @staticmethod
     def get_llm_client(
         provider: Literal["openai", "gemini"],
@@ -32,16 +37,10 @@ class LLMBuilderFactory:
         Returns:
             A configured and cached BaseChatModel instance.
         """
-        # Define defaults
-        default_models = {
-            "openai": "gpt-4o-mini",
-            "gemini": "gemini-2.5-flash"
-        }
-
-        if provider not in default_models:
+        if provider not in LLMBuilderFactory.DEFAULT_MODELS:
             raise ValueError(f"Unsupported provider: {provider}")
 
-        final_model_name = model_name or default_models[provider]
+        final_model_name = model_name or LLMBuilderFactory.DEFAULT_MODELS[provider]
         cache_key = (provider, final_model_name, max_tokens)
 
         if cache_key in LLMBuilderFactory._cache:
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from typing import Dict,List
+from .schemas import IngredientCarbonFootprint
+from src.db.redis_client import ingredient_factors_in_cache,add_ingredient_factors
+from src.logging.logger import global_logger
+from src.utils.metrics import record_cache_lookup
+
+"""
+Per kg ingredient emission factors (an IngredientCarbonFootprint describing 1 kg of the ingredient),
+looked up in a bounded per-worker table first and in the shared redis cache second.
+"""
+
+LOCAL_FACTOR_TABLE_SIZE = 5000
+
+_local_factors: "OrderedDict[str, IngredientCarbonFootprint]" = OrderedDict()
+
+
+def _remember(name: str, factor: IngredientCarbonFootprint) -> None:
+    _local_factors[name] = factor
+    _local_factors.move_to_end(name)
+    if len(_local_factors) > LOCAL_FACTOR_TABLE_SIZE:
+        _local_factors.popitem(last=False)
+
+
+async def cached_ingredient_factors(names: List[str]) -> Dict[str, IngredientCarbonFootprint]:
+    """ Known factors for the given normalized names, in a single redis round trip for local misses"""
+    factors = {}
+    missing = []
+    for name in names:
+        factor = _local_factors.get(name)
+        if factor:
+            _local_factors.move_to_end(name)
+            factors[name] = factor
+        else:
+            missing.append(name)
+
+    if missing:
+        for name, raw in (await ingredient_factors_in_cache(missing)).items():
+            factor = IngredientCarbonFootprint.model_validate_json(raw)
+            _remember(name, factor)
+            factors[name] = factor
+    record_cache_lookup("ingredient", hits=len(factors), misses=len(names) - len(factors))
+    return factors
+
+
+async def store_ingredient_factors(factors: Dict[str, IngredientCarbonFootprint]) -> None:
+    """ Saves factors keyed by normalized name locally and in redis (best effort, errors are logged)"""
+    if not factors:
+        return
+    for name, factor in factors.items():
+        _remember(name, factor)
+    try:
+        await add_ingredient_factors({
+            name: factor.model_dump_json().encode("utf-8") for name, factor in factors.items()
+        })
+    except Exception as e:
+        # only a cache: the analysis that produced the factors must not fail over it
+        await global_logger.log_event(
+            data={
+                "message": "error_storing_ingredient_factors",
+                "error": str(e),
+                "ingredients": len(factors)
+            },
+            level="error"
+        )
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime,timedelta,timezone
+from pathlib import Path
+from typing import Dict,List,Optional,Tuple
+from uuid import UUID
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlmodel import select
+from sqlalchemy import func,tuple_
+from .models import DishAnalysis
+from .schemas import DishCarbonAnalysisResponse
+from .calculator import FOOTPRINT_FIELDS,footprints_by_ingredient
+from .utils import normalize_name
+from src.constants.config import Config
+from src.db.pg_sql_client import engine,background_session
+
+"""
+Columnar export of the dish analysis catalogue (dish_analyses) for analytics.
+
+    python -m src.estimator.export [--output-dir exports] [--incremental] [--batch-size 1000]
+
+Rows are streamed from Postgres with a server side cursor (yield_per) and every fetched batch
+is flattened into Arrow columns and written as one Parquet row group, so memory stays flat
+whatever the catalogue size. Each run adds one part file to two datasets:
+
+    <output_dir>/dishes/part-<run>.parquet       one row per dish (metrics)
+    <output_dir>/ingredients/part-<run>.parquet  one row per ingredient (weight + stage footprints)
+
+--incremental only exports analyses updated since the previous run (watermark kept in
+<output_dir>/export_state.json), so a re-estimated dish can appear in several parts:
+readers keep the row with the latest updated_at per analysis_id.
+"""
+
+STATE_FILE="export_state.json"
+# rows newer than this are left to the next run, their transactions may still be committing
+SETTLE_INTERVAL=timedelta(minutes=1)
+
+TIMESTAMP=pa.timestamp("us",tz="UTC")
+DISH_SCHEMA=pa.schema([
+    ("analysis_id",pa.string()),
+    ("normalized_name",pa.string()),
+    ("dish",pa.string()),
+    ("model_name",pa.string()),
+    ("prompt_version",pa.string()),
+    ("estimated_carbon_kg",pa.float64()),
+    ("carbon_per_serving_kg",pa.float64()),
+    ("serving_size_g",pa.float64()),
+    ("estimation_accuracy",pa.float64()),
+    ("impact_rating",pa.string()),
+    ("ingredient_count",pa.int32()),
+    ("car_miles_equivalent",pa.float64()),
+    ("created_at",TIMESTAMP),
+    ("updated_at",TIMESTAMP)
+])
+INGREDIENT_SCHEMA=pa.schema(
+    [
+        ("analysis_id",pa.string()),
+        ("normalized_name",pa.string()),
+        ("ingredient_name",pa.string()),
+        ("matched_ingredient",pa.string()),
+        ("ingredient_weight_kg",pa.float64())
+    ]
+    +[(field,pa.float64()) for field in FOOTPRINT_FIELDS]
+    +[
+        ("match_confidence",pa.float64()),
+        ("matched",pa.bool_()),
+        ("lca_source",pa.string()),
+        ("updated_at",TIMESTAMP)
+    ]
+)
+DISH_METRIC_FIELDS=[field for field in DISH_SCHEMA.names if field not in ("analysis_id","normalized_name","model_name","prompt_version","created_at","updated_at")]
+
+
+def load_state(output_dir:Path)->Optional[Tuple[datetime,UUID]]:
+    """ (updated_at, id) of the last exported analysis, None before the first run"""
+    path=output_dir/STATE_FILE
+    if not path.exists():
+        return None
+    state=json.loads(path.read_text())
+    return datetime.fromisoformat(state["updated_at"]),UUID(state["analysis_id"])
+
+def save_state(output_dir:Path,watermark:Tuple[datetime,UUID])->None:
+    path=output_dir/STATE_FILE
+    tmp=path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"updated_at":watermark[0].isoformat(),"analysis_id":str(watermark[1])}))
+    os.replace(tmp,path)
+
+
+def flatten(records:List[DishAnalysis])->Tuple[pa.Table,pa.Table]:
+    """ Dish and ingredient tables of a batch of stored analyses"""
+    dishes:Dict[str,list]={name:[] for name in DISH_SCHEMA.names}
+    ingredients:Dict[str,list]={name:[] for name in INGREDIENT_SCHEMA.names}
+    for record in records:
+        analysis=DishCarbonAnalysisResponse.model_validate(record.payload)
+        analysis_id=str(record.id)
+
+        dishes["analysis_id"].append(analysis_id)
+        dishes["normalized_name"].append(record.normalized_name)
+        dishes["model_name"].append(record.model_name)
+        dishes["prompt_version"].append(record.prompt_version)
+        dishes["created_at"].append(record.created_at)
+        dishes["updated_at"].append(record.updated_at)
+        for field in DISH_METRIC_FIELDS:
+            dishes[field].append(getattr(analysis.metrics,field))
+
+        footprints=footprints_by_ingredient(analysis.lca)
+        for ingredient in analysis.ingredients.ingredients:
+            footprint=footprints.get(normalize_name(ingredient.ingredient_name))
+            ingredients["analysis_id"].append(analysis_id)
+            ingredients["normalized_name"].append(record.normalized_name)
+            ingredients["ingredient_name"].append(ingredient.ingredient_name)
+            ingredients["ingredient_weight_kg"].append(ingredient.ingredient_weight_kg)
+            ingredients["matched_ingredient"].append(footprint.matched_ingredient if footprint else None)
+            for field in FOOTPRINT_FIELDS+("match_confidence","matched","lca_source"):
+                ingredients[field].append(getattr(footprint,field) if footprint else None)
+            ingredients["updated_at"].append(record.updated_at)
+
+    return (
+        pa.Table.from_pydict(dishes,schema=DISH_SCHEMA),
+        pa.Table.from_pydict(ingredients,schema=INGREDIENT_SCHEMA)
+    )
+
+
+async def export_analyses(output_dir:Path,incremental:bool=False,batch_size:int=1000)->Dict[str,int]:
+    """ Writes one part file per dataset, returns the exported row counts"""
+    run_id=datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    targets={name:output_dir/name/f"part-{run_id}.parquet" for name in ("dishes","ingredients")}
+    for path in targets.values():
+        path.parent.mkdir(parents=True,exist_ok=True)
+    # written under a temporary name, published only once the run completes
+    pending={name:path.with_suffix(".parquet.tmp") for name,path in targets.items()}
+    writers={
+        "dishes":pq.ParquetWriter(pending["dishes"],DISH_SCHEMA,compression="zstd"),
+        "ingredients":pq.ParquetWriter(pending["ingredients"],INGREDIENT_SCHEMA,compression="zstd")
+    }
+    counts={"dishes":0,"ingredients":0}
+    watermark=load_state(output_dir) if incremental else None
+    last_exported=None
+    try:
+        async with background_session() as session:
+            cutoff=(await session.exec(select(func.now()))).one()-SETTLE_INTERVAL
+            statement=select(DishAnalysis).where(DishAnalysis.updated_at<=cutoff)
+            if watermark:
+                statement=statement.where(tuple_(DishAnalysis.updated_at,DishAnalysis.id)>watermark)
+            statement=statement.order_by(DishAnalysis.updated_at,DishAnalysis.id).execution_options(yield_per=batch_size)
+
+            result=await session.stream_scalars(statement)
+            async for records in result.partitions():
+                dish_table,ingredient_table=flatten(records)
+                # one row group per fetched batch
+                writers["dishes"].write_table(dish_table)
+                writers["ingredients"].write_table(ingredient_table)
+                counts["dishes"]+=dish_table.num_rows
+                counts["ingredients"]+=ingredient_table.num_rows
+                last_exported=(records[-1].updated_at,records[-1].id)
+    except BaseException:
+        for name,writer in writers.items():
+            writer.close()
+            pending[name].unlink(missing_ok=True)
+        raise
+
+    for name,writer in writers.items():
+        writer.close()
+        if counts["dishes"]:
+            os.replace(pending[name],targets[name])
+        else:
+            # nothing changed since the last run, no empty part files
+            pending[name].unlink()
+    if last_exported:
+        save_state(output_dir,last_exported)
+    return counts
+
+
+async def main()->None:
+    parser=argparse.ArgumentParser(description="Export stored dish analyses to Parquet")
+    parser.add_argument("--output-dir",default=Config.EXPORT_DIR)
+    parser.add_argument("--incremental",action="store_true",help="only analyses updated since the last run")
+    parser.add_argument("--batch-size",type=int,default=Config.EXPORT_BATCH_SIZE,help="dishes per fetch / row group")
+    args=parser.parse_args()
+    try:
+        counts=await export_analyses(Path(args.output_dir),incremental=args.incremental,batch_size=args.batch_size)
+        print(f"exported {counts['dishes']} dishes, {counts['ingredients']} ingredients to {args.output_dir}")
+    finally:
+        await engine.dispose()
+
+
+if __name__=="__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+from .models import DishAnalysis,EstimationHistory
+from .schemas import EstimationHistoryItem
+from .analysis_service import UNKNOWN_MODEL,dish_analysis_service,wait_for_analysis_write
+from .prompt_templates import PROMPT_VERSION
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import select,insert,literal,tuple_
+import sqlalchemy.dialects.postgresql as pg
+from typing import Optional,List,Tuple
+from datetime import datetime
+from uuid import UUID
+from src.db.pg_sql_client import background_session
+from src.db.redis_client import dish_in_cache
+from src.logging.logger import global_logger
+
+
+def history_page_statement(user_uuid:UUID,limit:int,cursor:Optional[Tuple[datetime,int]]):
+    """ Keyset page query of a user's history (newest first), served by ix_estimation_history_user_keyset"""
+    metrics=DishAnalysis.payload["metrics"]
+    statement=select(
+        EstimationHistory.id,
+        EstimationHistory.dish_name,
+        EstimationHistory.source,
+        EstimationHistory.created_at,
+        EstimationHistory.analysis_id,
+        DishAnalysis.normalized_name,
+        metrics["impact_rating"].astext.label("impact_rating"),
+        metrics["carbon_per_serving_kg"].astext.label("carbon_per_serving_kg")
+    ).join(
+        DishAnalysis,DishAnalysis.id==EstimationHistory.analysis_id
+    ).where(
+        EstimationHistory.user_uuid==user_uuid
+    )
+    if cursor:
+        statement=statement.where(
+            tuple_(EstimationHistory.created_at,EstimationHistory.id)<tuple_(*cursor)
+        )
+    return statement.order_by(
+        EstimationHistory.created_at.desc(),
+        EstimationHistory.id.desc()
+    ).limit(limit)
+
+
+class EstimationHistoryService:
+
+    async def add_entry(self,user_uuid:UUID,normalized_name:str,dish_name:str,source:str,session:AsyncSession)->bool:
+        """ Inserts a history entry referencing the shared analysis of normalized_name, False if no analysis is stored"""
+        try:
+            analysis_ids=select(
+                literal(user_uuid,pg.UUID(as_uuid=True)),
+                DishAnalysis.id,
+                literal(dish_name),
+                literal(source)
+            ).where(DishAnalysis.normalized_name==normalized_name)
+            statement=insert(EstimationHistory).from_select(
+                ["user_uuid","analysis_id","dish_name","source"],
+                analysis_ids
+            )
+            result=await session.execute(statement)
+            await session.commit()
+            return result.rowcount>0
+        except Exception as e:
+            await session.rollback()
+            await global_logger.log_event(
+                data={
+                    "message":"error_adding_estimation_history",
+                    "error":str(e),
+                    "user_uuid":str(user_uuid),
+                    "normalized_name":normalized_name
+                },
+                level="error"
+            )
+            raise
+
+    async def list_entries(self,user_uuid:UUID,limit:int,cursor:Optional[Tuple[datetime,int]],
+                           session:AsyncSession)->Tuple[List[EstimationHistoryItem],bool]:
+        """ One keyset page of a user's history (newest first) and whether more entries follow"""
+        try:
+            # one extra row tells whether another page follows
+            statement=history_page_statement(user_uuid,limit+1,cursor)
+            result=await session.execute(statement)
+            rows=result.all()
+            items=[EstimationHistoryItem(**row._asdict()) for row in rows[:limit]]
+            return items,len(rows)>limit
+        except Exception as e:
+            await global_logger.log_event(
+                data={
+                    "message":"error_listing_estimation_history",
+                    "error":str(e),
+                    "user_uuid":str(user_uuid)
+                },
+                level="error"
+            )
+            raise
+
+
+history_service=EstimationHistoryService()
+
+async def record_estimation(user_uuid:UUID,dish_name:str,normalized_name:str,source:str,
+                            model_name:Optional[str]=None)->None:
+    """
+        Background task writing a user's history entry after an estimate has been served.
+        model_name: the model that produced the analysis in this request, None if it was already known
+    """
+    try:
+        # a fresh analysis may still be in this worker's write-behind queue
+        await wait_for_analysis_write(normalized_name)
+        async with background_session() as session:
+            added=await history_service.add_entry(
+                user_uuid=user_uuid,
+                normalized_name=normalized_name,
+                dish_name=dish_name,
+                source=source,
+                session=session
+            )
+            if added:
+                return
+            # analysis so far only lives in redis (e.g. cached by another worker), persist it first
+            analysis=await dish_in_cache(dish_name=normalized_name)
+            if not analysis:
+                return
+            await dish_analysis_service.upsert_analysis(
+                normalized_name=normalized_name,
+                analysis=analysis,
+                model_name=model_name or UNKNOWN_MODEL,
+                prompt_version=PROMPT_VERSION,
+                session=session,
+                # a worker that knows the model may have stored it meanwhile
+                overwrite=model_name is not None
+            )
+            await history_service.add_entry(
+                user_uuid=user_uuid,
+                normalized_name=normalized_name,
+                dish_name=dish_name,
+                source=source,
+                session=session
+            )
+    except Exception:
+        # already logged by the services, history must never fail the request
+        pass
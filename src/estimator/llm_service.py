@@ -4,7 +4,7 @@ from datetime import datetime, timezone
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain.schema.runnable import RunnableParallel, RunnableLambda, RunnableSequence
-from .schemas import DishMetrics,DishIngredients,IngredientCarbonResponse,DishCarbonAnalysisResponse,FoodItem
+from .schemas import DishMetrics,DishIngredients,IngredientCarbonResponse,DishCarbonAnalysisResponse,FoodItem,Ingredient,IngredientCarbonFootprint
 from .clients import LLMBuilderFactory
 from .prompt_templates import (
     DISH_METRICS_SYSTEM_PROMPT,
@@ -14,19 +14,74 @@ from .prompt_templates import (
     DISH_LCA_DATA_SYSTEM_PROMPT,
     DISH_LCA_DATA_USER_PROMPT,
     DISH_IMAGE_RECOGNITION_SYSTEM_PROMPT,
-    DISH_IMAGE_RECOGNITION_USER_PROMPT
+    DISH_IMAGE_RECOGNITION_USER_PROMPT,
+    PROMPT_VERSION
 )
 from src.logging.logger import global_logger
-from src.db.redis_client import dish_in_cache,add_dish_carbon_foot_print_analysis
+from src.db.redis_client import dish_in_cache,dishes_in_cache,add_dish_carbon_foot_print_analysis
+from .utils import normalize_name,render_dish_response
+from .analysis_service import stored_analysis,stored_analyses,schedule_analysis_write,pipeline_model_name
+from .emission_factors import cached_ingredient_factors,store_ingredient_factors
+from .calculator import per_kg_factors
+from .usage import StageUsageCallback,record_stage_usage,mark_cache_outcome
+from .quota import reserve_quota_call,record_quota_tokens
+from .admission import admission,record_provider_call
+from .scheduler import scheduler
+from src.utils.errors import CustomException
+from src.utils.metrics import LLM_STAGE_DURATION,LLM_ERRORS,LLM_TOKENS,LLM_COST,record_cache_lookup
+from src.utils.tracing import tracer
+from opentelemetry.trace import Status,StatusCode
+from typing import Dict,List
 import asyncio
 
+# cache-miss dishes of one batch estimated concurrently
+BATCH_ESTIMATION_CONCURRENCY=4
+
 
 class LLMService:
+    @staticmethod
+    async def _invoke(stage: str, chain, inputs: dict):
+        """
+            Runs one pipeline stage, recording its tokens, model and latency on the current request.
+            Returns (result, name of the model that answered, None if the provider did not report it)
+        """
+        # raises QuotaExceeded before anything is spent
+        quota_key = await reserve_quota_call()
+        callback = StageUsageCallback(stage)
+        with tracer.start_as_current_span(f"llm.{stage}", record_exception=False) as span:
+            async with scheduler.slot() as priority:
+                span.set_attribute("llm.priority", priority)
+                # measured from the slot, queue waits are reported by the scheduler
+                start_time = time.perf_counter()
+                try:
+                    result = await chain.ainvoke(inputs, config={"callbacks": [callback], "run_name": stage})
+                    return result, callback.usage.model_name
+                except Exception as e:
+                    callback.usage.failed = True
+                    LLM_ERRORS.labels(stage, type(e).__name__).inc()
+                    span.set_status(Status(StatusCode.ERROR, type(e).__name__))
+                    raise
+                finally:
+                    usage = callback.usage
+                    usage.duration_sec = time.perf_counter() - start_time
+                    record_stage_usage(usage)
+                    record_provider_call(usage.failed)
+                    await record_quota_tokens(quota_key, usage.input_tokens + usage.output_tokens)
+                    LLM_STAGE_DURATION.labels(stage, "error" if usage.failed else "ok").observe(usage.duration_sec)
+                    if usage.model_name:
+                        LLM_TOKENS.labels(stage, usage.model_name, "input").inc(usage.input_tokens)
+                        LLM_TOKENS.labels(stage, usage.model_name, "output").inc(usage.output_tokens)
+                        LLM_COST.labels(stage, usage.model_name).inc(usage.cost_usd)
+                    if span.is_recording():
+                        span.set_attribute("llm.model", usage.model_name or "")
+                        span.set_attribute("llm.input_tokens", usage.input_tokens)
+                        span.set_attribute("llm.output_tokens", usage.output_tokens)
+
     @staticmethod
     async def estimate_dish_metrics(dish_name: str):
         """
         Get estimated environmental impact metrics for a dish.
-        Returns DishMetrics pydantic model or empty {} if invalid dish.
+        Returns (DishMetrics pydantic model or None if invalid dish, model name).
         """
         start_time = time.time()
         start_timestamp = datetime.now(timezone.utc).isoformat()
@@ -41,13 +96,15 @@ class LLMService:
             llm = llm.with_structured_output(DishMetrics)  # direct binding with Pydantic
 
             chain = prompt | llm
-            result = await chain.ainvoke({"dish_name": dish_name})
+            result, model_name = await LLMService._invoke("dish_metrics", chain, {"dish_name": dish_name})
             end_time = time.time()
             duration = round(end_time - start_time, 2)
             if not result or not result.model_dump(exclude_none=True):
-                return None 
-            return result 
+                return None, model_name
+            return result, model_name
 
+        except CustomException:
+            raise
         except Exception as e:
             end_time = time.time()
             duration = round(end_time - start_time, 2)
@@ -62,13 +119,13 @@ class LLMService:
                 },
                 level="error",
             )
-            return None
+            return None, None
     
     @staticmethod
     async def extract_dish_ingredients(dish_name: str):
         """ 
             Get List of ingredients for dish per serving.
-            Returns DishIngredients pydantic model or empty {} if invalid dish.
+            Returns (DishIngredients pydantic model or None if invalid dish, model name).
         """
         start_time = time.time()
         start_timestamp = datetime.now(timezone.utc).isoformat()
@@ -83,15 +140,17 @@ class LLMService:
             llm=llm.with_structured_output(DishIngredients)
             
             chain = prompt | llm
-            result = await chain.ainvoke({"dish_name": dish_name})
+            result, model_name = await LLMService._invoke("dish_ingredients", chain, {"dish_name": dish_name})
             end_time = time.time()
             duration = round(end_time - start_time, 2)
 
             if not result or not result.ingredients:
-                return None
+                return None, model_name
 
-            return result  
+            return result, model_name
 
+        except CustomException:
+            raise
         except Exception as e:
             end_time = time.time()
             duration = round(end_time - start_time, 2)
@@ -106,13 +165,13 @@ class LLMService:
                 },
                 level="error",
             )
-            return None
+            return None, None
     
     @staticmethod
-    async def extract_ingredient_lca(ingredients: list[str]):
+    async def extract_ingredient_lca(ingredients: list[Ingredient]):
         """ 
             Get estimated carbon footprint metrics for a list of ingredients.
-            Returns IngredientCarbonResponse pydantic model or empty {} if invalid.
+            Returns (IngredientCarbonResponse pydantic model or None if invalid, model name).
         """
         start_time = time.time()
         start_timestamp = datetime.now(timezone.utc).isoformat()
@@ -127,15 +186,17 @@ class LLMService:
             llm = llm.with_structured_output(IngredientCarbonResponse)
             
             chain = prompt | llm
-            result = await chain.ainvoke({"ingredients": ingredients})
+            result, model_name = await LLMService._invoke("ingredient_lca", chain, {"ingredients": ingredients})
 
             end_time = time.time()
             duration = round(end_time - start_time, 2)
             if not result or not result.results:
-                return None
+                return None, model_name
 
-            return result  
+            return result, model_name
 
+        except CustomException:
+            raise
         except Exception as e:
             end_time = time.time()
             duration = round(end_time - start_time, 2)
@@ -150,46 +211,164 @@ class LLMService:
                 },
                 level="error",
             )
+            return None, None
+    
+    @staticmethod
+    async def resolve_ingredient_factors(ingredient_names: List[str]) -> Dict[str, IngredientCarbonFootprint]:
+        """
+            Per kg emission factors keyed by normalized ingredient name.
+            Served from the ingredient cache, only unknown names go to extract_ingredient_lca.
+            Names the LLM cannot recognise are left out.
+        """
+        names=list(dict.fromkeys(normalize_name(name) for name in ingredient_names))
+        factors=await cached_ingredient_factors(names)
+        unknown=[name for name in names if name not in factors]
+        if not unknown:
+            return factors
+        
+        # 1 kg each, so the returned footprints are the per kg factors themselves
+        async with admission.admit():
+            lca,_=await LLMService.extract_ingredient_lca(
+                [Ingredient(ingredient_name=name,ingredient_weight_kg=1.0) for name in unknown]
+            )
+        if lca:
+            learned={
+                normalize_name(item.ingredient_name):item for item in lca.results
+                if normalize_name(item.ingredient_name) in unknown
+            }
+            await store_ingredient_factors(learned)
+            factors.update(learned)
+        return factors
+    
+    @staticmethod
+    async def lookup_analysis(normalized_name: str,cache_checked: bool=False,store_checked: bool=False):
+        """
+            Already known analysis of a dish, without any LLM call:
+            redis cache first, then the durable store (re-populating the cache on a hit).
+            cache_checked / store_checked: the caller already missed that tier, skip it.
+            Returns DishCarbonAnalysisResponse or None
+        """
+        if not cache_checked:
+            result=await dish_in_cache(dish_name=normalized_name)
+            if result:
+                mark_cache_outcome("hit")
+                return result
+        if store_checked:
             return None
+        
+        result=await stored_analysis(normalized_name=normalized_name,prompt_version=PROMPT_VERSION)
+        if result:
+            mark_cache_outcome("stored")
+            await add_dish_carbon_foot_print_analysis(dish_name=normalized_name,body=render_dish_response(result))
+        return result
     
     @staticmethod
-    async def estimate_dish_carbon_foot_print_analysis(dish_name: str):
+    async def known_analyses(dish_names: List[str]) -> Dict[str, DishCarbonAnalysisResponse]:
+        """
+            Already known analyses of many dishes keyed by normalized name, without any LLM call:
+            one MGET for the redis cache, then one query for the durable store.
+        """
+        names=list(dict.fromkeys(normalize_name(name) for name in dish_names))
+        analyses=await dishes_in_cache(names)
+        if analyses:
+            mark_cache_outcome("hit")
+        
+        missing=[name for name in names if name not in analyses]
+        if missing:
+            stored=await stored_analyses(normalized_names=missing,prompt_version=PROMPT_VERSION)
+            if stored:
+                mark_cache_outcome("stored")
+            analyses.update(stored)
+            for name,analysis in stored.items():
+                await add_dish_carbon_foot_print_analysis(dish_name=name,body=render_dish_response(analysis))
+        return analyses
+    
+    @staticmethod
+    async def resolve_analyses(dish_names: List[str]) -> Dict[str, DishCarbonAnalysisResponse]:
+        """
+            Analyses of many dishes keyed by normalized name: known_analyses, then the full LLM
+            pipeline (bounded concurrency) only for dishes never seen before. Invalid dishes are left out.
+        """
+        names=list(dict.fromkeys(normalize_name(name) for name in dish_names))
+        analyses=await LLMService.known_analyses(names)
+        missing=[name for name in names if name not in analyses]
+        if missing:
+            semaphore=asyncio.Semaphore(BATCH_ESTIMATION_CONCURRENCY)
+            
+            async def estimate(name:str):
+                async with semaphore:
+                    # known_analyses already missed both tiers for these dishes
+                    return name,await LLMService.estimate_dish_carbon_foot_print_analysis(
+                        name,cache_checked=True,store_checked=True
+                    )
+            
+            tasks=[asyncio.create_task(estimate(name)) for name in missing]
+            try:
+                results=await asyncio.gather(*tasks)
+            except BaseException:
+                # a quota / overload error ends the batch, stop the pipelines still running
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks,return_exceptions=True)
+                raise
+            for name,estimated in results:
+                if estimated:
+                    analyses[name]=estimated[0]
+        return analyses
+    
+    @staticmethod
+    async def estimate_dish_carbon_foot_print_analysis(dish_name: str,cache_checked: bool=False,
+                                                       store_checked: bool=False):
         """
             Takes Dish_name as input to estimate dish CarbonFootPrint analysis
-        Returns dict with:
-            {
-                "metrics": DishMetrics,
-                "ingredients": DishIngredients,
-                "lca": IngredientCarbonResponse
-            }
+            Lookup chain: Redis -> Postgres (read-through) -> LLM (write-behind to both)
+            cache_checked / store_checked: the caller already missed that tier, skip the lookup
+        Returns (DishCarbonAnalysisResponse, model name) or None if invalid dish.
+        The model name is the one recorded for a fresh analysis, None when it was already known.
         """
         start_time = time.time()
         start_timestamp = datetime.now(timezone.utc).isoformat()
 
         try:
-            # first check in the cache 
-            result=await dish_in_cache(dish_name=dish_name.lower())
-            if result:
-                return result
-            
-            metrics, ingredients = await asyncio.gather(
-                LLMService.estimate_dish_metrics(dish_name),
-                LLMService.extract_dish_ingredients(dish_name)
+            normalized_name=normalize_name(dish_name)
+            result=await LLMService.lookup_analysis(
+                normalized_name,cache_checked=cache_checked,store_checked=store_checked
             )
+            if result:
+                return result, None
             
-            lca = None
-            if ingredients and ingredients.ingredients:
-                lca = await LLMService.extract_ingredient_lca(ingredients.ingredients)
+            mark_cache_outcome("miss")
+            # only cache misses take an admission slot, see admission.py
+            async with admission.admit():
+                (metrics, metrics_model), (ingredients, ingredients_model) = await asyncio.gather(
+                    LLMService.estimate_dish_metrics(dish_name),
+                    LLMService.extract_dish_ingredients(dish_name)
+                )
+                
+                lca, lca_model = None, None
+                if ingredients and ingredients.ingredients:
+                    lca, lca_model = await LLMService.extract_ingredient_lca(ingredients.ingredients)
 
             if not (metrics and ingredients and lca):
                 return None
 
             duration = round(time.time() - start_time, 2)
             final_result=DishCarbonAnalysisResponse(metrics=metrics, ingredients=ingredients, lca=lca)
-            # store in cache 
-            await add_dish_carbon_foot_print_analysis(dish_name=dish_name.lower(),value=final_result.model_dump())
-            return final_result
+            model_name=pipeline_model_name(metrics_model, ingredients_model, lca_model)
+            # store in cache and (write-behind) in the durable store
+            await add_dish_carbon_foot_print_analysis(dish_name=normalized_name,body=render_dish_response(final_result))
+            schedule_analysis_write(
+                normalized_name=normalized_name,
+                analysis=final_result,
+                model_name=model_name,
+                prompt_version=PROMPT_VERSION
+            )
+            # every analysis teaches us per kg factors for custom recipes
+            await store_ingredient_factors(per_kg_factors(ingredients.ingredients,lca))
+            return final_result, model_name
 
+        except CustomException:
+            raise
         except Exception as e:
             duration = round(time.time() - start_time, 2)
             await global_logger.log_event(
@@ -210,7 +389,7 @@ class LLMService:
     async def detect_dish_from_image(image_b64: str):
         """
         Detect dish/food name from an uploaded image.
-        Returns DishName pydantic model with `dish_name` field.
+        Returns (FoodItem pydantic model with `dish_name` field or None, model name).
         """
         start_time = time.time()
         start_timestamp = datetime.now(timezone.utc).isoformat()
@@ -228,13 +407,15 @@ class LLMService:
             llm = llm.with_structured_output(FoodItem)  
 
             chain = prompt | llm
-            result =await chain.ainvoke({})  
+            result, model_name = await LLMService._invoke("image_detection", chain, {})
             end_time = time.time()
             duration = round(end_time - start_time, 2)
             if not result or not result.model_dump(exclude_none=True):
-                return None 
-            return result 
+                return None, model_name
+            return result, model_name
 
+        except CustomException:
+            raise
         except Exception as e:
             end_time = time.time()
             duration = round(end_time - start_time, 2)
@@ -248,20 +429,21 @@ class LLMService:
                 },
                 level="error",
             )
-            return None
+            return None, None
         
     @staticmethod
     async def analyze_dish_carbon_from_image(image_b64: str):
         """
         Full pipeline with caching:
-        1. Check if dish carbon result is cached
-        2. If not, detect dish from image
-        3. If dish not detected → return None
-        4. If detected dish is cached → return cached result
-        5. Otherwise → estimate carbon + cache it
+        1. Detect dish from image
+        2. If dish not detected → return None
+        3. If detected dish is cached → return cached result
+        4. Otherwise → estimate carbon + cache it
+        Returns (detected dish_name, DishCarbonAnalysisResponse, model name) or None
         """
         try:
-            detected = await LLMService.detect_dish_from_image(image_b64=image_b64)
+            async with admission.admit():
+                detected, _ = await LLMService.detect_dish_from_image(image_b64=image_b64)
             if not detected or not getattr(detected, "dish_name", None):
                 return None
 
@@ -269,15 +451,19 @@ class LLMService:
 
             if not dish_name:
                 return None 
-            cached_dish_result=await dish_in_cache(dish_name=dish_name.lower())
+            cached_dish_result=await dish_in_cache(dish_name=normalize_name(dish_name))
+            record_cache_lookup("image", hits=int(cached_dish_result is not None), misses=int(cached_dish_result is None))
             
             if cached_dish_result:
-                return cached_dish_result
+                mark_cache_outcome("hit")
+                return dish_name, cached_dish_result, None
 
-            result = await LLMService.estimate_dish_carbon_foot_print_analysis(dish_name)
+            estimated = await LLMService.estimate_dish_carbon_foot_print_analysis(dish_name,cache_checked=True)
             
-            return result
+            return (dish_name, *estimated) if estimated else None
 
+        except CustomException:
+            raise
         except Exception as e:
             await global_logger.log_event(
                 {
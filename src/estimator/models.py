@@ -0,0 +1,84 @@
+from sqlmodel import SQLModel,Field,Column
+import sqlalchemy.dialects.postgresql as pg 
+from datetime import datetime 
+from uuid import UUID,uuid4 
+from sqlalchemy import func,ForeignKey,Index
+
+
+""" 
+Class DishAnalysis:
+    id
+    normalized_name
+    payload
+    model_name
+    prompt_version
+    created_at
+    updated_at
+"""
+
+class DishAnalysis(SQLModel, table=True):
+    __tablename__ = "dish_analyses"
+    id: UUID = Field(
+        sa_column=Column(pg.UUID(as_uuid=True), primary_key=True, default=uuid4)
+    )
+    normalized_name: str = Field(
+        sa_column=Column(pg.VARCHAR(255), nullable=False, unique=True, index=True)
+    )
+    payload: dict = Field(
+        sa_column=Column(pg.JSONB, nullable=False)
+    )
+    model_name: str = Field(
+        sa_column=Column(pg.VARCHAR(100), nullable=False)
+    )
+    prompt_version: str = Field(
+        sa_column=Column(pg.VARCHAR(50), nullable=False)
+    )
+    
+    created_at: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    )
+    updated_at: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    )
+
+
+""" 
+Class EstimationHistory:
+    id
+    user_uuid
+    analysis_id
+    dish_name
+    source
+    created_at
+"""
+
+class EstimationHistory(SQLModel, table=True):
+    __tablename__ = "estimation_history"
+    __table_args__ = (
+        # keyset listing: WHERE user_uuid=? AND (created_at,id) < (?,?) ORDER BY created_at DESC,id DESC
+        # served from the index alone (index-only scan) thanks to the INCLUDE columns
+        Index(
+            "ix_estimation_history_user_keyset",
+            "user_uuid", "created_at", "id",
+            postgresql_include=["analysis_id", "dish_name", "source"]
+        ),
+    )
+    id: int = Field(
+        sa_column=Column(pg.BIGINT, primary_key=True, autoincrement=True)
+    )
+    user_uuid: UUID = Field(
+        sa_column=Column(pg.UUID(as_uuid=True), ForeignKey("users.uuid", ondelete="CASCADE"), nullable=False)
+    )
+    analysis_id: UUID = Field(
+        sa_column=Column(pg.UUID(as_uuid=True), ForeignKey("dish_analyses.id", ondelete="CASCADE"), nullable=False)
+    )
+    dish_name: str = Field(
+        sa_column=Column(pg.VARCHAR(255), nullable=False)
+    )
+    source: str = Field(
+        sa_column=Column(pg.VARCHAR(20), nullable=False)
+    )
+    
+    created_at: datetime = Field(
+        sa_column=Column(pg.TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    )
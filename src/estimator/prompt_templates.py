@@ -1,3 +1,6 @@
+# Bump whenever any prompt below changes, stored analyses from older versions are re-estimated
+PROMPT_VERSION="v1"
+
 DISH_METRICS_SYSTEM_PROMPT="""
 You are a sustainability and food carbon analyst AI.
 
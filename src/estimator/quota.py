@@ -0,0 +1,65 @@
+from contextvars import ContextVar
+from datetime import datetime,timezone
+from typing import Optional
+from src.constants.config import Config
+from src.db.redis_client import add_llm_tokens,reserve_llm_call
+from src.logging.logger import global_logger
+from src.utils.errors import QuotaExceeded
+from src.utils.metrics import LLM_QUOTA_REJECTIONS
+
+"""
+Daily LLM quotas: every LLM stage call of a subject ("user:<uid>", or "ip:<address>" for
+anonymous requests) is counted in a Redis hash per UTC day, calls reserved up front and tokens
+added once the call returns. Only calls reaching LLMService._invoke count, so cache hits are free.
+The subject is set per request by RateLimitMiddleware and per job by bulk imports.
+"""
+
+QUOTA_PREFIX="llm_quota:"
+# a day's counters outlive the day, whatever the timezone of the reader
+QUOTA_TTL=2*24*3600
+
+_quota_subject:ContextVar[Optional[str]]=ContextVar("llm_quota_subject",default=None)
+
+
+def set_quota_subject(subject:Optional[str])->None:
+    _quota_subject.set(subject)
+
+def _quota_key(subject:str)->str:
+    return f"{QUOTA_PREFIX}{subject}:{datetime.now(timezone.utc):%Y%m%d}"
+
+async def reserve_quota_call()->Optional[str]:
+    """ Reserves one LLM call for the current subject, returns its quota key (None when unmetered)"""
+    subject=_quota_subject.get()
+    if subject is None or not (Config.LLM_DAILY_CALL_QUOTA or Config.LLM_DAILY_TOKEN_QUOTA):
+        return None
+    key=_quota_key(subject)
+    try:
+        reserved=await reserve_llm_call(key,Config.LLM_DAILY_CALL_QUOTA,Config.LLM_DAILY_TOKEN_QUOTA,QUOTA_TTL)
+    except Exception as e:
+        # fail open: an unreachable redis must not take estimation down
+        await global_logger.log_event(
+            data={
+                "message":"llm_quota_unavailable",
+                "error":str(e)
+            },
+            level="error"
+        )
+        return None
+    if not reserved:
+        LLM_QUOTA_REJECTIONS.labels(subject.split(":",1)[0]).inc()
+        raise QuotaExceeded(f"daily LLM quota of {subject} exhausted")
+    return key
+
+async def record_quota_tokens(key:Optional[str],tokens:int)->None:
+    if key is None or not tokens:
+        return
+    try:
+        await add_llm_tokens(key,tokens)
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"llm_quota_unavailable",
+                "error":str(e)
+            },
+            level="error"
+        )
@@ -1,32 +1,81 @@
-from fastapi import Query,Path,Header,Request,status,APIRouter,Depends
+from fastapi import Query,Path,Header,Request,status,APIRouter,Depends,Response,BackgroundTasks,UploadFile,File,Form
+from fastapi.exceptions import HTTPException
 from .llm_service import LLMService
-from fastapi.responses import JSONResponse 
+from fastapi.responses import ORJSONResponse,RedirectResponse,FileResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.db.pg_sql_client import get_session,get_read_session
 from src.logging.logger import global_logger
-from src.utils.errors import InternalServerError
-from .schemas import ValidatedImage 
-from .utils import validate_image 
+from src.utils.errors import InternalServerError,CustomException
+from src.db.redis_client import dish_response_in_cache,dish_response_with_ttl,DISH_CACHE_EXPIRY
+from src.auth.dependencies import OptionalAccessTokenBearer,UserChecker,get_current_user
+from .schemas import ValidatedImage,EstimationHistoryPage,RecipeRequest,AnalysisAdjustment,MealPlanRequest,ImportJob
+from .calculator import build_analysis,per_kg_factors,edit_ingredients,scale_ingredients,aggregate_meal_plan
+from .utils import (
+    validate_image,
+    normalize_name,
+    render_dish_response,
+    dish_etag,
+    etag_matches,
+    encode_history_cursor,
+    decode_history_cursor
+)
+from .history_service import history_service,record_estimation
+from .bulk_import import create_import,load_job,results_path,retry_import
+from .usage import mark_cache_outcome
+from typing import Optional
+from uuid import UUID
+import anyio
 
 
 estimator_router=APIRouter()
+auth_checker=Depends(UserChecker())
+
+
+def track_estimation(background_tasks:BackgroundTasks,token_details:Optional[dict],dish_name:str,source:str,
+                     model_name:Optional[str]=None)->None:
+    """ Queues the history entry of an authenticated user's estimate, written after the response is sent"""
+    user_uid=(token_details or {}).get('user',{}).get('user_uid')
+    if not user_uid:
+        return
+    background_tasks.add_task(
+        record_estimation,
+        user_uuid=UUID(user_uid),
+        dish_name=dish_name,
+        normalized_name=normalize_name(dish_name),
+        source=source,
+        model_name=model_name
+    )
 
 
 @estimator_router.post('/estimate')
-async def estimate_dish_carbon_foot_print(dish:str): 
+async def estimate_dish_carbon_foot_print(dish:str,background_tasks:BackgroundTasks,
+                                          token_details:Optional[dict]=Depends(OptionalAccessTokenBearer())):
     try:
-        result=await LLMService.estimate_dish_carbon_foot_print_analysis(dish_name=dish)
-        if not result:
-            return JSONResponse(
+        # fast path: cache hits are served as the stored response body bytes
+        cached_body=await dish_response_in_cache(dish_name=normalize_name(dish))
+        if cached_body:
+            mark_cache_outcome("hit")
+            track_estimation(background_tasks,token_details,dish_name=dish,source="text")
+            return Response(content=cached_body,media_type="application/json")
+
+        # the miss is passed on so the pipeline does not GET the same key again
+        estimated=await LLMService.estimate_dish_carbon_foot_print_analysis(dish_name=dish,cache_checked=True)
+        if not estimated:
+            return ORJSONResponse(
                 status_code=status.HTTP_200_OK,
                 content={
                     "message":"Invalid Dish Name provided",
                 }
             )
-        return JSONResponse(
+        result,model_name=estimated
+        track_estimation(background_tasks,token_details,dish_name=dish,source="text",model_name=model_name)
+        return Response(
             status_code=status.HTTP_200_OK,
-            content={
-                "dish_metrics":result.model_dump()
-            }
+            content=render_dish_response(result),
+            media_type="application/json"
         )
+    except (CustomException,HTTPException):
+        raise
     except Exception as e:
         await global_logger.log_event(
             data={
@@ -36,24 +85,324 @@ async def estimate_dish_carbon_foot_print(dish:str):
             level="info"
         )
         raise InternalServerError()
-        
-        
+
+
 @estimator_router.post('/estimate/image')
-async def estimate_image_dish_carbon_foot_print(valid_image: ValidatedImage = Depends(validate_image)):
+async def estimate_image_dish_carbon_foot_print(background_tasks:BackgroundTasks,
+                                                valid_image: ValidatedImage = Depends(validate_image),
+                                                token_details:Optional[dict]=Depends(OptionalAccessTokenBearer())):
     try:
-        result=await LLMService.analyze_dish_carbon_from_image(image_b64=valid_image.image_b64)
-        if not result:
-            return JSONResponse(
+        detected=await LLMService.analyze_dish_carbon_from_image(image_b64=valid_image.image_b64)
+        if not detected:
+            return ORJSONResponse(
                 status_code=status.HTTP_200_OK,
                 content={
                     "message":"No Food Item/Dish Detected in Image"
                 }
             )
-        return JSONResponse(
+        dish_name,result,model_name=detected
+        track_estimation(background_tasks,token_details,dish_name=dish_name,source="image",model_name=model_name)
+        return Response(
+            status_code=status.HTTP_200_OK,
+            content=render_dish_response(result),
+            media_type="application/json"
+        )
+    except (CustomException,HTTPException):
+        raise
+    except Exception as e:
+        raise InternalServerError()
+
+
+@estimator_router.post('/estimate/recipe')
+async def estimate_recipe_carbon_foot_print(recipe:RecipeRequest):
+    """ Analysis of a user supplied recipe, computed locally from per kg ingredient factors"""
+    try:
+        factors=await LLMService.resolve_ingredient_factors(
+            [ingredient.ingredient_name for ingredient in recipe.ingredients]
+        )
+        if not factors:
+            return ORJSONResponse(
+                status_code=status.HTTP_200_OK,
+                content={
+                    "message":"No recognizable ingredients provided",
+                }
+            )
+        result=build_analysis(
+            dish=recipe.dish,
+            ingredients=recipe.ingredients,
+            factors=factors,
+            servings=recipe.servings
+        )
+        return Response(
+            status_code=status.HTTP_200_OK,
+            content=render_dish_response(result),
+            media_type="application/json"
+        )
+    except (CustomException,HTTPException):
+        raise
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"error_occured_estimating_recipe",
+                "error":str(e),
+                "dish":recipe.dish
+            },
+            level="error"
+        )
+        raise InternalServerError()
+
+
+@estimator_router.post('/meal-plan')
+async def estimate_meal_plan_carbon_foot_print(plan:MealPlanRequest):
+    """
+        Daily / weekly, per stage and per ingredient footprint of a plan of dishes x servings x day.
+        Only already estimated dishes are used (no LLM call), the others are listed as unresolved.
+    """
+    try:
+        analyses=await LLMService.known_analyses([entry.dish for entry in plan.entries])
+        result=aggregate_meal_plan(plan.entries,analyses)
+        return ORJSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=result.model_dump(mode="json")
+        )
+    except (CustomException,HTTPException):
+        raise
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"error_occured_estimating_meal_plan",
+                "error":str(e),
+                "entries":len(plan.entries)
+            },
+            level="error"
+        )
+        raise InternalServerError()
+
+
+@estimator_router.get('/dishes/{normalized_name}')
+async def get_dish_analysis(request:Request,normalized_name:str=Path()):
+    """ Cacheable (ETag / Cache-Control) representation of an already estimated dish, never calls the LLM"""
+    try:
+        canonical_name=normalize_name(normalized_name)
+        if canonical_name!=normalized_name:
+            # one URL per dish keeps client / edge caches from fragmenting
+            return RedirectResponse(
+                url=str(request.url_for("get_dish_analysis",normalized_name=canonical_name)),
+                status_code=status.HTTP_308_PERMANENT_REDIRECT
+            )
+        
+        body,ttl=await dish_response_with_ttl(dish_name=canonical_name)
+        if body:
+            mark_cache_outcome("hit")
+        else:
+            # a safe method reachable by crawlers / link previews: no LLM spend on a miss
+            result=await LLMService.lookup_analysis(canonical_name,cache_checked=True)
+            if not result:
+                return ORJSONResponse(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    content={
+                        "message":"No analysis found for this dish, estimate it first with POST /estimate",
+                    }
+                )
+            body,ttl=render_dish_response(result),DISH_CACHE_EXPIRY
+        
+        etag=dish_etag(body)
+        headers={
+            "ETag":etag,
+            "Cache-Control":f"public, max-age={ttl if ttl>0 else DISH_CACHE_EXPIRY}"
+        }
+        if etag_matches(request.headers.get("if-none-match"),etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED,headers=headers)
+        return Response(
+            status_code=status.HTTP_200_OK,
+            content=body,
+            media_type="application/json",
+            headers=headers
+        )
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"error_occured_fetching_dish_analysis",
+                "error":str(e),
+                "normalized_name":normalized_name
+            },
+            level="error"
+        )
+        raise InternalServerError()
+
+
+@estimator_router.post('/dishes/{normalized_name}/adjust')
+async def adjust_dish_analysis(adjustment:AnalysisAdjustment,normalized_name:str=Path()):
+    """ What-if edits (servings, weights, removed / added ingredients) recomputed from per kg factors"""
+    try:
+        analysis=await LLMService.lookup_analysis(normalize_name(normalized_name))
+        if not analysis:
+            return ORJSONResponse(
+                status_code=status.HTTP_404_NOT_FOUND,
+                content={
+                    "message":"No analysis found for this dish, estimate it first",
+                }
+            )
+        try:
+            ingredients=edit_ingredients(analysis.ingredients.ingredients,adjustment)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        
+        factors=per_kg_factors(analysis.ingredients.ingredients,analysis.lca)
+        # added ingredients, and those whose LCA row did not match the ingredient name
+        unpriced=[
+            ingredient.ingredient_name for ingredient in ingredients
+            if normalize_name(ingredient.ingredient_name) not in factors
+        ]
+        if unpriced:
+            factors.update(await LLMService.resolve_ingredient_factors(unpriced))
+        
+        result=build_analysis(
+            dish=analysis.metrics.dish or analysis.ingredients.dish,
+            ingredients=scale_ingredients(ingredients,adjustment.servings),
+            factors=factors,
+            servings=adjustment.servings
+        )
+        return Response(
             status_code=status.HTTP_200_OK,
-            content={
-                "dish_metrics":result.model_dump()
-            }
+            content=render_dish_response(result),
+            media_type="application/json"
+        )
+    except (CustomException,HTTPException):
+        raise
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"error_occured_adjusting_dish_analysis",
+                "error":str(e),
+                "normalized_name":normalized_name
+            },
+            level="error"
+        )
+        raise InternalServerError()
+
+
+@estimator_router.get('/history',dependencies=[auth_checker],response_model=EstimationHistoryPage)
+async def list_estimation_history(limit:int=Query(20,ge=1,le=100),cursor:Optional[str]=Query(None),
+                                  current_user=Depends(get_current_user),session:AsyncSession=Depends(get_read_session)):
+    try:
+        position=None
+        if cursor:
+            position=decode_history_cursor(cursor)
+            if not position:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Invalid cursor"
+                )
+        items,has_more=await history_service.list_entries(
+            user_uuid=current_user.uuid,
+            limit=limit,
+            cursor=position,
+            session=session
+        )
+        next_cursor=encode_history_cursor(items[-1].created_at,items[-1].id) if has_more else None
+        return ORJSONResponse(
+            status_code=status.HTTP_200_OK,
+            content=EstimationHistoryPage(items=items,next_cursor=next_cursor).model_dump(mode="json")
+        )
+    except (CustomException,HTTPException):
+        raise
+    except Exception as e:
+        await global_logger.log_event(
+            data={
+                "message":"error_occured_listing_estimation_history",
+                "error":str(e),
+            },
+            level="error"
+        )
+        raise InternalServerError()
+
+
+async def owned_import_job(job_id:UUID,current_user)->ImportJob:
+    job=await anyio.to_thread.run_sync(load_job,job_id)
+    if not job or job.owner_uuid!=current_user.uuid:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found"
         )
+    return job
+
+
+@estimator_router.post('/imports',dependencies=[auth_checker],status_code=status.HTTP_202_ACCEPTED,response_model=ImportJob)
+async def import_menu(file:UploadFile=File(...),column:str=Form("dish"),current_user=Depends(get_current_user)):
+    """ Queues a bulk estimate of a CSV / Parquet menu, poll GET /imports/{job_id} for progress"""
+    try:
+        try:
+            job=await create_import(upload=file,column=column,owner_uuid=current_user.uuid)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        return ORJSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=job.model_dump(mode="json")
+        )
+    except (CustomException,HTTPException):
+        raise
     except Exception as e:
-        raise InternalServerError()
\ No newline at end of file
+        await global_logger.log_event(
+            data={
+                "message":"error_occured_creating_menu_import",
+                "error":str(e),
+                "filename":file.filename
+            },
+            level="error"
+        )
+        raise InternalServerError()
+
+
+@estimator_router.get('/imports/{job_id}',dependencies=[auth_checker],response_model=ImportJob)
+async def get_menu_import(job_id:UUID,current_user=Depends(get_current_user)):
+    job=await owned_import_job(job_id,current_user)
+    return ORJSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=job.model_dump(mode="json")
+    )
+
+
+@estimator_router.post('/imports/{job_id}/retry',dependencies=[auth_checker],status_code=status.HTTP_202_ACCEPTED,response_model=ImportJob)
+async def retry_menu_import(job_id:UUID,current_user=Depends(get_current_user)):
+    """ Resumes a failed import from its last checkpoint"""
+    job=await owned_import_job(job_id,current_user)
+    if job.status!="failed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only failed imports can be retried"
+        )
+    job=await retry_import(job)
+    return ORJSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=job.model_dump(mode="json")
+    )
+
+
+@estimator_router.get('/imports/{job_id}/results',dependencies=[auth_checker])
+async def download_menu_import_results(job_id:UUID,current_user=Depends(get_current_user)):
+    """ Results CSV, partial while the import is still running"""
+    job=await owned_import_job(job_id,current_user)
+    path=results_path(job_id)
+    if not path.exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No results yet"
+        )
+    filename=f"menu_import_{job_id}.csv"
+    if job.status in ("completed","failed"):
+        return FileResponse(path,media_type="text/csv",filename=filename)
+    # still being appended to, only the checkpointed prefix is consistent
+    async with await anyio.open_file(path,"rb") as f:
+        content=await f.read(job.output_bytes)
+    return Response(
+        content=content,
+        media_type="text/csv",
+        headers={"Content-Disposition":f'attachment; filename="{filename}"'}
+    )
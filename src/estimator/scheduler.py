@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque,Dict
+from src.constants.config import Config
+from src.utils.metrics import LLM_SCHEDULER_IN_FLIGHT,LLM_SCHEDULER_QUEUED,LLM_SCHEDULER_QUEUE_WAIT
+
+"""
+Priority scheduling of LLM stage calls within a worker. Every LLMService._invoke takes a slot
+(at most LLM_SCHEDULER_CONCURRENCY calls run at once) under the priority class of its context:
+interactive (requests, the default), batch (menu imports) or background (cache refreshes).
+
+Waiting calls are served weighted fair: each class has a virtual pass advanced by 1/weight per
+dispatched call and the backlogged class with the lowest pass goes next, so with the default
+weights 8/2/1 interactive calls get 8 slots out of 11 while all classes are waiting. A class that
+was idle starts from the current virtual time, it cannot bank credit. Shares cap the slots one
+class may hold, so a 5,000 dish import never occupies more than half of them.
+"""
+
+PRIORITIES=("interactive","batch","background")
+
+_llm_priority:ContextVar[str]=ContextVar("llm_priority",default="interactive")
+
+
+def set_llm_priority(priority:str)->None:
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown LLM priority {priority}")
+    _llm_priority.set(priority)
+
+def llm_priority()->str:
+    return _llm_priority.get()
+
+
+class LLMScheduler:
+
+    def __init__(self,concurrency:int,weights:Dict[str,int],shares:Dict[str,float]):
+        self.concurrency=concurrency
+        self.weights={priority:weights.get(priority,1) for priority in PRIORITIES}
+        self.caps={priority:max(1,int(concurrency*shares.get(priority,1.0))) for priority in PRIORITIES}
+        self.in_flight={priority:0 for priority in PRIORITIES}
+        self._passes={priority:0.0 for priority in PRIORITIES}
+        self._virtual_time=0.0
+        self._waiters:Dict[str,Deque[asyncio.Future]]={priority:deque() for priority in PRIORITIES}
+
+    def _update_gauges(self,priority:str)->None:
+        LLM_SCHEDULER_IN_FLIGHT.labels(priority).set(self.in_flight[priority])
+        LLM_SCHEDULER_QUEUED.labels(priority).set(len(self._waiters[priority]))
+
+    def _dispatch(self)->None:
+        while sum(self.in_flight.values())<self.concurrency:
+            ready=[
+                priority for priority in PRIORITIES
+                if self._waiters[priority] and self.in_flight[priority]<self.caps[priority]
+            ]
+            if not ready:
+                return
+            priority=min(ready,key=self._passes.__getitem__)
+            waiter=self._waiters[priority].popleft()
+            if not waiter.done():
+                self._virtual_time=self._passes[priority]
+                self._passes[priority]+=1/self.weights[priority]
+                self.in_flight[priority]+=1
+                waiter.set_result(None)
+            self._update_gauges(priority)
+
+    def _release(self,priority:str)->None:
+        self.in_flight[priority]-=1
+        self._update_gauges(priority)
+        self._dispatch()
+
+    async def _acquire(self,priority:str)->None:
+        if not self._waiters[priority]:
+            self._passes[priority]=max(self._passes[priority],self._virtual_time)
+        waiter=asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        self._update_gauges(priority)
+        self._dispatch()
+        try:
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted as we gave up, pass it on
+                self._release(priority)
+            elif waiter in self._waiters[priority]:
+                self._waiters[priority].remove(waiter)
+                self._update_gauges(priority)
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        """ Holds one LLM call slot under the priority of the current context"""
+        priority=llm_priority()
+        start=time.perf_counter()
+        await self._acquire(priority)
+        LLM_SCHEDULER_QUEUE_WAIT.labels(priority).observe(time.perf_counter()-start)
+        try:
+            yield priority
+        finally:
+            self._release(priority)
+
+
+scheduler=LLMScheduler(
+    concurrency=Config.LLM_SCHEDULER_CONCURRENCY,
+    weights=Config.LLM_SCHEDULER_WEIGHTS,
+    shares=Config.LLM_SCHEDULER_SHARES
+)
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Optional,List,Literal
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional,List,Literal,Dict
+from datetime import datetime,date
+from uuid import UUID
 
 class FoodItem(BaseModel):
     dish_name:str
@@ -96,8 +98,102 @@ class DishCarbonAnalysisResponse(BaseModel):
     metrics: DishMetrics
     ingredients: DishIngredients
     lca: IngredientCarbonResponse
+    unmatched_ingredients: List[str] = Field(
+        default_factory=list, description="Ingredients without an emission factor, counted as zero emissions"
+    )
     
 
+class RecipeIngredient(Ingredient):
+    ingredient_weight_kg: float = Field(..., gt=0, le=50, description="Weight of the ingredient in kilograms")
+
+class RecipeRequest(BaseModel):
+    dish: str = Field("Custom Recipe", max_length=255, description="Name shown for the recipe")
+    servings: int = Field(1, ge=1, le=100, description="Number of servings the ingredient weights yield")
+    ingredients: List[RecipeIngredient] = Field(..., min_length=1, max_length=100)
+
+class AnalysisAdjustment(BaseModel):
+    servings: int = Field(1, ge=1, le=100, description="Number of servings to scale the per serving analysis to")
+    weight_overrides: Dict[str, float] = Field(
+        default_factory=dict, description="Ingredient name -> new weight (kg) for one serving"
+    )
+    removed_ingredients: List[str] = Field(default_factory=list, description="Ingredient names to drop")
+    added_ingredients: List[RecipeIngredient] = Field(
+        default_factory=list, max_length=50, description="Extra ingredients with weights (kg) for one serving"
+    )
+
+    @field_validator("weight_overrides")
+    def validate_weights(cls, value: Dict[str, float]) -> Dict[str, float]:
+        if any(weight <= 0 or weight > 50 for weight in value.values()):
+            raise ValueError("Ingredient weights must be within (0, 50] kg")
+        return value
+
+class MealPlanEntry(BaseModel):
+    dish: str = Field(..., max_length=255)
+    servings: float = Field(1, gt=0, le=100)
+    day: date
+
+class MealPlanRequest(BaseModel):
+    entries: List[MealPlanEntry] = Field(..., min_length=1, max_length=1000)
+
+class StageFootprint(BaseModel):
+    carbon_kg: float = Field(..., description="Total kg CO2e")
+    farming_kg: float
+    packaging_kg: float
+    processing_kg: float
+    retail_kg: float
+    transportation_kg: float
+
+class MealPlanPeriodTotal(StageFootprint):
+    period: str = Field(..., description="ISO day (YYYY-MM-DD) or ISO week (YYYY-Www)")
+
+class MealPlanIngredientTotal(BaseModel):
+    ingredient_name: str
+    weight_kg: float
+    carbon_kg: float
+
+class MealPlanResponse(BaseModel):
+    total: StageFootprint
+    days: List[MealPlanPeriodTotal]
+    weeks: List[MealPlanPeriodTotal]
+    ingredients: List[MealPlanIngredientTotal] = Field(..., description="Ingredient totals, largest footprint first")
+    unresolved_dishes: List[str] = Field(
+        ..., description="Dishes without a known analysis (estimate them via POST /estimate first), excluded"
+    )
+
+class ImportJob(BaseModel):
+    """ State and checkpoint of a bulk menu import, persisted after every processed chunk"""
+    job_id: UUID
+    owner_uuid: UUID
+    source_format: Literal["csv", "parquet"]
+    column: str
+    status: Literal["queued", "running", "paused_quota", "completed", "failed"] = "queued"
+    total_rows: Optional[int] = Field(None, description="Rows in the source (estimated for CSV)")
+    rows_read: int = Field(0, description="Source rows consumed up to the last checkpoint")
+    rows_skipped: int = Field(0, description="Empty dish values")
+    duplicates_skipped: int = 0
+    dishes_processed: int = 0
+    dishes_succeeded: int = 0
+    dishes_failed: int = 0
+    output_bytes: int = Field(0, description="Committed size of the results file")
+    error: Optional[str] = None
+    paused_until: Optional[datetime] = Field(None, description="When an import paused by the owner's LLM quota resumes")
+    created_at: datetime
+    updated_at: datetime
+
+class EstimationHistoryItem(BaseModel):
+    id: int
+    dish_name: str = Field(..., description="Dish name as requested by the user")
+    normalized_name: str = Field(..., description="Key of the shared analysis, usable with GET /dishes/{normalized_name}")
+    analysis_id: UUID
+    source: Literal["text", "image"]
+    impact_rating: Optional[str] = None
+    carbon_per_serving_kg: Optional[float] = None
+    created_at: datetime
+
+class EstimationHistoryPage(BaseModel):
+    items: List[EstimationHistoryItem]
+    next_cursor: Optional[str] = Field(None, description="Opaque cursor of the next page, null on the last page")
+
 
 class ValidatedImage(BaseModel):
     filename: str
@@ -0,0 +1,187 @@
+from contextvars import ContextVar
+from dataclasses import dataclass,field
+from typing import Any,Dict,List,Optional,Tuple
+import orjson
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration,LLMResult
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp,Message,Receive,Scope,Send
+from src.logging.logger import global_logger
+from src.utils.metrics import LLM_USAGE_CALLS,LLM_USAGE_COST,LLM_USAGE_REQUESTS,LLM_USAGE_TOKENS
+
+"""
+Token usage and cost accounting of the LLM pipeline.
+
+Every chain call in LLMService goes through LLMService._invoke, which attaches a
+StageUsageCallback and appends a StageUsage to the RequestUsage of the current context.
+UsageMiddleware opens one RequestUsage per HTTP request; at the end of the request its stages
+are added to the llm_usage_* Prometheus counters, labelled by endpoint, stage and cache outcome.
+Bulk imports do the same per job, when the job ends.
+"""
+
+# USD per 1M (input, output) tokens, matched on the longest model name prefix
+MODEL_PRICES_PER_MILLION: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
+# how a request's analyses were obtained, the most expensive one wins for the whole request
+CACHE_OUTCOMES = ("none", "hit", "stored", "miss")
+USAGE_HEADER = "X-LLM-Usage"
+
+
+def token_cost(model_name: Optional[str], input_tokens: int, output_tokens: int) -> float:
+    """ USD cost of a call, 0 for models missing from the price table"""
+    prefixes = [prefix for prefix in MODEL_PRICES_PER_MILLION if (model_name or "").startswith(prefix)]
+    if not prefixes:
+        return 0.0
+    input_price, output_price = MODEL_PRICES_PER_MILLION[max(prefixes, key=len)]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class StageUsage:
+    stage: str
+    model_name: Optional[str] = None
+    input_tokens: int = 0
+    output_tokens: int = 0
+    duration_sec: float = 0.0
+    failed: bool = False
+
+    @property
+    def cost_usd(self) -> float:
+        return token_cost(self.model_name, self.input_tokens, self.output_tokens)
+
+
+@dataclass
+class RequestUsage:
+    endpoint: str
+    cache_outcome: str = "none"
+    stages: List[StageUsage] = field(default_factory=list)
+
+    def summary(self, include_stages: bool = True) -> dict:
+        totals = {
+            "cache": self.cache_outcome,
+            "calls": len(self.stages),
+            "input_tokens": sum(stage.input_tokens for stage in self.stages),
+            "output_tokens": sum(stage.output_tokens for stage in self.stages),
+            "cost_usd": round(sum(stage.cost_usd for stage in self.stages), 6)
+        }
+        if not include_stages:
+            return totals
+        return {
+            **totals,
+            "stages": [
+                {
+                    "stage": stage.stage,
+                    "model": stage.model_name,
+                    "input_tokens": stage.input_tokens,
+                    "output_tokens": stage.output_tokens,
+                    "duration_sec": round(stage.duration_sec, 3)
+                }
+                for stage in self.stages
+            ]
+        }
+
+
+_current_usage: ContextVar[Optional[RequestUsage]] = ContextVar("llm_request_usage", default=None)
+
+
+class StageUsageCallback(AsyncCallbackHandler):
+    """ Collects token usage and model of every chat model call of one stage"""
+
+    def __init__(self, stage: str):
+        super().__init__()
+        self.usage = StageUsage(stage=stage)
+
+    async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = generation.message if isinstance(generation, ChatGeneration) else None
+                if isinstance(message, AIMessage) and message.usage_metadata:
+                    self.usage.input_tokens += message.usage_metadata.get("input_tokens", 0)
+                    self.usage.output_tokens += message.usage_metadata.get("output_tokens", 0)
+                    self.usage.model_name = message.response_metadata.get("model_name") or self.usage.model_name
+
+
+def start_request_usage(endpoint: str) -> RequestUsage:
+    """ Opens the usage record of the current context (request, background job)"""
+    usage = RequestUsage(endpoint=endpoint)
+    _current_usage.set(usage)
+    return usage
+
+def record_stage_usage(usage: StageUsage) -> None:
+    request_usage = _current_usage.get()
+    if request_usage is not None:
+        request_usage.stages.append(usage)
+    else:
+        # outside any request context, still counted
+        _count_stage("unattributed", "none", usage)
+
+def mark_cache_outcome(outcome: str) -> None:
+    """ Records how an analysis was obtained (hit / stored / miss) for the current request"""
+    request_usage = _current_usage.get()
+    if request_usage is not None and CACHE_OUTCOMES.index(outcome) > CACHE_OUTCOMES.index(request_usage.cache_outcome):
+        request_usage.cache_outcome = outcome
+
+
+def _count_stage(endpoint: str, cache_outcome: str, usage: StageUsage) -> None:
+    LLM_USAGE_CALLS.labels(endpoint, usage.stage, cache_outcome, "error" if usage.failed else "ok").inc()
+    LLM_USAGE_TOKENS.labels(endpoint, usage.stage, cache_outcome, "input").inc(usage.input_tokens)
+    LLM_USAGE_TOKENS.labels(endpoint, usage.stage, cache_outcome, "output").inc(usage.output_tokens)
+    LLM_USAGE_COST.labels(endpoint, usage.stage, cache_outcome).inc(usage.cost_usd)
+
+def finish_request_usage(request_usage: RequestUsage) -> None:
+    """ Adds a finished request / job to the llm_usage_* counters"""
+    LLM_USAGE_REQUESTS.labels(request_usage.endpoint, request_usage.cache_outcome).inc()
+    for usage in request_usage.stages:
+        _count_stage(request_usage.endpoint, request_usage.cache_outcome, usage)
+
+
+class UsageMiddleware:
+    """
+    Opens a RequestUsage per HTTP request, labelled with the matched route path,
+    and adds it to the llm_usage_* counters when the request ends.
+    With debug_header the request summary is returned in the X-LLM-Usage header.
+    """
+
+    def __init__(self, app: ASGIApp, debug_header: bool = False):
+        self.app = app
+        self.debug_header = debug_header
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_usage = RequestUsage(endpoint="unmatched")
+        token = _current_usage.set(request_usage)
+
+        async def send_with_usage(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # route template rather than the raw path, keeps the counter keys bounded
+                route = scope.get("route")
+                if route is not None:
+                    request_usage.endpoint = f"{scope['method']} {route.path}"
+                if self.debug_header and request_usage.stages:
+                    MutableHeaders(scope=message)[USAGE_HEADER] = orjson.dumps(request_usage.summary()).decode()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_usage)
+        finally:
+            _current_usage.reset(token)
+            finish_request_usage(request_usage)
+            if request_usage.stages and global_logger.is_enabled("info"):
+                await global_logger.log_event(
+                    data={
+                        "message": "llm_usage",
+                        "endpoint": request_usage.endpoint,
+                        **request_usage.summary()
+                    }
+                )
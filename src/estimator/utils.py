@@ -1,9 +1,55 @@
 from fastapi import UploadFile, File, HTTPException, status
-from typing import Literal
-from .schemas import ValidatedImage
+from typing import Literal,Optional,Tuple
+from datetime import datetime
+from .schemas import ValidatedImage,DishCarbonAnalysisResponse
 import base64
+import hashlib
+import json
 
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5 MB
+DISH_RESPONSE_KEY = "dish_metrics"
+
+def normalize_name(name: str) -> str:
+    """ Canonical form of a dish / ingredient name used for cache and storage keys"""
+    return " ".join(name.lower().split())
+
+def render_dish_response(analysis: DishCarbonAnalysisResponse) -> bytes:
+    """
+    Renders the exact response body of the estimation routes, so the same bytes
+    can be cached and served on a hit without model_dump / re-encoding.
+    """
+    return b'{"' + DISH_RESPONSE_KEY.encode("utf-8") + b'":' + analysis.model_dump_json().encode("utf-8") + b"}"
+
+def parse_dish_response(body: bytes) -> DishCarbonAnalysisResponse:
+    """ Inverse of render_dish_response"""
+    data = json.loads(body)
+    return DishCarbonAnalysisResponse(**data[DISH_RESPONSE_KEY])
+
+def dish_etag(body: bytes) -> str:
+    """ Strong ETag derived from the content hash of a rendered analysis"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """ If-None-Match evaluation (weak comparison, as RFC 9110 mandates for this header)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def encode_history_cursor(created_at: datetime, entry_id: int) -> str:
+    """ Opaque keyset cursor for the (created_at, id) position of the last returned history entry"""
+    raw = f"{created_at.isoformat()}|{entry_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("utf-8")
+
+def decode_history_cursor(cursor: str) -> Optional[Tuple[datetime, int]]:
+    """ Inverse of encode_history_cursor, None if the cursor is malformed"""
+    try:
+        created_at, entry_id = base64.urlsafe_b64decode(cursor.encode("utf-8")).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(entry_id)
+    except Exception:
+        return None
 
 async def validate_image(file: UploadFile = File(...)) -> ValidatedImage:
     
@@ -1,16 +1,86 @@
 import os
-import json
+import time
+import random
+import queue
+import atexit
 import datetime
 import threading
-from typing import Any, Optional
+from typing import Any, List, Optional, Tuple
 from abc import ABC, abstractmethod
 import logging
 import anyio
+import orjson
+from pydantic import BaseModel
 
-from src.constants.config import Config 
+from src.constants.config import Config
+from src.utils.tracing import tracer,current_trace_ids
 
 LOGGER_SERVICE=Config.LOGGER_SERVICE
 
+# (unix timestamp, level, data snapshot) as captured on the event loop, encoded by the writer thread
+LogRecord = Tuple[float, str, Any]
+
+LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR, "critical": logging.CRITICAL}
+# a key containing one of these words ("access_token", "hashed_password", not "input_tokens") is redacted
+REDACTED_KEYS = ("password", "token")
+REDACTED = "***"
+
+
+def _is_secret(key: Any) -> bool:
+    words = str(key).lower().split("_")
+    return any(secret in words for secret in REDACTED_KEYS)
+
+
+def snapshot(value: Any) -> Any:
+    """
+    Copy of a log payload taken by the caller: dicts and lists are copied, models (ORM rows
+    included) dumped, and the values of secret keys redacted at any depth. The writer thread
+    then never reads objects the caller may still change.
+    """
+    if isinstance(value, BaseModel):
+        value = value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: REDACTED if _is_secret(key) else snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [snapshot(item) for item in value]
+    return value
+
+
+def _encode_default(obj: Any) -> Any:
+    # payloads are snapshots already, this covers records built without log_event
+    if isinstance(obj, BaseModel):
+        return snapshot(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, BaseException):
+        return f"{type(obj).__name__}: {obj}"
+    return str(obj)
+
+
+def encode_record(timestamp: float, level: str, data: Any) -> bytes:
+    """ One JSON line: timestamp, level and the fields of data (or data as message)"""
+    entry = {
+        "timestamp": datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).replace(tzinfo=None).isoformat(),
+        "level": level.upper(),
+    }
+    if isinstance(data, dict):
+        entry.update(data)
+    else:
+        entry["message"] = data
+    return orjson.dumps(entry, default=_encode_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+
+
+def encode_record_safe(timestamp: float, level: str, data: Any) -> bytes:
+    """ encode_record, a record that cannot be encoded is replaced by a note of the failure"""
+    try:
+        return encode_record(timestamp, level, data)
+    except Exception as e:
+        return encode_record(timestamp, level, {
+            "message": "log_record_unencodable",
+            "event": str(data.get("message")) if isinstance(data, dict) else None,
+            "error": f"{type(e).__name__}: {e}"
+        })
+
 class LoggerBase(ABC):
     """Abstract base class for all loggers."""
 
@@ -18,21 +88,84 @@ class LoggerBase(ABC):
     def log(self, data: Any, level: str = "info") -> None:
         pass
 
+    def write_batch(self, records: List[LogRecord]) -> None:
+        for _, level, data in records:
+            self.log(data, level)
+
+    def close(self) -> None:
+        pass
+
+    def after_fork(self) -> None:
+        pass
+
 class JsonFileLogger(LoggerBase):
-    """Logs messages to a JSON file."""
+    """
+    Logs messages to a JSON lines file kept open between batches.
+    Rotates to <file>.1 ... <file>.<backup_count> by size and / or age; a worker whose file was
+    rotated by another worker notices the new inode and reopens the path.
+    """
 
-    def __init__(self, file_path: str = "app.log"):
+    def __init__(self, file_path: str = "app.log", max_bytes: int = 0, rotate_interval_sec: int = 0, backup_count: int = 5):
         self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.rotate_interval_sec = rotate_interval_sec
+        self.backup_count = backup_count
         self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+
+    def _open(self) -> None:
+        self._file = open(self.file_path, "ab")
+        self._opened_at = time.time()
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.file_path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval_sec) and time.time() - self._opened_at >= self.rotate_interval_sec
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.file_path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.file_path}.{index + 1}")
+        if self.backup_count:
+            os.replace(self.file_path, f"{self.file_path}.1")
+        else:
+            os.remove(self.file_path)
+        self._open()
 
     def log(self, data: Any, level: str = "info") -> None:
-        entry = {
-            "timestamp": datetime.datetime.utcnow().isoformat(),
-            "level": level.upper(),
-            "message": str(data),
-        }
-        with self._lock, open(self.file_path, "a") as f:
-            f.write(json.dumps(entry)+ "\n")
+        self.write_batch([(time.time(), level, data)])
+
+    def write_batch(self, records: List[LogRecord]) -> None:
+        lines = b"".join(encode_record_safe(*record) for record in records)
+        with self._lock:
+            if self._file is None or self._rotated_elsewhere():
+                if self._file is not None:
+                    self._file.close()
+                self._open()
+            elif self._should_rotate():
+                self._rotate()
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def after_fork(self) -> None:
+        # the parent's writer thread may have held the lock at fork time
+        self._lock = threading.Lock()
+        self._file = None
 
 
 class StdoutLogger(LoggerBase):
@@ -45,7 +178,95 @@ class StdoutLogger(LoggerBase):
         msg =data
         getattr(self._logger, level.lower(), self._logger.info)(msg)
 
+    def write_batch(self, records: List[LogRecord]) -> None:
+        for timestamp, level, data in records:
+            self.log(encode_record_safe(timestamp, level, data)[:-1].decode("utf-8"), level)
+
+
+class QueueLogWriter:
+    """
+    Bounded queue drained by a single writer thread, which hands the logger batches of up to
+    batch_size records at least every flush_interval seconds.
+    When the queue is full, policy "drop" discards the record (counted and reported in the log)
+    while "block" makes the caller wait for room.
+    """
+
+    _STOP = object()
+
+    def __init__(self, logger: LoggerBase, max_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, policy: str = "drop"):
+        self._logger = logger
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        # incremented by producer threads, taken by the writer thread
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: LogRecord) -> bool:
+        """ Non-blocking enqueue, False when the queue is full (counted as dropped under the drop policy)"""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            if self.policy == "drop":
+                with self._dropped_lock:
+                    self.dropped += 1
+            return False
 
+    def put_blocking(self, record: LogRecord) -> None:
+        self._queue.put(record)
+
+    def _take_dropped(self) -> int:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def _write(self, batch: List[LogRecord]) -> None:
+        dropped = self._take_dropped()
+        if dropped:
+            batch.append((time.time(), "warning",
+                          {"message": "log_records_dropped", "count": dropped}))
+        try:
+            self._logger.write_batch(batch)
+        except Exception:
+            # records are encoded one by one (encode_record_safe), only I/O errors lose the batch;
+            # logging must never take the writer down
+            pass
+
+    def _run(self) -> None:
+        batch: List[LogRecord] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                record = None
+
+            if record is self._STOP:
+                if batch or self.dropped:
+                    self._write(batch)
+                return
+            if record is not None:
+                batch.append(record)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch or self.dropped:
+                    self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def close(self, timeout: float = 5.0) -> None:
+        """ Flushes queued records and stops the writer thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._logger.close()
 
 
 class GlobalLogger:
@@ -61,14 +282,70 @@ class GlobalLogger:
         return cls._instance
 
     def _initialize(self):
+        self.min_level = LEVELS.get(Config.LOG_LEVEL.lower(), logging.INFO)
+        # keep ratio per event ("message") of records below warning, e.g. {"llm_usage": 0.1}
+        self.sample_rates = Config.LOG_SAMPLE_RATES
         service = (LOGGER_SERVICE or "json").lower()
         if service == "stdout":
             self._logger = StdoutLogger()
         else:
-            self._logger = JsonFileLogger("app.log")  # default
+            self._logger = JsonFileLogger(
+                "app.log",
+                max_bytes=Config.LOG_MAX_BYTES,
+                rotate_interval_sec=Config.LOG_ROTATE_INTERVAL_SEC,
+                backup_count=Config.LOG_BACKUP_COUNT
+            )  # default
+        self._start_writer()
+        # last resort flush for exits that skip the app lifespan (CLI, celery workers)
+        atexit.register(self.close)
+        # threads do not survive fork (prefork servers / celery), children start their own writer
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._logger.after_fork()
+        self._start_writer()
+
+    def _start_writer(self) -> None:
+        self._writer = QueueLogWriter(
+            self._logger,
+            max_size=Config.LOG_QUEUE_SIZE,
+            batch_size=Config.LOG_BATCH_SIZE,
+            flush_interval=Config.LOG_FLUSH_INTERVAL_SEC,
+            policy=Config.LOG_QUEUE_POLICY
+        )
+
+    def is_enabled(self, level: str = "info") -> bool:
+        """ Whether records of level are kept, for call sites building expensive payloads"""
+        return LEVELS.get(level.lower(), logging.INFO) >= self.min_level
+
+    def _sampled_out(self, data: Any, level: str) -> bool:
+        if not self.sample_rates or not isinstance(data, dict) or LEVELS.get(level.lower(), logging.INFO) >= logging.WARNING:
+            return False
+        rate = self.sample_rates.get(data.get("message"))
+        return rate is not None and random.random() >= rate
 
     async def log_event(self, data: Any, level: str = "info") -> None:
-        await anyio.to_thread.run_sync(self._logger.log, data, level)
+        # filtered before anything is copied or encoded
+        if not self.is_enabled(level) or self._sampled_out(data, level):
+            return
+        try:
+            data = snapshot(data)
+        except Exception as e:
+            # a payload that cannot even be dumped must not fail the caller
+            data = {"message": "log_record_unencodable", "error": f"{type(e).__name__}: {e}"}
+        # entries written inside a sampled span carry its ids for log / trace correlation
+        trace_ids = current_trace_ids()
+        if trace_ids and isinstance(data, dict):
+            data.update(trace_ids)
+        record = (time.time(), level, data)
+        if not self._writer.put(record) and self._writer.policy == "block":
+            # backpressure: wait for room off the event loop
+            with tracer.start_as_current_span("log_event.backpressure"):
+                await anyio.to_thread.run_sync(self._writer.put_blocking, record)
+
+    def close(self) -> None:
+        """ Flushes pending log records (called on shutdown)"""
+        self._writer.close()
 
 # Global access
 global_logger = GlobalLogger()
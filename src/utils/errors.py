@@ -1,7 +1,8 @@
-from typing import Any,Callable 
+from typing import Any,Callable,Dict,Optional 
 from fastapi import FastAPI,status
 from fastapi.requests import Request
-from fastapi.responses import JSONResponse 
+from fastapi.responses import ORJSONResponse 
+from src.constants.config import Config
 
 class CustomException(Exception):
     """
@@ -55,14 +56,22 @@ class AccountIsInactive(CustomException):
     """ User Account is inactive"""
     pass 
 
+class QuotaExceeded(CustomException):
+    """ User has used up the daily LLM call / token quota"""
+    pass 
+
+class ServiceOverloaded(CustomException):
+    """ Too much LLM work in flight, the request is shed"""
+    pass 
+
 class InternalServerError(CustomException):
     """ Internal Server Error Occurred"""
     pass 
 
-def create_exception_handler(status_code:int,data:Any)->Callable[[Request,Exception],JSONResponse]:
+def create_exception_handler(status_code:int,data:Any,headers:Optional[Dict[str,str]]=None)->Callable[[Request,Exception],ORJSONResponse]:
     """ this will return error handler function """
-    async def exception_handler(request:Request,exc:CustomException)->JSONResponse:
-        return JSONResponse(status_code=status_code,content=data)
+    async def exception_handler(request:Request,exc:CustomException)->ORJSONResponse:
+        return ORJSONResponse(status_code=status_code,content=data,headers=headers)
     
     return exception_handler
 
@@ -182,6 +191,29 @@ def register_error_handlers(app: FastAPI):
             }
         )
     )
+    app.add_exception_handler(
+        QuotaExceeded,
+        create_exception_handler(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            data={
+                "message":"Daily LLM quota exceeded",
+                "error_code":"quota_exceeded",
+                "resolution":"Cached dishes can still be requested, new estimations resume tomorrow (UTC)"
+            }
+        )
+    )
+    app.add_exception_handler(
+        ServiceOverloaded,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            data={
+                "message":"Service is overloaded",
+                "error_code":"service_overloaded",
+                "resolution":"Please retry shortly"
+            },
+            headers={"Retry-After":str(Config.ADMISSION_RETRY_AFTER_SEC)}
+        )
+    )
     app.add_exception_handler(
         InternalServerError,
         create_exception_handler(
@@ -0,0 +1,235 @@
+import os
+import time
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from starlette.responses import Response
+from starlette.types import ASGIApp,Message,Receive,Scope,Send
+
+"""
+Prometheus metrics. With several workers set PROMETHEUS_MULTIPROC_DIR (an empty directory shared
+by the workers, wiped before start): every process then writes its samples to mmap'ed files there
+and /metrics aggregates all of them.
+"""
+
+# LLM stages take seconds, redis / postgres calls milliseconds
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STORE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "endpoint", "status"], buckets=REQUEST_BUCKETS
+)
+LLM_STAGE_DURATION = Histogram(
+    "llm_stage_duration_seconds", "Latency of one LLM pipeline stage call",
+    ["stage", "outcome"], buckets=LLM_BUCKETS
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total", "Failed LLM stage calls by exception class",
+    ["stage", "error"]
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens consumed by LLM stage calls",
+    ["stage", "model", "kind"]
+)
+LLM_COST = Counter(
+    "llm_cost_usd_total", "Estimated LLM spend in USD",
+    ["stage", "model"]
+)
+# LLM usage per request / job, labelled once its cache outcome is known (see src/estimator/usage.py)
+LLM_USAGE_REQUESTS = Counter(
+    "llm_usage_requests_total", "Requests / jobs by endpoint and how their analyses were obtained",
+    ["endpoint", "cache"]
+)
+LLM_USAGE_CALLS = Counter(
+    "llm_usage_calls_total", "LLM stage calls by endpoint, stage and cache outcome of the request",
+    ["endpoint", "stage", "cache", "outcome"]
+)
+LLM_USAGE_TOKENS = Counter(
+    "llm_usage_tokens_total", "Tokens by endpoint, stage and cache outcome of the request",
+    ["endpoint", "stage", "cache", "kind"]
+)
+LLM_USAGE_COST = Counter(
+    "llm_usage_cost_usd_total", "Estimated LLM spend in USD by endpoint, stage and cache outcome of the request",
+    ["endpoint", "stage", "cache"]
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by cache (dish, ingredient, image, user) and result",
+    ["cache", "result"]
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds", "Redis round trip latency by command (pipelines as PIPELINE)",
+    ["command"], buckets=STORE_BUCKETS
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Postgres statement latency by statement type",
+    ["operation"], buckets=STORE_BUCKETS
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests answered 429 by the sliding window rate limiter",
+    ["endpoint"]
+)
+LLM_QUOTA_REJECTIONS = Counter(
+    "llm_quota_rejections_total", "LLM calls refused because the daily quota was used up, by subject kind (user, ip)",
+    ["subject"]
+)
+ADMISSION_IN_FLIGHT = Gauge(
+    "llm_admission_in_flight", "LLM pipelines admitted and running",
+    multiprocess_mode="livesum"
+)
+ADMISSION_QUEUED = Gauge(
+    "llm_admission_queued", "LLM pipelines waiting for admission",
+    multiprocess_mode="livesum"
+)
+ADMISSION_LIMIT = Gauge(
+    "llm_admission_limit", "Current adaptive limit of concurrent LLM pipelines",
+    multiprocess_mode="livesum"
+)
+ADMISSION_REJECTIONS = Counter(
+    "llm_admission_rejections_total", "LLM pipelines refused with 503 by reason (queue_full, queue_timeout)",
+    ["reason"]
+)
+LLM_SCHEDULER_QUEUE_WAIT = Histogram(
+    "llm_scheduler_queue_wait_seconds", "Time an LLM stage call waited for a slot, by priority class",
+    ["priority"], buckets=REQUEST_BUCKETS
+)
+LLM_SCHEDULER_QUEUED = Gauge(
+    "llm_scheduler_queued", "LLM stage calls waiting for a slot, by priority class",
+    ["priority"], multiprocess_mode="livesum"
+)
+LLM_SCHEDULER_IN_FLIGHT = Gauge(
+    "llm_scheduler_in_flight", "LLM stage calls running, by priority class",
+    ["priority"], multiprocess_mode="livesum"
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Postgres connections checked out of the pool",
+    ["pool"], multiprocess_mode="livesum"
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity", "Postgres connections the pool may open (pool size + overflow)",
+    ["pool"], multiprocess_mode="livesum"
+)
+PASSWORD_HASH_PENDING = Gauge(
+    "password_hash_pending", "bcrypt jobs queued or running in the password hashing pool",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_QUEUE_WAIT = Histogram(
+    "password_hash_queue_wait_seconds", "Time a bcrypt job waited for a password hashing thread",
+    ["operation"], buckets=REQUEST_BUCKETS
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "bcrypt hash / verify time",
+    ["operation"], buckets=REQUEST_BUCKETS
+)
+
+
+def record_cache_lookup(cache: str, hits: int, misses: int = 0) -> None:
+    if hits:
+        CACHE_LOOKUPS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, "miss").inc(misses)
+
+
+class InstrumentedRedis(Redis):
+    """ Redis client timing every command round trip"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(str(args[0]).upper()).observe(time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return _InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _InstrumentedPipeline(Pipeline):
+
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - start)
+
+
+def instrument_engine(sync_engine) -> None:
+    """ Times every statement of a (sync facade of an async) SQLAlchemy engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - context._query_start)
+
+
+def instrument_pool(sync_engine, name: str, capacity: int) -> None:
+    """ Tracks checked out connections of an engine's pool against its capacity (saturation = in use / capacity)"""
+    from sqlalchemy import event
+
+    DB_POOL_CAPACITY.labels(name).set(capacity)
+    in_use = DB_POOL_IN_USE.labels(name)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        in_use.inc()
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        in_use.dec()
+
+
+class MetricsMiddleware:
+    """ Records the latency of every HTTP request, labelled by route template and status class"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            endpoint = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_DURATION.labels(scope["method"], endpoint, f"{status_code // 100}xx").observe(
+                time.perf_counter() - start
+            )
+
+
+def metrics_response() -> Response:
+    """ Exposition of this process' metrics, or of all workers in multiprocess mode"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
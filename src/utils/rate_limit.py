@@ -0,0 +1,131 @@
+import math
+import time
+import uuid
+from typing import Dict,List,Optional,Tuple
+import orjson
+from starlette.datastructures import Headers,MutableHeaders
+from starlette.routing import Match
+from starlette.types import ASGIApp,Message,Receive,Scope,Send
+from src.auth.utils import verify_token_cached
+from src.db.redis_client import sliding_window_hit
+from src.estimator.quota import set_quota_subject
+from src.logging.logger import global_logger
+from src.utils.metrics import RATE_LIMIT_REJECTIONS
+
+"""
+Sliding window rate limiting, shared by all workers through one Redis Lua script.
+
+Every request under path_prefix counts against one window per client IP and, with a valid
+bearer token, one per user. Both are kept per route template ("POST /api/v1/estimator/estimate"),
+limits from per_ip / per_user unless endpoint_limits names the route. A request over any limit is
+answered 429 without reaching the app. Responses carry RateLimit-Limit / RateLimit-Remaining /
+RateLimit-Reset of the tightest window, plus Retry-After on a 429. Redis errors let requests
+through (fail open).
+"""
+
+
+def match_route(scope:Scope)->Optional[object]:
+    """ The app route fully matching the request, resolved ahead of the router"""
+    for route in scope["app"].router.routes:
+        match,child_scope=route.matches(scope)
+        if match==Match.FULL:
+            return child_scope.get("route",route)
+    return None
+
+def request_user_uid(scope:Scope)->Optional[str]:
+    """ user_uid of a valid bearer token (signature and expiry only, revocation is left to the route)"""
+    authorization=Headers(scope=scope).get("authorization","")
+    scheme,_,token=authorization.partition(" ")
+    if scheme.lower()!="bearer" or not token:
+        return None
+    token_data=verify_token_cached(token.strip())
+    return token_data.get("user",{}).get("user_uid") if token_data else None
+
+
+class RateLimitMiddleware:
+
+    def __init__(self,app:ASGIApp,window_sec:int=60,per_ip:int=120,per_user:int=240,
+                 endpoint_limits:Optional[Dict[str,int]]=None,path_prefix:str="/api/",enabled:bool=True):
+        self.app=app
+        self.window_ms=window_sec*1000
+        self.per_ip=per_ip
+        self.per_user=per_user
+        self.endpoint_limits=endpoint_limits or {}
+        self.path_prefix=path_prefix
+        self.enabled=enabled
+
+    def _windows(self,endpoint:str,client_ip:str,user_uid:Optional[str])->Tuple[List[str],List[int]]:
+        override=self.endpoint_limits.get(endpoint)
+        keys=[f"ratelimit:{endpoint}:ip:{client_ip}"]
+        limits=[override or self.per_ip]
+        if user_uid:
+            keys.append(f"ratelimit:{endpoint}:user:{user_uid}")
+            limits.append(override or self.per_user)
+        return keys,limits
+
+    async def __call__(self,scope:Scope,receive:Receive,send:Send)->None:
+        if scope["type"]!="http":
+            await self.app(scope,receive,send)
+            return
+
+        client_ip=scope["client"][0] if scope.get("client") else "unknown"
+        user_uid=request_user_uid(scope)
+        # LLM quota of this request, see src/estimator/quota.py
+        set_quota_subject(f"user:{user_uid}" if user_uid else f"ip:{client_ip}")
+
+        route=match_route(scope) if self.enabled and scope["path"].startswith(self.path_prefix) else None
+        if route is None:
+            await self.app(scope,receive,send)
+            return
+
+        endpoint=f"{scope['method']} {route.path}"
+        keys,limits=self._windows(endpoint,client_ip,user_uid)
+        now_ms=int(time.time()*1000)
+        try:
+            admitted,limit,remaining,reset_ms=await sliding_window_hit(
+                keys,limits,self.window_ms,now_ms,f"{now_ms}-{uuid.uuid4().hex[:8]}"
+            )
+        except Exception as e:
+            await global_logger.log_event(
+                data={
+                    "message":"rate_limiter_unavailable",
+                    "error":str(e)
+                },
+                level="error"
+            )
+            await self.app(scope,receive,send)
+            return
+
+        headers={
+            "RateLimit-Limit":str(limit),
+            "RateLimit-Remaining":str(remaining),
+            "RateLimit-Reset":str(math.ceil(reset_ms/1000))
+        }
+        if not admitted:
+            RATE_LIMIT_REJECTIONS.labels(endpoint).inc()
+            # lets the outer middlewares label the rejection with its route
+            scope["route"]=route
+            body=orjson.dumps({
+                "message":"Too many requests",
+                "error_code":"rate_limited",
+                "resolution":f"Retry in {headers['RateLimit-Reset']} seconds"
+            })
+            await send({
+                "type":"http.response.start",
+                "status":429,
+                "headers":[
+                    (b"content-type",b"application/json"),
+                    (b"content-length",str(len(body)).encode()),
+                    (b"retry-after",headers["RateLimit-Reset"].encode()),
+                    *((name.lower().encode(),value.encode()) for name,value in headers.items())
+                ]
+            })
+            await send({"type":"http.response.body","body":body})
+            return
+
+        async def send_with_headers(message:Message)->None:
+            if message["type"]=="http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        await self.app(scope,receive,send_with_headers)
@@ -0,0 +1,172 @@
+import functools
+import threading
+from typing import Optional,Sequence
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan,TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBased,TraceIdRatioBased
+from opentelemetry.trace import Status,StatusCode
+from starlette.types import ASGIApp,Message,Receive,Scope,Send
+from src.constants.config import Config
+
+"""
+OpenTelemetry tracing. TRACING_EXPORTER selects where spans go:
+    none    tracing disabled (default), spans are no-ops
+    console spans printed to stdout
+    file    one JSON span per line in TRACING_FILE, for offline analysis
+    memory  kept in process, see finished_spans()
+    otlp    sent to TRACING_OTLP_ENDPOINT (needs opentelemetry-exporter-otlp-proto-http)
+Root spans are sampled with TRACING_SAMPLE_RATIO, children follow their parent's decision,
+so unsampled requests only pay for no-op spans.
+"""
+
+tracer = trace.get_tracer("carbon-footprint-estimator")
+_memory_exporter: Optional[InMemorySpanExporter] = None
+_provider: Optional[TracerProvider] = None
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """ Appends finished spans as JSON lines to a local file"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock, open(self.file_path, "a") as f:
+            f.write(lines)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def setup_tracing() -> None:
+    """ Installs the tracer provider configured by TRACING_EXPORTER (once per process)"""
+    global _provider, _memory_exporter
+    exporter_name = Config.TRACING_EXPORTER.lower()
+    if exporter_name == "none" or _provider is not None:
+        return
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "carbon-footprint-estimator"}),
+        sampler=ParentBased(TraceIdRatioBased(Config.TRACING_SAMPLE_RATIO))
+    )
+    if exporter_name == "memory":
+        _memory_exporter = InMemorySpanExporter()
+        provider.add_span_processor(SimpleSpanProcessor(_memory_exporter))
+    elif exporter_name == "console":
+        provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    elif exporter_name == "file":
+        provider.add_span_processor(BatchSpanProcessor(JsonLinesSpanExporter(Config.TRACING_FILE)))
+    elif exporter_name == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            raise ImportError("TRACING_EXPORTER=otlp needs the opentelemetry-exporter-otlp-proto-http package") from e
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=Config.TRACING_OTLP_ENDPOINT)))
+    else:
+        raise ValueError(f"Unsupported TRACING_EXPORTER: {Config.TRACING_EXPORTER}")
+
+    trace.set_tracer_provider(provider)
+    _provider = provider
+
+def shutdown_tracing() -> None:
+    """ Flushes buffered spans (called on shutdown)"""
+    if _provider is not None:
+        _provider.shutdown()
+
+def finished_spans() -> Sequence[ReadableSpan]:
+    """ Spans collected by the memory exporter"""
+    return _memory_exporter.get_finished_spans() if _memory_exporter else ()
+
+
+def current_trace_ids() -> Optional[dict]:
+    """ trace_id / span_id of the active sampled span, for log correlation"""
+    context = trace.get_current_span().get_span_context()
+    if not context.is_valid:
+        return None
+    return {"trace_id": format(context.trace_id, "032x"), "span_id": format(context.span_id, "016x")}
+
+
+def traced(name: str):
+    """ Runs the decorated coroutine function inside a span called name"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_engine_tracing(sync_engine) -> None:
+    """ One client span per SQL statement, child of the span active in the calling task"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        span = tracer.start_span(f"db.{operation.lower()}", kind=trace.SpanKind.CLIENT)
+        if span.is_recording():
+            span.set_attribute("db.system", "postgresql")
+            span.set_attribute("db.statement", statement[:1000])
+        context._trace_span = span
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        span = getattr(exception_context.execution_context, "_trace_span", None)
+        if span is not None:
+            span.set_status(Status(StatusCode.ERROR, str(exception_context.original_exception)))
+            span.end()
+
+
+class TracingMiddleware:
+    """ Server span per HTTP request (continuing an incoming traceparent), named after the route template"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        with tracer.start_as_current_span(
+            f"{scope['method']} unmatched", context=extract(carrier), kind=trace.SpanKind.SERVER
+        ) as span:
+
+            async def send_with_status(message: Message) -> None:
+                if message["type"] == "http.response.start" and span.is_recording():
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status(Status(StatusCode.ERROR))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = scope.get("route")
+                if route is not None and span.is_recording():
+                    span.update_name(f"{scope['method']} {route.path}")
+                    span.set_attribute("http.route", route.path)
+                if span.is_recording():
+                    span.set_attribute("http.method", scope["method"])
+                    span.set_attribute("http.target", scope["path"])
@@ -0,0 +1,172 @@
+"""
+Checkpoint / resume of bulk menu imports on a temporary IMPORT_DIR. The Redis lock and the
+estimation (LLMService.resolve_analyses) are replaced per test, so a "dish" is valid unless its
+name is in INVALID.
+"""
+import asyncio
+from datetime import datetime,timezone
+from uuid import uuid4
+import pytest
+from src.constants.config import Config
+from src.estimator import bulk_import
+from src.estimator.llm_service import LLMService
+from src.estimator.schemas import DishCarbonAnalysisResponse,DishIngredients,DishMetrics,ImportJob,IngredientCarbonResponse
+from src.utils.errors import QuotaExceeded
+
+INVALID={"soup"}
+HEADER=",".join(bulk_import.RESULT_COLUMNS)
+
+
+def analysis(name:str)->DishCarbonAnalysisResponse:
+    return DishCarbonAnalysisResponse(
+        metrics=DishMetrics(dish=name,carbon_per_serving_kg=0.5,impact_rating="B"),
+        ingredients=DishIngredients(dish=name,ingredients=[]),
+        lca=IngredientCarbonResponse(results=[])
+    )
+
+
+class Estimator:
+    """ resolve_analyses recording its chunks, failing with fail_with on call number fail_on"""
+
+    def __init__(self):
+        self.chunks=[]
+        self.fail_on=None
+        self.fail_with=RuntimeError("provider down")
+
+    async def resolve_analyses(self,dish_names):
+        self.chunks.append(list(dish_names))
+        if len(self.chunks)==self.fail_on:
+            raise self.fail_with
+        return {name:analysis(name) for name in dish_names if name not in INVALID}
+
+
+@pytest.fixture
+def estimator(tmp_path,monkeypatch):
+    async def acquire_lock(name,owner,ttl):
+        return True
+
+    async def release_lock(name,owner):
+        return True
+
+    estimator=Estimator()
+    monkeypatch.setattr(bulk_import,"IMPORT_DIR",tmp_path)
+    monkeypatch.setattr(bulk_import,"acquire_lock",acquire_lock)
+    monkeypatch.setattr(bulk_import,"release_lock",release_lock)
+    monkeypatch.setattr(LLMService,"resolve_analyses",staticmethod(estimator.resolve_analyses))
+    monkeypatch.setattr(Config,"IMPORT_CHUNK_SIZE",2)
+    return estimator
+
+def queued_job(*dishes:str)->ImportJob:
+    now=datetime.now(timezone.utc)
+    job=ImportJob(job_id=uuid4(),owner_uuid=uuid4(),source_format="csv",column="dish",created_at=now,updated_at=now)
+    bulk_import.job_dir(job.job_id).mkdir()
+    bulk_import.source_path(job).write_text("\n".join(("dish",)+dishes)+"\n",encoding="utf-8")
+    bulk_import._save_job(job)
+    return job
+
+def result_rows(job:ImportJob)->list:
+    return bulk_import.results_path(job.job_id).read_text(encoding="utf-8").splitlines()
+
+async def run(job:ImportJob)->ImportJob:
+    await bulk_import.run_import(job.job_id)
+    return bulk_import.load_job(job.job_id)
+
+
+def test_checkpoint_round_trip_is_atomic(estimator):
+    job=queued_job("dal")
+    job.rows_read=7
+    bulk_import._save_job(job)
+    assert bulk_import.load_job(job.job_id)==job
+    assert [path.name for path in bulk_import.job_dir(job.job_id).iterdir() if path.suffix==".tmp"]==[]
+    assert bulk_import.load_job(uuid4()) is None
+
+
+def test_reset_results_drops_bytes_after_the_checkpoint(estimator):
+    job=queued_job("dal")
+    job.output_bytes=bulk_import._reset_results(job)
+    assert result_rows(job)==[HEADER]
+
+    with open(bulk_import.results_path(job.job_id),"ab") as f:
+        f.write(b"half written ro")
+    assert bulk_import._reset_results(job)==job.output_bytes
+    assert result_rows(job)==[HEADER]
+
+
+def test_import_dedupes_and_writes_a_row_per_dish(estimator):
+    job=queued_job("Dal"," dal ",'""',"Rice","Soup","rice")
+    job=asyncio.run(run(job))
+    assert job.status=="completed"
+    assert estimator.chunks==[["dal","rice"],["soup"]]
+    assert (job.rows_read,job.rows_skipped,job.duplicates_skipped)==(6,1,2)
+    assert (job.dishes_processed,job.dishes_succeeded,job.dishes_failed)==(3,2,1)
+    rows=result_rows(job)
+    assert rows[0]==HEADER
+    assert [row.split(",")[:3] for row in rows[1:]]==[
+        ["Dal","dal","ok"],["Rice","rice","ok"],["Soup","soup","invalid_dish"]
+    ]
+
+
+def test_failed_import_resumes_at_the_last_checkpoint(estimator):
+    job=queued_job("Dal","Rice",'""',"dal","Pasta","Soup","Curry")
+    estimator.fail_on=2
+    failed=asyncio.run(run(job))
+    assert failed.status=="failed" and failed.error=="provider down"
+    # the checkpoint of the first chunk, nothing of the failed one
+    assert (failed.rows_read,failed.rows_skipped,failed.duplicates_skipped,failed.dishes_processed)==(2,0,0,2)
+    with open(bulk_import.results_path(job.job_id),"ab") as f:
+        f.write(b"Pasta,pasta,ok,0.5")
+
+    async def retry()->ImportJob:
+        await bulk_import.retry_import(failed)
+        await bulk_import._running_imports[job.job_id]
+        return bulk_import.load_job(job.job_id)
+
+    estimator.fail_on=None
+    resumed=asyncio.run(retry())
+    assert resumed.status=="completed" and resumed.error is None
+    # rows before the checkpoint are not estimated again but still dedupe the rest
+    assert estimator.chunks[2:]==[["pasta","soup"],["curry"]]
+    assert (resumed.rows_read,resumed.rows_skipped,resumed.duplicates_skipped)==(7,1,1)
+    assert (resumed.dishes_processed,resumed.dishes_succeeded,resumed.dishes_failed)==(5,4,1)
+    assert [row.split(",")[1] for row in result_rows(job)[1:]]==["dal","rice","pasta","soup","curry"]
+
+
+def test_exhausted_quota_pauses_until_the_next_utc_day(estimator):
+    job=queued_job("Dal","Rice","Pasta")
+    estimator.fail_on=2
+    estimator.fail_with=QuotaExceeded("daily LLM quota exhausted")
+
+    async def scenario():
+        paused=await run(job)
+        scheduled=job.job_id in bulk_import._scheduled_imports
+        # started again before the reset: rescheduled, nothing estimated
+        chunks=len(estimator.chunks)
+        still_paused=await run(job)
+        assert len(estimator.chunks)==chunks
+        await bulk_import.stop_imports()
+        return paused,scheduled,still_paused
+
+    paused,scheduled,still_paused=asyncio.run(scenario())
+    assert paused.status=="paused_quota"
+    assert paused.paused_until==bulk_import.next_quota_reset()
+    assert paused.rows_read==2 and paused.dishes_processed==2
+    assert scheduled
+    assert still_paused.status=="paused_quota"
+
+
+def test_lock_held_elsewhere_retries_later(estimator,monkeypatch):
+    async def acquire_lock(name,owner,ttl):
+        return False
+
+    monkeypatch.setattr(bulk_import,"acquire_lock",acquire_lock)
+    job=queued_job("Dal")
+
+    async def scenario():
+        untouched=await run(job)
+        scheduled=job.job_id in bulk_import._scheduled_imports
+        await bulk_import.stop_imports()
+        return untouched,scheduled
+
+    untouched,scheduled=asyncio.run(scenario())
+    assert untouched.status=="queued" and estimator.chunks==[]
+    assert scheduled
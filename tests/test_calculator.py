@@ -0,0 +1,120 @@
+"""
+What-if edits (edit_ingredients, scale_ingredients) and meal plan rollups (aggregate_meal_plan),
+computed locally from analyses built in the test.
+"""
+from datetime import date
+import pytest
+from src.estimator.calculator import aggregate_meal_plan,edit_ingredients,scale_ingredients
+from src.estimator.schemas import (
+    AnalysisAdjustment,
+    DishCarbonAnalysisResponse,
+    DishIngredients,
+    DishMetrics,
+    Ingredient,
+    IngredientCarbonFootprint,
+    IngredientCarbonResponse,
+    MealPlanEntry,
+)
+
+
+def footprint(name:str,carbon_kg:float)->IngredientCarbonFootprint:
+    # half farming, the rest spread over the other stages
+    return IngredientCarbonFootprint(
+        ingredient_name=name,
+        matched_ingredient=name,
+        carbon_footprint_kg_co2e=carbon_kg,
+        farming_footprint_kg_co2e=carbon_kg*0.5,
+        packaging_footprint_kg_co2e=carbon_kg*0.1,
+        processing_footprint_kg_co2e=carbon_kg*0.2,
+        retail_footprint_kg_co2e=carbon_kg*0.1,
+        transportation_footprint_kg_co2e=carbon_kg*0.1,
+        match_confidence=1.0,
+        matched=True,
+        lca_source="test"
+    )
+
+def analysis(dish:str,ingredients:dict)->DishCarbonAnalysisResponse:
+    """ Per serving analysis from {ingredient: (weight_kg, carbon_kg)}"""
+    return DishCarbonAnalysisResponse(
+        metrics=DishMetrics(dish=dish,carbon_per_serving_kg=sum(carbon for _,carbon in ingredients.values())),
+        ingredients=DishIngredients(dish=dish,ingredients=[
+            Ingredient(ingredient_name=name,ingredient_weight_kg=weight) for name,(weight,_) in ingredients.items()
+        ]),
+        lca=IngredientCarbonResponse(results=[footprint(name,carbon) for name,(_,carbon) in ingredients.items()])
+    )
+
+def weights(ingredients:list)->dict:
+    return {ingredient.ingredient_name:ingredient.ingredient_weight_kg for ingredient in ingredients}
+
+
+DAL=[
+    Ingredient(ingredient_name="Lentils",ingredient_weight_kg=0.1),
+    Ingredient(ingredient_name="onion",ingredient_weight_kg=0.05),
+    Ingredient(ingredient_name="ghee",ingredient_weight_kg=0.01)
+]
+
+
+def test_edit_ingredients_removes_overrides_and_adds():
+    adjustment=AnalysisAdjustment(
+        removed_ingredients=["GHEE"],
+        weight_overrides={"onion":0.08},
+        added_ingredients=[{"ingredient_name":"spinach","ingredient_weight_kg":0.03}]
+    )
+    assert weights(edit_ingredients(DAL,adjustment))=={"Lentils":0.1,"onion":0.08,"spinach":0.03}
+
+
+def test_edit_ingredients_merges_an_added_ingredient_by_name():
+    adjustment=AnalysisAdjustment(added_ingredients=[{"ingredient_name":" lentils ","ingredient_weight_kg":0.05}])
+    edited=edit_ingredients(DAL,adjustment)
+    # merged into the existing entry, which keeps its name
+    assert weights(edited)=={"Lentils":0.15,"onion":0.05,"ghee":0.01}
+
+
+def test_edit_ingredients_rejects_unknown_ingredients():
+    with pytest.raises(ValueError,match="paneer"):
+        edit_ingredients(DAL,AnalysisAdjustment(removed_ingredients=["paneer"]))
+    with pytest.raises(ValueError,match="rice"):
+        edit_ingredients(DAL,AnalysisAdjustment(weight_overrides={"rice":0.2}))
+
+
+def test_scale_ingredients_multiplies_and_rounds_weights():
+    scaled=scale_ingredients([Ingredient(ingredient_name="rice",ingredient_weight_kg=0.0333)],servings=3)
+    assert weights(scaled)=={"rice":0.0999}
+    assert weights(scale_ingredients(DAL,servings=1))==weights(DAL)
+
+
+def test_aggregate_meal_plan_rolls_up_days_weeks_and_ingredients():
+    analyses={
+        "dal":analysis("Dal",{"lentils":(0.1,0.2)}),
+        "rice bowl":analysis("Rice Bowl",{"rice":(0.2,0.5),"Lentils":(0.05,0.1)})
+    }
+    entries=[
+        MealPlanEntry(dish="Dal",servings=2,day=date(2026,1,5)),
+        MealPlanEntry(dish="rice  bowl",servings=1,day=date(2026,1,5)),
+        MealPlanEntry(dish="dal",servings=1,day=date(2026,1,11)),
+        MealPlanEntry(dish="Rice Bowl",servings=1,day=date(2026,1,12)),
+        MealPlanEntry(dish="Pizza",servings=1,day=date(2026,1,12))
+    ]
+    plan=aggregate_meal_plan(entries,analyses)
+
+    assert plan.total.carbon_kg==pytest.approx(1.8)
+    assert plan.total.farming_kg==pytest.approx(0.9)
+    assert [(day.period,day.carbon_kg) for day in plan.days]==[
+        ("2026-01-05",pytest.approx(1.0)),("2026-01-11",pytest.approx(0.2)),("2026-01-12",pytest.approx(0.6))
+    ]
+    # Monday 5th and Sunday 11th share ISO week 2
+    assert [(week.period,week.carbon_kg) for week in plan.weeks]==[
+        ("2026-W02",pytest.approx(1.2)),("2026-W03",pytest.approx(0.6))
+    ]
+    # largest footprint first, ingredients merged across dishes by normalized name
+    assert [(item.ingredient_name,item.weight_kg,item.carbon_kg) for item in plan.ingredients]==[
+        ("rice",pytest.approx(0.4),pytest.approx(1.0)),("lentils",pytest.approx(0.4),pytest.approx(0.8))
+    ]
+    assert plan.unresolved_dishes==["Pizza"]
+
+
+def test_aggregate_meal_plan_without_known_dishes():
+    plan=aggregate_meal_plan([MealPlanEntry(dish="Pizza",day=date(2026,1,5))],{})
+    assert plan.total.carbon_kg==0
+    assert plan.days==[] and plan.weeks==[] and plan.ingredients==[]
+    assert plan.unresolved_dishes==["Pizza"]
@@ -0,0 +1,93 @@
+"""
+Conditional GET of an estimated dish (ETag, 304, canonical 308 redirect) and the opaque keyset
+cursor of /history. The router is mounted on a bare app, the Redis lookups are replaced per test.
+"""
+from datetime import datetime,timezone
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.estimator import routes
+from src.estimator.llm_service import LLMService
+from src.estimator.utils import decode_history_cursor,dish_etag,encode_history_cursor,etag_matches
+
+PREFIX="/api/v1/estimator"
+BODY=b'{"dish_metrics":{"metrics":{"dish":"dal"}}}'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    cached={"dal":(BODY,120)}
+    lookups=[]
+
+    async def dish_response_with_ttl(dish_name:str):
+        lookups.append(dish_name)
+        return cached.get(dish_name,(None,0))
+
+    async def lookup_analysis(normalized_name:str,cache_checked:bool=False,store_checked:bool=False):
+        return None
+
+    monkeypatch.setattr(routes,"dish_response_with_ttl",dish_response_with_ttl)
+    monkeypatch.setattr(LLMService,"lookup_analysis",staticmethod(lookup_analysis))
+    app=FastAPI()
+    app.include_router(routes.estimator_router,prefix=PREFIX)
+    client=TestClient(app)
+    client.lookups=lookups
+    return client
+
+
+def test_etag_matches_weak_lists_and_wildcard():
+    etag=dish_etag(BODY)
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag==dish_etag(BODY) and etag!=dish_etag(BODY+b" ")
+    assert etag_matches(etag,etag)
+    assert etag_matches(f'"other", W/{etag}',etag)
+    assert etag_matches("*",etag)
+    assert not etag_matches(None,etag)
+    assert not etag_matches('"other"',etag)
+
+
+def test_get_dish_serves_cached_body_with_validators(client):
+    response=client.get(f"{PREFIX}/dishes/dal")
+    assert response.status_code==200
+    assert response.content==BODY
+    assert response.headers["etag"]==dish_etag(BODY)
+    assert response.headers["cache-control"]=="public, max-age=120"
+
+
+def test_get_dish_answers_304_to_a_matching_etag(client):
+    etag=dish_etag(BODY)
+    response=client.get(f"{PREFIX}/dishes/dal",headers={"If-None-Match":f'W/{etag}'})
+    assert response.status_code==304
+    assert response.content==b""
+    assert response.headers["etag"]==etag
+
+    response=client.get(f"{PREFIX}/dishes/dal",headers={"If-None-Match":'"stale"'})
+    assert response.status_code==200
+
+
+def test_get_dish_redirects_to_the_canonical_name(client):
+    response=client.get(f"{PREFIX}/dishes/%20Dal%20",follow_redirects=False)
+    assert response.status_code==308
+    assert response.headers["location"].endswith(f"{PREFIX}/dishes/dal")
+    # answered before any cache lookup
+    assert client.lookups==[]
+
+
+def test_get_dish_miss_is_404(client):
+    response=client.get(f"{PREFIX}/dishes/pizza")
+    assert response.status_code==404
+    assert client.lookups==["pizza"]
+
+
+def test_history_cursor_round_trip():
+    created_at=datetime(2026,3,1,12,30,15,123456,tzinfo=timezone.utc)
+    cursor=encode_history_cursor(created_at,42)
+    assert decode_history_cursor(cursor)==(created_at,42)
+    # url safe, the cursor goes into a query string as is
+    assert all(char.isalnum() or char in "-_=" for char in cursor)
+
+
+@pytest.mark.parametrize("cursor",["","not base64!","bm8gc2VwYXJhdG9y","MjAyNi0wMy0wMXxhYmM="])
+def test_history_cursor_rejects_malformed_input(cursor):
+    # "no separator" / "2026-03-01|abc"
+    assert decode_history_cursor(cursor) is None
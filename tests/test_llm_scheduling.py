@@ -0,0 +1,286 @@
+"""
+LLMScheduler (weighted fair queueing, per class caps) and AdmissionController (bounded queue,
+AIMD limit) driven with fake tasks: nothing here calls a provider, a "call" is a task holding
+a slot until the test releases it.
+"""
+import asyncio
+import pytest
+from src.estimator.admission import AdmissionController,record_provider_call
+from src.estimator.scheduler import LLMScheduler,set_llm_priority
+from src.utils.errors import QuotaExceeded,ServiceOverloaded
+
+WEIGHTS={"interactive":3,"batch":1,"background":1}
+NO_CAPS={"interactive":1.0,"batch":1.0,"background":1.0}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def settle()->None:
+    # lets every ready task run up to its next suspension point
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class FakeCalls:
+    """ Tasks taking a scheduler slot under a priority and holding it until released"""
+
+    def __init__(self,scheduler:LLMScheduler):
+        self.scheduler=scheduler
+        self.started=[]
+        self._release={}
+
+    def start(self,priority:str,name:str)->asyncio.Task:
+        self._release[name]=asyncio.Event()
+
+        async def call()->None:
+            set_llm_priority(priority)
+            async with self.scheduler.slot():
+                self.started.append(name)
+                await self._release[name].wait()
+
+        return asyncio.create_task(call())
+
+    def release(self,name:str)->None:
+        self._release[name].set()
+
+
+def test_scheduler_serves_classes_by_weight_under_backlog():
+    async def scenario():
+        scheduler=LLMScheduler(1,WEIGHTS,NO_CAPS)
+        calls=FakeCalls(scheduler)
+        tasks=[calls.start("interactive","blocker")]
+        await settle()
+        tasks+=[calls.start("batch",f"b{i}") for i in range(8)]
+        tasks+=[calls.start("interactive",f"i{i}") for i in range(8)]
+        await settle()
+
+        calls.release("blocker")
+        for _ in range(8):
+            await settle()
+            calls.release(calls.started[-1])
+        await settle()
+        for name in list(calls._release):
+            calls.release(name)
+        await asyncio.gather(*tasks)
+        return calls.started[1:9]
+
+    served=run(scenario())
+    # 3:1 while both classes are backlogged
+    assert sum(name.startswith("i") for name in served)==6
+    assert sum(name.startswith("b") for name in served)==2
+
+
+def test_scheduler_idle_class_does_not_bank_credit():
+    async def scenario():
+        scheduler=LLMScheduler(1,WEIGHTS,NO_CAPS)
+        calls=FakeCalls(scheduler)
+        tasks=[calls.start("batch","blocker")]
+        # batch runs alone for a while, its pass moves far ahead of the idle interactive class
+        for i in range(6):
+            await settle()
+            tasks.append(calls.start("batch",f"b{i}"))
+            await settle()
+            calls.release(calls.started[-1])
+        await settle()
+        tasks+=[calls.start("batch",f"late{i}") for i in range(4)]
+        tasks+=[calls.start("interactive",f"i{i}") for i in range(8)]
+        await settle()
+
+        for _ in range(5):
+            calls.release(calls.started[-1])
+            await settle()
+        served=calls.started[-5:]
+        for name in list(calls._release):
+            calls.release(name)
+        await asyncio.gather(*tasks)
+        return served
+
+    # interactive restarts at the current virtual time: batch keeps its 1 in 4 share right away
+    # instead of waiting for interactive to spend the credit of its idle period
+    served=run(scenario())
+    assert any(name.startswith("late") for name in served)
+
+
+def test_scheduler_caps_the_slots_of_a_class():
+    async def scenario():
+        scheduler=LLMScheduler(4,WEIGHTS,{"interactive":1.0,"batch":0.5,"background":0.25})
+        calls=FakeCalls(scheduler)
+        tasks=[calls.start("batch",f"b{i}") for i in range(6)]
+        await settle()
+        assert scheduler.in_flight["batch"]==2
+        assert len(scheduler._waiters["batch"])==4
+
+        tasks.append(calls.start("interactive","i0"))
+        await settle()
+        # free slots beyond the batch share stay available to interactive calls
+        assert "i0" in calls.started
+        assert scheduler.in_flight=={"interactive":1,"batch":2,"background":0}
+
+        for name in list(calls._release):
+            calls.release(name)
+        await asyncio.gather(*tasks)
+        assert scheduler.in_flight=={"interactive":0,"batch":0,"background":0}
+
+    run(scenario())
+
+
+def test_scheduler_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler=LLMScheduler(1,WEIGHTS,NO_CAPS)
+        calls=FakeCalls(scheduler)
+        blocker=calls.start("interactive","blocker")
+        await settle()
+        cancelled=calls.start("batch","cancelled")
+        waiting=calls.start("batch","waiting")
+        await settle()
+
+        cancelled.cancel()
+        await settle()
+        assert len(scheduler._waiters["batch"])==1
+
+        calls.release("blocker")
+        await settle()
+        assert calls.started==["blocker","waiting"]
+        calls.release("waiting")
+        await asyncio.gather(blocker,waiting)
+        assert cancelled.cancelled()
+        assert sum(scheduler.in_flight.values())==0
+
+    run(scenario())
+
+
+def test_scheduler_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        scheduler=LLMScheduler(1,WEIGHTS,NO_CAPS)
+        calls=FakeCalls(scheduler)
+        await scheduler._acquire("interactive")
+        granted=calls.start("batch","granted")
+        waiting=calls.start("batch","waiting")
+        await settle()
+
+        # the slot goes to "granted", which is cancelled before it resumes
+        scheduler._release("interactive")
+        granted.cancel()
+        await settle()
+        assert calls.started==["waiting"]
+        assert scheduler.in_flight["batch"]==1
+
+        calls.release("waiting")
+        await asyncio.gather(waiting)
+        assert sum(scheduler.in_flight.values())==0
+
+    run(scenario())
+
+
+def admission_controller(limit:int=1,max_queue:int=1,queue_timeout:float=5.0)->AdmissionController:
+    return AdmissionController(
+        initial_limit=limit,min_limit=1,max_limit=8,max_queue=max_queue,
+        queue_timeout=queue_timeout,latency_tolerance=2.0
+    )
+
+async def hold(controller:AdmissionController,release:asyncio.Event)->None:
+    async with controller.admit():
+        await release.wait()
+
+
+def test_admission_rejects_when_the_queue_is_full():
+    async def scenario():
+        controller=admission_controller(limit=1,max_queue=1)
+        release=asyncio.Event()
+        running=asyncio.create_task(hold(controller,release))
+        queued=asyncio.create_task(hold(controller,release))
+        await settle()
+        assert controller.in_flight==1 and len(controller._waiters)==1
+
+        with pytest.raises(ServiceOverloaded):
+            async with controller.admit():
+                pass
+
+        release.set()
+        await asyncio.gather(running,queued)
+        assert controller.in_flight==0 and not controller._waiters
+
+    run(scenario())
+
+
+def test_admission_rejects_after_the_queue_timeout():
+    async def scenario():
+        controller=admission_controller(limit=1,max_queue=4,queue_timeout=0.05)
+        release=asyncio.Event()
+        running=asyncio.create_task(hold(controller,release))
+        await settle()
+
+        with pytest.raises(ServiceOverloaded):
+            async with controller.admit():
+                pass
+        assert not controller._waiters
+
+        release.set()
+        await running
+        assert controller.in_flight==0
+
+    run(scenario())
+
+
+def test_admission_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller=admission_controller(limit=1,max_queue=4)
+        release=asyncio.Event()
+        running=asyncio.create_task(hold(controller,release))
+        await settle()
+        cancelled=asyncio.create_task(hold(controller,release))
+        waiting=asyncio.create_task(hold(controller,release))
+        await settle()
+        assert len(controller._waiters)==2
+
+        cancelled.cancel()
+        await settle()
+        assert len(controller._waiters)==1
+
+        release.set()
+        await asyncio.gather(running,waiting)
+        assert cancelled.cancelled()
+        assert controller.in_flight==0 and not controller._waiters
+
+    run(scenario())
+
+
+def test_admission_ignores_pipelines_that_never_reached_the_provider():
+    async def scenario():
+        controller=admission_controller(limit=4)
+        with pytest.raises(QuotaExceeded):
+            async with controller.admit():
+                raise QuotaExceeded("daily LLM quota exhausted")
+        async with controller.admit():
+            # served without a provider call
+            pass
+        assert controller.limit==4
+        assert controller._baseline is None
+
+    run(scenario())
+
+
+def test_admission_cuts_the_limit_on_provider_failures():
+    async def scenario():
+        controller=admission_controller(limit=4)
+        async with controller.admit():
+            record_provider_call(failed=False)
+        assert controller.limit==4
+
+        async with controller.admit():
+            record_provider_call(failed=True)
+        assert controller.limit==pytest.approx(3.6)
+
+    run(scenario())
+
+
+def test_admission_is_bypassed_by_batch_work():
+    async def scenario():
+        controller=admission_controller(limit=1,max_queue=0)
+        set_llm_priority("batch")
+        async with controller.admit():
+            async with controller.admit():
+                assert controller.in_flight==0
+
+    run(scenario())
@@ -0,0 +1,100 @@
+"""
+Log payload snapshots (secret redaction), per event sampling and the per record encoding of the
+log writer. Records are captured from the writer queue, nothing is written to disk.
+"""
+import asyncio
+import orjson
+import pytest
+from pydantic import BaseModel
+from src.logging import logger as logger_module
+from src.logging.logger import REDACTED,encode_record_safe,global_logger,snapshot
+
+
+class Credentials(BaseModel):
+    username:str
+    password:str
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    records=[]
+
+    def put(record)->bool:
+        records.append(record)
+        return True
+
+    monkeypatch.setattr(global_logger._writer,"put",put)
+    return records
+
+def log(data,level:str="info")->None:
+    asyncio.run(global_logger.log_event(data,level=level))
+
+
+def test_snapshot_redacts_secret_keys_at_any_depth():
+    data={
+        "message":"signup",
+        "password":"hunter2",
+        "user":{"hashed_password":"$2b$...","refresh_token":"abc","username":"alice"},
+        "attempts":[{"access_token":"abc"}],
+        "input_tokens":120,
+        "tokenizer":"cl100k"
+    }
+    assert snapshot(data)=={
+        "message":"signup",
+        "password":REDACTED,
+        "user":{"hashed_password":REDACTED,"refresh_token":REDACTED,"username":"alice"},
+        "attempts":[{"access_token":REDACTED}],
+        # whole words only: usage counters and look-alikes are kept
+        "input_tokens":120,
+        "tokenizer":"cl100k"
+    }
+
+
+def test_snapshot_dumps_models_and_copies_containers():
+    payload={"credentials":Credentials(username="alice",password="hunter2"),"tags":{"a"}}
+    copied=snapshot(payload)
+    assert copied=={"credentials":{"username":"alice","password":REDACTED},"tags":["a"]}
+
+    payload["tags"].add("b")
+    assert copied["tags"]==["a"]
+
+
+def test_log_event_enqueues_a_snapshot(captured):
+    data={"message":"login","access_token":"abc","items":[1]}
+    log(data)
+    data["items"].append(2)
+    _,level,logged=captured[0]
+    assert level=="info"
+    assert logged=={"message":"login","access_token":REDACTED,"items":[1]}
+
+
+def test_sampling_keeps_a_share_of_info_records(captured,monkeypatch):
+    monkeypatch.setattr(global_logger,"sample_rates",{"llm_usage":0.25})
+    draws=iter([0.1,0.3,0.24,0.9])
+    monkeypatch.setattr(logger_module.random,"random",lambda: next(draws))
+
+    for _ in range(4):
+        log({"message":"llm_usage"})
+    assert len(captured)==2
+
+
+def test_sampling_never_drops_warnings_or_other_events(captured,monkeypatch):
+    monkeypatch.setattr(global_logger,"sample_rates",{"llm_usage":0.0})
+    log({"message":"llm_usage"})
+    log({"message":"llm_usage"},level="warning")
+    log({"message":"llm_usage"},level="error")
+    log({"message":"other_event"})
+    log("plain text")
+    assert [level for _,level,_ in captured]==["warning","error","info","info"]
+
+
+def test_unencodable_record_is_replaced_by_a_note():
+    circular={"message":"broken"}
+    circular["self"]=circular
+    line=orjson.loads(encode_record_safe(0.0,"info",circular))
+    assert line["message"]=="log_record_unencodable"
+    assert line["event"]=="broken"
+    assert line["level"]=="INFO"
+
+    line=orjson.loads(encode_record_safe(0.0,"warning",{"message":"ok","error":ValueError("bad")}))
+    assert line=={"timestamp":"1970-01-01T00:00:00","level":"WARNING","message":"ok","error":"ValueError: bad"}
@@ -0,0 +1,113 @@
+"""
+Migration tests against a real Postgres: alembic upgrade / downgrade round trip, and EXPLAIN
+checks that the hot auth and history queries are served by the indexes the migrations create.
+
+Skipped unless TEST_DATABASE_URL points at a disposable database (postgresql+asyncpg://...),
+which is dropped to an empty schema and migrated. The app settings (MAIL_*, JWT_* etc.) must be
+set as for running the app, DATABASE_URL is taken from TEST_DATABASE_URL.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+from datetime import datetime,timezone
+from pathlib import Path
+from uuid import uuid4
+import pytest
+
+TEST_DATABASE_URL=os.environ.get("TEST_DATABASE_URL")
+ROOT=Path(__file__).resolve().parents[1]
+
+pytestmark=pytest.mark.skipif(not TEST_DATABASE_URL,reason="TEST_DATABASE_URL not set")
+
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"]=TEST_DATABASE_URL
+
+
+def alembic(*args:str)->None:
+    subprocess.run(
+        [sys.executable,"-m","alembic",*args],
+        cwd=ROOT,
+        env={**os.environ,"DATABASE_URL":TEST_DATABASE_URL},
+        check=True
+    )
+
+async def _query(sql:str,seqscan:bool=True)->list:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    engine=create_async_engine(TEST_DATABASE_URL)
+    try:
+        async with engine.connect() as conn:
+            if not seqscan:
+                # the test tables are tiny, make the planner show which index it would use
+                await conn.execute(text("SET enable_seqscan = off"))
+            result=await conn.execute(text(sql))
+            rows=[row[0] for row in result] if result.returns_rows else []
+            await conn.commit()
+            return rows
+    finally:
+        await engine.dispose()
+
+def query(sql:str,seqscan:bool=True)->list:
+    return asyncio.run(_query(sql,seqscan))
+
+def explain(statement)->str:
+    from sqlalchemy.dialects import postgresql
+
+    compiled=statement.compile(dialect=postgresql.dialect(),compile_kwargs={"literal_binds":True})
+    return "\n".join(query(f"EXPLAIN {compiled}",seqscan=False))
+
+def tables()->set:
+    return set(query("SELECT tablename FROM pg_tables WHERE schemaname = 'public'"))
+
+
+@pytest.fixture(scope="module")
+def migrated():
+    query("DROP SCHEMA public CASCADE")
+    query("CREATE SCHEMA public")
+    alembic("upgrade","head")
+    yield
+
+
+def test_upgrade_downgrade_round_trip(migrated):
+    assert {"users","dish_analyses","estimation_history","alembic_version"}<=tables()
+
+    alembic("downgrade","0001_baseline")
+    indexes=set(query("SELECT indexname FROM pg_indexes WHERE tablename = 'users'"))
+    assert "ix_users_email_lower" not in indexes
+    assert {"ix_users_email","ix_users_username","uq_username_email"}<=indexes
+
+    alembic("downgrade","base")
+    assert tables()<={"alembic_version"}
+
+    alembic("upgrade","head")
+    assert query("SELECT version_num FROM alembic_version")==["0002_users_unique_indexes"]
+
+
+def test_user_by_email_uses_lower_email_index(migrated):
+    from sqlalchemy import func
+    from sqlmodel import select
+    from src.auth.models import User
+
+    plan=explain(select(User).where(func.lower(User.email)=="Someone@Example.com".lower()))
+    assert "Index Scan" in plan or "Index Only Scan" in plan
+    assert "ix_users_email_lower" in plan
+
+
+def test_user_by_username_uses_unique_index(migrated):
+    from sqlmodel import select
+    from src.auth.models import User
+
+    plan=explain(select(User).where(User.username=="someone"))
+    assert "Index Scan" in plan or "Index Only Scan" in plan
+    assert "uq_users_username" in plan
+
+
+@pytest.mark.parametrize("cursor",[None,(datetime(2026,1,1,tzinfo=timezone.utc),100)])
+def test_history_page_uses_keyset_index(migrated,cursor):
+    from src.estimator.history_service import history_page_statement
+
+    plan=explain(history_page_statement(uuid4(),21,cursor))
+    assert "Index Scan" in plan or "Index Only Scan" in plan
+    assert "ix_estimation_history_user_keyset" in plan
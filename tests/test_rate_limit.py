@@ -0,0 +1,170 @@
+"""
+RateLimitMiddleware on a bare app. The Redis Lua script (SLIDING_WINDOW_SCRIPT) is replaced by
+SlidingWindows, a line by line port of it over in-memory sorted lists, and time by a test clock.
+"""
+import bisect
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.auth.utils import create_access_token
+from src.utils import rate_limit
+from src.utils.rate_limit import RateLimitMiddleware
+
+
+class SlidingWindows:
+    """ In-memory SLIDING_WINDOW_SCRIPT: (admitted, limit, remaining, reset_ms) of the tightest key"""
+
+    def __init__(self):
+        self.windows={}
+
+    async def hit(self,keys,limits,window_ms,now_ms,member):
+        admitted=True
+        tightest,tightest_left=None,0
+        for key,limit in zip(keys,limits):
+            window=self.windows.setdefault(key,[])
+            del window[:bisect.bisect_right(window,now_ms-window_ms)]
+            left=limit-len(window)
+            if left<=0:
+                admitted=False
+            if tightest is None or left<tightest_left:
+                tightest,tightest_left=key,left
+        if admitted:
+            for key in keys:
+                bisect.insort(self.windows[key],now_ms)
+            tightest_left-=1
+        oldest=self.windows[tightest]
+        reset=oldest[0]+window_ms-now_ms if oldest else window_ms
+        return admitted,limits[keys.index(tightest)],max(tightest_left,0),reset
+
+
+class Clock:
+    def __init__(self):
+        self.now=1_000_000.0
+
+    def time(self)->float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(rate_limit,"time",clock)
+    return clock
+
+@pytest.fixture
+def windows(monkeypatch):
+    windows=SlidingWindows()
+    monkeypatch.setattr(rate_limit,"sliding_window_hit",windows.hit)
+    return windows
+
+def make_client(**limits)->TestClient:
+    app=FastAPI()
+
+    @app.get("/api/items/{item_id}")
+    async def item(item_id:int):
+        return {"item_id":item_id}
+
+    @app.get("/api/heavy")
+    async def heavy():
+        return {}
+
+    @app.get("/health")
+    async def health():
+        return {}
+
+    app.add_middleware(RateLimitMiddleware,window_sec=60,**limits)
+    return TestClient(app)
+
+def bearer(user_uid:str)->dict:
+    token=create_access_token(user_data={"user_uid":user_uid,"email":f"{user_uid}@example.com"})
+    return {"Authorization":f"Bearer {token}"}
+
+
+def test_rejects_over_the_ip_limit_with_rate_limit_headers(clock,windows):
+    client=make_client(per_ip=2,per_user=10)
+    first=client.get("/api/items/1")
+    assert first.status_code==200
+    assert first.headers["ratelimit-limit"]=="2"
+    assert first.headers["ratelimit-remaining"]=="1"
+
+    clock.now+=10
+    assert client.get("/api/items/2").status_code==200
+    rejected=client.get("/api/items/3")
+    assert rejected.status_code==429
+    assert rejected.json()["error_code"]=="rate_limited"
+    assert rejected.headers["ratelimit-remaining"]=="0"
+    # the oldest request leaves the window 50 s from now
+    assert rejected.headers["retry-after"]=="50"
+    assert rejected.headers["ratelimit-reset"]=="50"
+
+
+def test_window_slides_one_request_at_a_time(clock,windows):
+    client=make_client(per_ip=2,per_user=10)
+    client.get("/api/items/1")
+    clock.now+=30
+    client.get("/api/items/1")
+    assert client.get("/api/items/1").status_code==429
+
+    # only the first request has left the window
+    clock.now+=31
+    assert client.get("/api/items/1").status_code==200
+    rejected=client.get("/api/items/1")
+    assert rejected.status_code==429
+    assert rejected.headers["retry-after"]=="29"
+
+
+def test_rejected_requests_do_not_count(clock,windows):
+    client=make_client(per_ip=1,per_user=10)
+    client.get("/api/items/1")
+    for _ in range(5):
+        clock.now+=10
+        assert client.get("/api/items/1").status_code==429
+    clock.now+=11
+    assert client.get("/api/items/1").status_code==200
+
+
+def test_windows_are_kept_per_route_template(clock,windows):
+    client=make_client(per_ip=1,per_user=10,endpoint_limits={"GET /api/heavy":3})
+    assert client.get("/api/items/1").status_code==200
+    # another item id is the same route
+    assert client.get("/api/items/2").status_code==429
+    responses=[client.get("/api/heavy") for _ in range(4)]
+    assert [response.status_code for response in responses]==[200,200,200,429]
+    assert set(windows.windows)=={
+        "ratelimit:GET /api/items/{item_id}:ip:testclient",
+        "ratelimit:GET /api/heavy:ip:testclient"
+    }
+
+
+def test_authenticated_requests_also_count_per_user(clock,windows):
+    client=make_client(per_ip=10,per_user=2)
+    alice=bearer("alice")
+    responses=[client.get("/api/items/1",headers=alice) for _ in range(3)]
+    assert [response.status_code for response in responses]==[200,200,429]
+    # the tightest window is reported
+    assert responses[0].headers["ratelimit-limit"]=="2"
+    # the IP window still has room for anonymous requests and other users
+    assert client.get("/api/items/1").status_code==200
+    assert client.get("/api/items/1",headers=bearer("bob")).status_code==200
+
+
+def test_requests_outside_the_prefix_or_routes_are_not_limited(clock,windows):
+    client=make_client(per_ip=1,per_user=1)
+    for _ in range(3):
+        response=client.get("/health")
+        assert response.status_code==200
+        assert "ratelimit-limit" not in response.headers
+        assert client.get("/api/unknown").status_code==404
+    assert windows.windows=={}
+
+
+def test_fails_open_when_redis_is_unavailable(clock,monkeypatch):
+    async def unavailable(*args):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(rate_limit,"sliding_window_hit",unavailable)
+    client=make_client(per_ip=1,per_user=1)
+    for _ in range(3):
+        response=client.get("/api/items/1")
+        assert response.status_code==200
+        assert "ratelimit-limit" not in response.headers
@@ -0,0 +1,144 @@
+"""
+Per worker cache of verified JWT claims (verify_token_cached): one signature check per token
+lifetime, LRU eviction, expiry. A cached token must still be checked against the revocation list
+on every request.
+"""
+import asyncio
+import time
+import pytest
+from starlette.requests import Request
+from src.auth import dependencies
+from src.auth import revocation
+from src.auth import utils
+from src.auth.dependencies import AccessTokenBearer
+from src.auth.revocation import RevocationList
+from src.auth.utils import create_access_token,verify_token_cached
+from src.constants.config import Config
+
+
+class Clock:
+    def __init__(self):
+        self.now=time.time()
+
+    def time(self)->float:
+        return self.now
+
+
+@pytest.fixture
+def verifications(monkeypatch):
+    """ Tokens whose signature was checked, in order"""
+    checked=[]
+    verify_token=utils.verify_token
+
+    def counting_verify_token(token:str):
+        checked.append(token)
+        return verify_token(token)
+
+    monkeypatch.setattr(utils,"verify_token",counting_verify_token)
+    monkeypatch.setattr(utils,"_verified_tokens",utils._verified_tokens.__class__())
+    return checked
+
+def token(user_uid:str="alice")->str:
+    return create_access_token(user_data={"user_uid":user_uid,"email":f"{user_uid}@example.com"})
+
+
+def test_verifies_each_token_once(verifications):
+    alice=token()
+    first=verify_token_cached(alice)
+    assert verify_token_cached(alice)==first
+    assert first["user"]["user_uid"]=="alice"
+    assert verifications==[alice]
+
+
+def test_invalid_tokens_are_not_cached(verifications):
+    forged=token()[:-2]+"xx"
+    assert verify_token_cached(forged) is None
+    assert verify_token_cached(forged) is None
+    assert verifications==[forged,forged]
+    assert len(utils._verified_tokens)==0
+
+
+def test_entries_expire_with_the_token(verifications,monkeypatch):
+    clock=Clock()
+    monkeypatch.setattr(utils,"time",clock)
+    alice=token()
+    claims=verify_token_cached(alice)
+
+    clock.now=claims["exp"]-1
+    verify_token_cached(alice)
+    assert verifications==[alice]
+    # at exp the cached claims are dropped and the signature is checked again
+    clock.now=claims["exp"]
+    verify_token_cached(alice)
+    assert verifications==[alice,alice]
+
+
+def test_least_recently_used_token_is_evicted(verifications,monkeypatch):
+    monkeypatch.setattr(Config,"TOKEN_CACHE_SIZE",2)
+    alice,bob,carol=token("alice"),token("bob"),token("carol")
+    verify_token_cached(alice)
+    verify_token_cached(bob)
+    # alice becomes the most recently used, bob is evicted by carol
+    verify_token_cached(alice)
+    verify_token_cached(carol)
+    assert len(utils._verified_tokens)==2
+
+    verify_token_cached(alice)
+    verify_token_cached(bob)
+    assert verifications==[alice,bob,carol,bob]
+
+
+def bearer_request(access_token:str)->Request:
+    return Request({
+        "type":"http",
+        "method":"GET",
+        "path":"/",
+        "headers":[(b"authorization",f"Bearer {access_token}".encode())]
+    })
+
+@pytest.fixture
+def revoked(monkeypatch):
+    """ A fresh local revocation list, as kept in sync by its listener"""
+    revocation_list=RevocationList(resync_interval=60)
+    revocation_list._synced_at=time.monotonic()
+    monkeypatch.setattr(dependencies,"revocation_list",revocation_list)
+    return revocation_list
+
+def authenticate(access_token:str):
+    return asyncio.run(AccessTokenBearer()(bearer_request(access_token)))
+
+
+def test_revoked_token_is_rejected_although_its_claims_are_cached(verifications,revoked):
+    alice,bob=token("alice"),token("bob")
+    claims=authenticate(alice)
+    assert claims["user"]["user_uid"]=="alice"
+
+    revoked.add(claims["jti"],claims["exp"])
+    # the bearer logs the 403 and resolves to no token data
+    assert authenticate(alice) is None
+    assert authenticate(bob)["user"]["user_uid"]=="bob"
+    # signatures were still checked only once per token
+    assert verifications==[alice,bob]
+
+
+def test_expired_revocations_are_ignored(verifications,revoked):
+    alice=token()
+    claims=authenticate(alice)
+    revoked.add(claims["jti"],time.time()-1)
+    assert authenticate(alice)==claims
+
+
+def test_stale_revocation_list_asks_redis(verifications,revoked,monkeypatch):
+    asked=[]
+
+    async def token_in_blocklist(jti:str)->bool:
+        asked.append(jti)
+        return True
+
+    monkeypatch.setattr(revocation,"token_in_blocklist",token_in_blocklist)
+    alice=token()
+    claims=verify_token_cached(alice)
+    # listener down for more than two resync intervals
+    revoked._synced_at=time.monotonic()-121
+    assert authenticate(alice) is None
+    assert asked==[claims["jti"]]